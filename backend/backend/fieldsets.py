@@ -0,0 +1,256 @@
+"""
+Sparse fieldsets for the read endpoints: ?fields= and ?omit=.
+
+Both take comma separated field names, and dotted paths reach into nested
+serializers, e.g. ?fields=id,title,content_blocks.text_content or
+?omit=author_email,responses.question_text. Serializers using
+SparseFieldsetSerializerMixin drop the fields that were not asked for;
+views using SparseFieldsetViewMixin also defer the columns and skip the
+prefetches and joins that only those fields needed.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+# Marks a field selected or omitted as a whole, as opposed to a subtree of nested fields
+WHOLE = None
+
+
+def parse_fieldset(param):
+    """
+    Parse a ?fields= or ?omit= value into a tree:
+    'id,content_blocks.text_content' -> {'id': WHOLE, 'content_blocks': {'text_content': WHOLE}}.
+    Returns None when the parameter is missing or empty.
+    """
+    if not param:
+        return None
+
+    tree = {}
+    for path in param.split(','):
+        parts = [part.strip() for part in path.split('.')]
+        if not all(parts):
+            continue
+        node = tree
+        for part in parts[:-1]:
+            if part in node and node[part] is WHOLE:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = WHOLE
+    return tree or None
+
+
+def _nested_serializer(field):
+    """The serializer behind a nested field, looking through many=True; None for plain fields"""
+    field = getattr(field, 'child', field)
+    return field if isinstance(field, serializers.BaseSerializer) else None
+
+
+def prune_fields(serializer, fields=None, omit=None, path=''):
+    """
+    Drop the fields of `serializer` that the `fields` and `omit` trees leave
+    out, recursing into nested serializers. Unknown names raise a ValidationError.
+    """
+    declared = serializer.fields
+    for param, tree in (('fields', fields), ('omit', omit)):
+        unknown = [name for name in tree or () if name not in declared]
+        if unknown:
+            raise serializers.ValidationError({
+                param: f'Unknown field(s): {", ".join(path + name for name in unknown)}'
+            })
+        nested = [
+            name for name, subtree in (tree or {}).items()
+            if subtree is not WHOLE and _nested_serializer(declared[name]) is None
+        ]
+        if nested:
+            raise serializers.ValidationError({
+                param: f'Field(s) without nested fields: {", ".join(path + name for name in nested)}'
+            })
+
+    for name in list(declared):
+        if (fields is not None and name not in fields) or (omit and name in omit and omit[name] is WHOLE):
+            declared.pop(name)
+            continue
+
+        nested_fields = fields.get(name) if fields is not None else WHOLE
+        nested_omit = (omit or {}).get(name)
+        if nested_fields is not WHOLE or nested_omit:
+            prune_fields(_nested_serializer(declared[name]), nested_fields, nested_omit, f'{path}{name}.')
+
+
+def fieldset_shape(serializer):
+    """The fields a (pruned) serializer outputs: {name: shape of nested fields or WHOLE}"""
+    shape = {}
+    for name, field in serializer.fields.items():
+        nested = _nested_serializer(field)
+        shape[name] = fieldset_shape(nested) if nested is not None else WHOLE
+    return shape
+
+
+def project(data, shape):
+    """Reduce already serialized data (a dict or a list of dicts) to a fieldset_shape()"""
+    if isinstance(data, list):
+        return [project(item, shape) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        name: value if shape[name] is WHOLE else project(value, shape[name])
+        for name, value in data.items()
+        if name in shape
+    }
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Serializer taking `fields` and `omit` trees (see parse_fieldset) that
+    prune its output. Nested serializers are pruned through the same trees
+    and need no mixin of their own.
+
+    `sparse_field_dependencies` names, per output field, model attributes it
+    reads besides its source, so prune_queryset() keeps them loaded.
+    """
+    sparse_field_dependencies = {}
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None or omit:
+            prune_fields(self, fields, omit)
+
+
+def _sources(serializer):
+    """{model attribute read by the serializer: its nested serializer or None}"""
+    sources = {}
+    dependencies = getattr(serializer, 'sparse_field_dependencies', {})
+    for name, field in serializer.fields.items():
+        for attribute in dependencies.get(name, ()):
+            sources.setdefault(attribute, None)
+        # Method fields and source='*' read the whole instance; they declare dependencies instead.
+        # Primary key relations read the foreign key column, which is never deferred
+        if not field.source_attrs or isinstance(field, serializers.PrimaryKeyRelatedField):
+            continue
+        sources[field.source_attrs[0]] = _nested_serializer(field) or sources.get(field.source_attrs[0])
+    return sources
+
+
+def _plain_column(model, attribute):
+    """Whether `attribute` is a deferrable column of `model` (not the key, not a relation)"""
+    try:
+        field = model._meta.get_field(attribute)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and not field.is_relation and not field.primary_key
+
+
+def _join_paths(select_related, prefix=''):
+    """Flatten a Query.select_related dict into select_related() lookups"""
+    paths = []
+    for name, nested in select_related.items():
+        paths.append(prefix + name)
+        paths.extend(_join_paths(nested, f'{prefix}{name}__'))
+    return paths
+
+
+def prune_queryset(queryset, full, pruned, keep=()):
+    """
+    Defer the columns, and drop the prefetches and select_related joins, that
+    only the fields of `full` missing from `pruned` needed. `full` and
+    `pruned` are serializers of queryset.model; prefetches of pruned nested
+    serializers become Prefetch() querysets pruned the same way. `keep` names
+    attributes read outside the serializer, e.g. the pagination ordering.
+    """
+    model = queryset.model
+    full_sources = _sources(full)
+    needed = _sources(pruned)
+    dropped = {attribute for attribute in full_sources if attribute not in needed and attribute not in keep}
+
+    deferred = [attribute for attribute in dropped if _plain_column(model, attribute)]
+    if deferred:
+        queryset = queryset.defer(*deferred)
+
+    select_related = queryset.query.select_related
+    if isinstance(select_related, dict) and dropped & set(select_related):
+        joins = _join_paths({name: nested for name, nested in select_related.items() if name not in dropped})
+        # select_related() without lookups would follow every foreign key
+        queryset = queryset.select_related(None)
+        if joins:
+            queryset = queryset.select_related(*joins)
+
+    lookups = queryset._prefetch_related_lookups
+    if not lookups:
+        return queryset
+
+    # String lookups grouped by the relation they start from
+    relations, kept_lookups = {}, []
+    for lookup in lookups:
+        if isinstance(lookup, str):
+            relation, _, rest = lookup.partition('__')
+            relations.setdefault(relation, [])
+            if rest:
+                relations[relation].append(rest)
+        else:
+            kept_lookups.append(lookup)
+
+    for relation, rest in relations.items():
+        if relation in dropped:
+            continue
+        if full_sources.get(relation) is not None and needed.get(relation) is not None:
+            related_model = model._meta.get_field(relation).related_model
+            nested = related_model._default_manager.prefetch_related(*rest)
+            kept_lookups.append(Prefetch(
+                relation,
+                queryset=prune_queryset(nested, full_sources[relation], needed[relation])
+            ))
+        else:
+            kept_lookups.append(relation)
+            kept_lookups.extend(f'{relation}__{lookup}' for lookup in rest)
+
+    return queryset.prefetch_related(None).prefetch_related(*kept_lookups)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Generic view mixin applying ?fields= and ?omit= to GET requests: the
+    serializer (when it uses SparseFieldsetSerializerMixin) drops the fields
+    left out, and filter_queryset() prunes the query to match.
+    """
+    # Attributes the view reads from the instances itself, besides the pagination ordering
+    sparse_fieldset_keep = ()
+
+    def get_fieldsets(self):
+        """(fields tree, omit tree) of the request, both None without sparse fieldsets"""
+        if self.request.method != 'GET':
+            return None, None
+        params = self.request.query_params
+        return parse_fieldset(params.get('fields')), parse_fieldset(params.get('omit'))
+
+    def uses_sparse_fieldsets(self):
+        fields, omit = self.get_fieldsets()
+        return (fields is not None or omit is not None) and issubclass(
+            self.get_serializer_class(), SparseFieldsetSerializerMixin
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        if self.uses_sparse_fieldsets():
+            kwargs['fields'], kwargs['omit'] = self.get_fieldsets()
+        return super().get_serializer(*args, **kwargs)
+
+    def get_fieldset_shape(self):
+        """fieldset_shape() of the request's fieldsets, for data serialized without the serializer"""
+        if not self.uses_sparse_fieldsets():
+            return None
+        fields, omit = self.get_fieldsets()
+        return fieldset_shape(self.get_serializer_class()(fields=fields, omit=omit))
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.uses_sparse_fieldsets():
+            return queryset
+
+        fields, omit = self.get_fieldsets()
+        serializer_class = self.get_serializer_class()
+        keep = set(self.sparse_fieldset_keep)
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        keep.update(field.lstrip('-') for field in ordering)
+        return prune_queryset(queryset, serializer_class(), serializer_class(fields=fields, omit=omit), keep)
@@ -96,6 +96,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The default file based cache is shared by the workers of one host; use a database or
+# memcached/redis backend across hosts. check --deploy refuses LocMemCache (self_reflection.E001)
+
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default="django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": config('CACHE_LOCATION', default="/var/tmp/inkodyssey_cache"),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
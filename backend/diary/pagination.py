@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DiaryEntryCursorPagination(CursorPagination):
+    """
+    Keyset pagination of diary entries, newest first.
+    Pages are selected with created_at < cursor over the (author, -created_at)
+    index, so a deep page costs the same as the first and no COUNT(*) is run.
+    The cursor in next/previous is opaque.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
@@ -2,6 +2,18 @@ from rest_framework import serializers
 from .models import DiaryEntry, ContentBlock, DiaryTag
 import base64
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.core.files.storage import default_storage
+
+from backend.fieldsets import SparseFieldsetSerializerMixin
+
+
+def media_file_url(request, name):
+    """URL of a stored media file name, absolute when there is a request; None without a file"""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
 
 
 class DiaryTagSerializer(serializers.ModelSerializer):
@@ -19,6 +31,9 @@ class ContentBlockSerializer(serializers.ModelSerializer):
     # Add a custom field to handle base64 file uploads
     file_data = serializers.CharField(write_only=True, required=False, allow_blank=True, allow_null=True)
     
+    # media_url is replaced by the URL of the stored file when there is one
+    sparse_field_dependencies = {'media_url': ('media_file',)}
+    
     class Meta:
         model = ContentBlock
         fields = (
@@ -52,9 +67,12 @@ class ContentBlockSerializer(serializers.ModelSerializer):
         
         return data
     
-    def create(self, validated_data):
-        """Handle base64 file upload during creation"""
+    @staticmethod
+    def build_block(validated_data, **fields):
+        """Unsaved ContentBlock from validated data, storing a base64 file_data as its media file"""
+        validated_data = {**validated_data, **fields}
         file_data = validated_data.pop('file_data', None)
+        content_block = ContentBlock(**validated_data)
         
         if file_data and file_data.startswith('data:'):
             # Parse base64 data URL
@@ -63,22 +81,25 @@ class ContentBlockSerializer(serializers.ModelSerializer):
             
             # Create file from base64
             data = ContentFile(base64.b64decode(datastr))
-            file_name = f"{validated_data['block_type']}_{validated_data['order']}.{ext}"
+            file_name = f"{validated_data['block_type']}_{validated_data.get('order', 0)}.{ext}"
             
             # Save the file
-            content_block = ContentBlock(**validated_data)
             content_block.media_file.save(file_name, data, save=False)
-            content_block.save()
-            return content_block
         
-        return super().create(validated_data)
+        return content_block
+    
+    def create(self, validated_data):
+        """Handle base64 file upload during creation"""
+        content_block = self.build_block(validated_data)
+        content_block.save()
+        return content_block
     
     def to_representation(self, instance):
         """Customize the output to include the full media URL"""
         representation = super().to_representation(instance)
         
         # If media_file exists, provide the full URL
-        if instance.media_file:
+        if 'media_url' in representation and instance.media_file:
             request = self.context.get('request')
             if request:
                 representation['media_url'] = request.build_absolute_uri(instance.media_file.url)
@@ -88,8 +109,13 @@ class ContentBlockSerializer(serializers.ModelSerializer):
         return representation
 
 
-class DiaryEntrySerializer(serializers.ModelSerializer):
-    """Serializer for DiaryEntry model with nested content blocks"""
+class DiaryEntrySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for DiaryEntry model with nested content blocks.
+    The nested serializers share this serializer's context, so media URLs are
+    absolute whenever a request is passed. Serialize querysets from
+    diary_entry_queryset() to keep the query count independent of their size.
+    """
     
     content_blocks = ContentBlockSerializer(many=True, read_only=True)
     tags = DiaryTagSerializer(many=True, read_only=True)
@@ -110,21 +136,6 @@ class DiaryEntrySerializer(serializers.ModelSerializer):
             'updated_at'
         )
         read_only_fields = ('id', 'author', 'created_at', 'updated_at')
-    
-    def to_representation(self, instance):
-        """Pass context to nested serializers"""
-        representation = super().to_representation(instance)
-        
-        # Re-serialize content_blocks with context to get proper URLs
-        if instance.content_blocks.exists():
-            content_blocks_serializer = ContentBlockSerializer(
-                instance.content_blocks.all(),
-                many=True,
-                context=self.context
-            )
-            representation['content_blocks'] = content_blocks_serializer.data
-        
-        return representation
 
 
 class DiaryEntryCreateSerializer(serializers.ModelSerializer):
@@ -160,11 +171,21 @@ class DiaryEntryCreateSerializer(serializers.ModelSerializer):
     def _get_or_create_tags(self, user, tag_names):
         normalized_names = [name.strip() for name in tag_names if name and name.strip()]
         unique_names = list(dict.fromkeys(normalized_names))
-        result = []
-        for name in unique_names:
-            tag, _ = DiaryTag.objects.get_or_create(author=user, name=name)
-            result.append(tag)
-        return result
+        if not unique_names:
+            return []
+        # Names taken by the user, or by a concurrent request, hit the unique constraint and are skipped
+        DiaryTag.objects.bulk_create(
+            [DiaryTag(author=user, name=name) for name in unique_names],
+            ignore_conflicts=True
+        )
+        return list(DiaryTag.objects.filter(author=user, name__in=unique_names))
+    
+    def _create_blocks(self, diary_entry, content_blocks_data):
+        """Insert all content blocks of an entry with one statement"""
+        ContentBlock.objects.bulk_create([
+            ContentBlockSerializer.build_block(block_data, diary_entry=diary_entry)
+            for block_data in content_blocks_data
+        ])
 
     def _get_tags_from_ids(self, user, tag_ids):
         tags = list(DiaryTag.objects.filter(author=user, id__in=tag_ids))
@@ -172,6 +193,7 @@ class DiaryEntryCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'tag_ids': 'One or more tag IDs are invalid for this user.'})
         return tags
     
+    @transaction.atomic
     def create(self, validated_data):
         """Create diary entry with content blocks"""
         content_blocks_data = validated_data.pop('content_blocks', [])
@@ -187,19 +209,14 @@ class DiaryEntryCreateSerializer(serializers.ModelSerializer):
         if tag_names:
             selected_tags.extend(self._get_or_create_tags(diary_entry.author, tag_names))
         if selected_tags:
-            diary_entry.tags.set(list({tag.id: tag for tag in selected_tags}.values()))
+            diary_entry.tags.add(*{tag.id: tag for tag in selected_tags}.values())
         
-        # Create content blocks using the ContentBlockSerializer
-        for block_data in content_blocks_data:
-            block_serializer = ContentBlockSerializer(
-                data=block_data,
-                context=self.context
-            )
-            if block_serializer.is_valid():
-                block_serializer.save(diary_entry=diary_entry)
+        # Content blocks were validated with the entry
+        self._create_blocks(diary_entry, content_blocks_data)
         
         return diary_entry
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update diary entry and optionally update content blocks"""
         content_blocks_data = validated_data.pop('content_blocks', None)
@@ -219,13 +236,7 @@ class DiaryEntryCreateSerializer(serializers.ModelSerializer):
             instance.content_blocks.all().delete()
             
             # Create new content blocks
-            for block_data in content_blocks_data:
-                block_serializer = ContentBlockSerializer(
-                    data=block_data,
-                    context=self.context
-                )
-                if block_serializer.is_valid():
-                    block_serializer.save(diary_entry=instance)
+            self._create_blocks(instance, content_blocks_data)
 
         if tag_ids is not None or tag_names is not None:
             selected_tags = []
@@ -239,15 +250,18 @@ class DiaryEntryCreateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DiaryEntryListSerializer(serializers.ModelSerializer):
-    """Simplified serializer for listing diary entries"""
+class DiaryEntryListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Summary of a diary entry for list screens. Block counts, snippet and
+    first image come from the annotations of summary_entry_queryset().
+    """
     
     author_email = serializers.EmailField(source='author.email', read_only=True)
     author_name = serializers.CharField(source='author.get_full_name', read_only=True)
-    content_blocks_count = serializers.IntegerField(
-        source='content_blocks.count',
-        read_only=True
-    )
+    content_blocks_count = serializers.SerializerMethodField()
+    block_counts = serializers.SerializerMethodField()
+    snippet = serializers.CharField(read_only=True)
+    first_image_url = serializers.SerializerMethodField()
     tags = DiaryTagSerializer(many=True, read_only=True)
     
     class Meta:
@@ -258,8 +272,27 @@ class DiaryEntryListSerializer(serializers.ModelSerializer):
             'author_email',
             'author_name',
             'content_blocks_count',
+            'block_counts',
+            'snippet',
+            'first_image_url',
             'tags',
             'created_at',
             'updated_at'
         )
         read_only_fields = fields
+    
+    def get_content_blocks_count(self, instance):
+        return instance.text_blocks + instance.image_blocks + instance.video_blocks
+    
+    def get_block_counts(self, instance):
+        return {
+            'text': instance.text_blocks,
+            'image': instance.image_blocks,
+            'video': instance.video_blocks,
+        }
+    
+    def get_first_image_url(self, instance):
+        return (
+            media_file_url(self.context.get('request'), instance.first_image_file)
+            or instance.first_image_url
+        )
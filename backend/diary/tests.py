@@ -1,3 +1,269 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import ContentBlock, DiaryEntry, DiaryTag
+
+
+class DiaryEntryQueryCountTests(TestCase):
+    """Reading diary entries must not issue queries per entry"""
+
+    # Entries, their content blocks and their tags
+    LIST_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='writer@example.com', password='secret', first_name='Ink', last_name='Writer'
+        )
+        cls.tag = DiaryTag.objects.create(author=cls.user, name='travel')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_entries(self, count):
+        for index in range(count):
+            entry = DiaryEntry.objects.create(author=self.user, title=f'Entry {index}')
+            entry.tags.add(self.tag)
+            ContentBlock.objects.create(diary_entry=entry, block_type='text', text_content='Text', order=0)
+            ContentBlock.objects.create(
+                diary_entry=entry, block_type='image', media_file='diary_media/photo.png', order=1
+            )
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        self.create_entries(2)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/api/diary/entries/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_entries(8)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/api/diary/entries/')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_list_serializes_blocks_tags_and_author(self):
+        self.create_entries(1)
+        entry = self.client.get('/api/diary/entries/').data['results'][0]
+
+        self.assertEqual(entry['author_email'], 'writer@example.com')
+        self.assertEqual(entry['author_name'], 'Ink Writer')
+        self.assertEqual([tag['name'] for tag in entry['tags']], ['travel'])
+        self.assertEqual([block['block_type'] for block in entry['content_blocks']], ['text', 'image'])
+
+    def test_media_urls_are_absolute(self):
+        self.create_entries(1)
+        entry = self.client.get('/api/diary/entries/').data['results'][0]
+        self.assertEqual(
+            entry['content_blocks'][1]['media_url'], 'http://testserver/media/diary_media/photo.png'
+        )
+
+        date = timezone.localdate(DiaryEntry.objects.get().created_at)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/diary/entries/by-date/?date={date.isoformat()}')
+        self.assertEqual(
+            response.data[0]['content_blocks'][1]['media_url'], 'http://testserver/media/diary_media/photo.png'
+        )
+
+    def test_cursor_pages_cover_every_entry_once(self):
+        created_at = timezone.now()
+        for index in range(7):
+            # Shared timestamps exercise the cursor's tie breaking
+            DiaryEntry.objects.create(author=self.user, title=f'Entry {index}', created_at=created_at)
+        DiaryEntry.objects.create(author=self.user, title='Older', created_at=created_at - timedelta(days=1))
+
+        seen, url = [], '/api/diary/entries/?page_size=3'
+        while url:
+            with self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            seen.extend(entry['id'] for entry in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 8)
+        self.assertEqual(set(seen), set(DiaryEntry.objects.values_list('id', flat=True)))
+        self.assertEqual(DiaryEntry.objects.get(id=seen[-1]).title, 'Older')
+
+    def test_summary_view_reads_annotations_only(self):
+        self.create_entries(3)
+        entry = DiaryEntry.objects.first()
+        ContentBlock.objects.filter(diary_entry=entry, block_type='text').update(text_content='x' * 500)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/diary/entries/?view=summary')
+        summaries = {summary['id']: summary for summary in response.data['results']}
+        self.assertEqual(len(summaries), 3)
+
+        summary = summaries[entry.id]
+        self.assertEqual(summary['block_counts'], {'text': 1, 'image': 1, 'video': 0})
+        self.assertEqual(summary['content_blocks_count'], 2)
+        self.assertEqual(summary['snippet'], 'x' * 200)
+        self.assertEqual(summary['first_image_url'], 'http://testserver/media/diary_media/photo.png')
+        self.assertEqual([tag['name'] for tag in summary['tags']], ['travel'])
+        self.assertNotIn('content_blocks', summary)
+
+    def test_sparse_fieldsets_prune_output_and_queries(self):
+        self.create_entries(3)
+
+        # Entries and content blocks only: no author join, no tags prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/diary/entries/?fields=id,title,content_blocks.text_content')
+        self.assertEqual(
+            response.data['results'][0]['content_blocks'], [{'text_content': 'Text'}, {'text_content': None}]
+        )
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'content_blocks'})
+
+        response = self.client.get('/api/diary/entries/?omit=author_email,author_name,content_blocks.caption')
+        entry = response.data['results'][0]
+        self.assertNotIn('author_email', entry)
+        self.assertNotIn('caption', entry['content_blocks'][0])
+        self.assertEqual(entry['content_blocks'][1]['media_url'], 'http://testserver/media/diary_media/photo.png')
+
+        response = self.client.get('/api/diary/entries/?fields=unknown')
+        self.assertEqual(response.status_code, 400)
+
+
+class DiaryEntryCreateTests(TestCase):
+    """Entries are created atomically with batched block and tag inserts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='writer@example.com', password='secret', first_name='Ink', last_name='Writer'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_batches_blocks_and_tags(self):
+        DiaryTag.objects.create(author=self.user, name='travel')
+        payload = {
+            'title': 'Trip',
+            'content_blocks': [
+                {'block_type': 'text', 'order': index, 'text_content': f'Block {index}'} for index in range(30)
+            ],
+            'tags': ['travel', 'beach', 'family', 'food', 'sun', 'sea'],
+        }
+
+        # Savepoint pair, entry, tag insert and re-select, tagging (2), blocks, and the response (2)
+        with self.assertNumQueries(10):
+            response = self.client.post('/api/diary/entries/', payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        entry = DiaryEntry.objects.get(id=response.data['id'])
+        self.assertEqual(list(entry.content_blocks.values_list('order', flat=True)), list(range(30)))
+        self.assertEqual(
+            sorted(entry.tags.values_list('name', flat=True)), ['beach', 'family', 'food', 'sea', 'sun', 'travel']
+        )
+        self.assertEqual(DiaryTag.objects.filter(author=self.user).count(), 6)
+
+    def test_failed_create_leaves_nothing_behind(self):
+        payload = {
+            'title': 'Broken',
+            'content_blocks': [{'block_type': 'text', 'order': 0, 'text_content': 'Text'}],
+            'tags': ['new'],
+            'tag_ids': [999],
+        }
+        response = self.client.post('/api/diary/entries/', payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DiaryEntry.objects.exists())
+        self.assertFalse(ContentBlock.objects.exists())
+        self.assertFalse(DiaryTag.objects.exists())
+
+
+class DiaryCalendarTests(TestCase):
+    """The calendar summarizes a month of local days in one query"""
+
+    URL = '/api/diary/calendar/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='writer@example.com', password='secret', first_name='Ink', last_name='Writer'
+        )
+        travel = DiaryTag.objects.create(author=cls.user, name='travel')
+        food = DiaryTag.objects.create(author=cls.user, name='food')
+
+        morning = cls.entry('Morning', datetime(2025, 3, 1, 9), travel, food)
+        ContentBlock.objects.create(
+            diary_entry=morning, block_type='image', media_url='data:image/png;base64,AAAA', order=0
+        )
+        ContentBlock.objects.create(diary_entry=morning, block_type='image', media_file='diary_media/a.png', order=1)
+        evening = cls.entry('Evening', datetime(2025, 3, 1, 20), travel)
+        ContentBlock.objects.create(
+            diary_entry=evening, block_type='image', media_url='https://example.com/b.jpg', order=0
+        )
+        cls.entry('Late', datetime(2025, 3, 31, 23, 30))
+        # Local days just outside March
+        cls.entry('February', datetime(2025, 2, 28, 23, 59))
+        cls.entry('April', datetime(2025, 4, 1, 0, 30))
+
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret')
+        DiaryEntry.objects.create(author=other, title='Not mine', created_at=timezone.make_aware(datetime(2025, 3, 5)))
+
+    @classmethod
+    def entry(cls, title, local_time, *tags):
+        entry = DiaryEntry.objects.create(author=cls.user, title=title, created_at=timezone.make_aware(local_time))
+        entry.tags.add(*tags)
+        return entry
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def per_entry_days(self, year, month):
+        """The calendar data the page used to build by grouping the full entries"""
+        entries, url = [], '/api/diary/entries/'
+        while url:
+            response = self.client.get(url)
+            entries.extend(response.data['results'])
+            url = response.data['next']
+
+        days = {}
+        for entry in sorted(entries, key=lambda entry: (entry['created_at'], entry['id'])):
+            day = timezone.localdate(datetime.fromisoformat(entry['created_at']))
+            if (day.year, day.month) != (year, month):
+                continue
+            summary = days.setdefault(day.isoformat(), {'count': 0, 'titles': [], 'tag_ids': [], 'thumbnail': None})
+            summary['count'] += 1
+            summary['titles'].append(entry['title'])
+            summary['tag_ids'] = sorted({*summary['tag_ids'], *(tag['id'] for tag in entry['tags'])})
+            images = [
+                block['media_url'] for block in entry['content_blocks']
+                if block['block_type'] == 'image' and block['media_url'] and not block['media_url'].startswith('data:')
+            ]
+            if summary['thumbnail'] is None and images:
+                summary['thumbnail'] = images[0]
+        return days
+
+    def test_one_query_per_month(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL, {'year': 2025, 'month': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['days']), ['2025-03-01', '2025-03-31'])
+        self.assertEqual(response.data['days']['2025-03-01']['thumbnail'], 'http://testserver/media/diary_media/a.png')
+
+    def test_matches_the_per_entry_calendar(self):
+        for year, month in ((2025, 2), (2025, 3), (2025, 4), (2025, 5)):
+            with self.subTest(month=month):
+                days = self.client.get(self.URL, {'year': year, 'month': month}).data['days']
+                days = {day: {**summary, 'tag_ids': sorted(summary['tag_ids'])} for day, summary in days.items()}
+                self.assertEqual(days, self.per_entry_days(year, month))
+
+    def test_months_at_the_edges_of_the_calendar(self):
+        # Local months east and west of UTC reach past the first and last UTC moments
+        for time_zone in ('Asia/Kolkata', 'America/New_York'):
+            for year, month in ((9999, 12), (1, 1)):
+                with self.subTest(time_zone=time_zone, year=year, month=month), self.settings(TIME_ZONE=time_zone):
+                    response = self.client.get(self.URL, {'year': year, 'month': month})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.data['days'], {})
 
-# Create your tests here.
+        for params in ({'year': 2025, 'month': 13}, {'year': 10000, 'month': 1}, {'year': 2025}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.URL, params).status_code, 400)
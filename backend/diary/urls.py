@@ -6,6 +6,7 @@ from .views import (
     ContentBlockDetailView,
     DiaryEntryByDateView,
     DiaryStatsView,
+    DiaryCalendarView,
     DiaryTagListCreateView,
 )
 
@@ -22,6 +23,9 @@ urlpatterns = [
     # Statistics endpoint
     path('stats/', DiaryStatsView.as_view(), name='diary-stats'),
 
+    # Calendar endpoint
+    path('calendar/', DiaryCalendarView.as_view(), name='diary-calendar'),
+
     # Tag endpoints
     path('tags/', DiaryTagListCreateView.as_view(), name='diary-tag-list-create'),
 ]
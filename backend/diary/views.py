@@ -2,41 +2,112 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Substr, TruncDate
+from django.utils import timezone
+from calendar import monthrange
+from datetime import date, datetime, time, timezone as dt_timezone
+from backend.fieldsets import SparseFieldsetViewMixin
+
 from .models import DiaryEntry, ContentBlock, DiaryTag
+from .pagination import DiaryEntryCursorPagination
 from .serializers import (
     DiaryEntrySerializer,
     DiaryEntryCreateSerializer,
     DiaryEntryListSerializer,
     ContentBlockSerializer,
     DiaryTagSerializer,
+    media_file_url,
 )
 
+# Characters of the first text block sent as the snippet of an entry summary
+SNIPPET_LENGTH = 200
+
+
+def diary_entry_queryset(user):
+    """Diary entries of a user with everything DiaryEntrySerializer reads loaded up front"""
+    return DiaryEntry.objects.filter(
+        author=user
+    ).select_related('author').prefetch_related('content_blocks', 'tags')
+
+
+def first_image_blocks():
+    """Image blocks of the entry in OuterRef('pk') with a file or a real URL, first one first"""
+    # Inline base64 data is never worth sending to a list or calendar
+    return ContentBlock.objects.filter(
+        Q(media_file__gt='') | (Q(media_url__gt='') & ~Q(media_url__startswith='data:')),
+        diary_entry=OuterRef('pk'),
+        block_type='image',
+    ).order_by('order', 'created_at')
+
+
+def in_utc(moment, limit):
+    """An aware datetime in UTC, or the naive `limit` in UTC past the end of the calendar"""
+    try:
+        return moment.astimezone(dt_timezone.utc)
+    except OverflowError:
+        return limit.replace(tzinfo=dt_timezone.utc)
+
+
+def summary_entry_queryset(user):
+    """
+    Diary entries of a user annotated with what DiaryEntryListSerializer
+    reads: block counts by type, a text snippet and the first image, all
+    computed by the database so no block body is loaded.
+    """
+    texts = ContentBlock.objects.filter(
+        diary_entry=OuterRef('pk'),
+        block_type='text',
+    ).order_by('order', 'created_at')
+    images = first_image_blocks()
+    
+    return DiaryEntry.objects.filter(
+        author=user
+    ).select_related('author').prefetch_related('tags').annotate(
+        text_blocks=Count('content_blocks', filter=Q(content_blocks__block_type='text')),
+        image_blocks=Count('content_blocks', filter=Q(content_blocks__block_type='image')),
+        video_blocks=Count('content_blocks', filter=Q(content_blocks__block_type='video')),
+        snippet=Subquery(texts.values(text=Substr('text_content', 1, SNIPPET_LENGTH))[:1]),
+        first_image_file=Subquery(images.values('media_file')[:1]),
+        first_image_url=Subquery(images.values('media_url')[:1]),
+    )
+
 
-class DiaryEntryListCreateView(generics.ListCreateAPIView):
+class DiaryEntryListCreateView(SparseFieldsetViewMixin, generics.ListCreateAPIView):
     """
     API endpoint for listing and creating diary entries.
-    GET /api/diary/entries/ - List all diary entries for authenticated user
+    GET /api/diary/entries/ - List all diary entries for authenticated user, newest first
+    GET /api/diary/entries/?view=summary - List entry summaries without block contents
     POST /api/diary/entries/ - Create a new diary entry
+    
+    The list is cursor paginated: follow 'next' for older entries. GET
+    requests take ?fields= and ?omit= (see backend.fieldsets).
     """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DiaryEntryCursorPagination
+    
+    def is_summary(self):
+        return self.request.method == 'GET' and self.request.query_params.get('view') == 'summary'
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return DiaryEntryCreateSerializer
+        if self.is_summary():
+            return DiaryEntryListSerializer
         return DiaryEntrySerializer  # Changed to include content_blocks
     
     def get_queryset(self):
         """Return diary entries for the authenticated user only"""
-        return DiaryEntry.objects.filter(
-            author=self.request.user
-        ).prefetch_related('content_blocks', 'tags')
+        if self.is_summary():
+            return summary_entry_queryset(self.request.user)
+        return diary_entry_queryset(self.request.user)
     
     def perform_create(self, serializer):
         """Set the author to the current user when creating"""
         serializer.save(author=self.request.user)
 
 
-class DiaryEntryDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DiaryEntryDetailView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     API endpoint for retrieving, updating, and deleting a diary entry.
     GET /api/diary/entries/<id>/ - Retrieve a diary entry
@@ -52,9 +123,7 @@ class DiaryEntryDetailView(generics.RetrieveUpdateDestroyAPIView):
     
     def get_queryset(self):
         """Return diary entries for the authenticated user only"""
-        return DiaryEntry.objects.filter(
-            author=self.request.user
-        ).prefetch_related('content_blocks', 'tags')
+        return diary_entry_queryset(self.request.user)
 
 
 class ContentBlockListCreateView(generics.ListCreateAPIView):
@@ -104,13 +173,17 @@ class ContentBlockDetailView(generics.RetrieveUpdateDestroyAPIView):
         )
 
 
-class DiaryEntryByDateView(APIView):
+class DiaryEntryByDateView(SparseFieldsetViewMixin, generics.GenericAPIView):
     """
     API endpoint for retrieving diary entries by date.
     GET /api/diary/entries/by-date/?date=YYYY-MM-DD
     """
+    serializer_class = DiaryEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_queryset(self):
+        return diary_entry_queryset(self.request.user)
+    
     def get(self, request):
         date_str = request.query_params.get('date')
         if not date_str:
@@ -128,12 +201,9 @@ class DiaryEntryByDateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        entries = DiaryEntry.objects.filter(
-            author=request.user,
-            created_at__date=date
-        ).prefetch_related('content_blocks', 'tags')
+        entries = self.filter_queryset(self.get_queryset()).filter(created_at__date=date)
         
-        serializer = DiaryEntrySerializer(entries, many=True)
+        serializer = self.get_serializer(entries, many=True)
         return Response(serializer.data)
 
 
@@ -187,6 +257,71 @@ class DiaryStatsView(APIView):
         })
 
 
+class DiaryCalendarView(APIView):
+    """
+    API endpoint for the calendar overview of one month.
+    GET /api/diary/calendar/?year=YYYY&month=M
+    
+    Returns the entry count, titles, tag ids and first image thumbnail of
+    every day with entries, keyed by local date, without the entry bodies.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            year = int(request.query_params.get('year'))
+            month = int(request.query_params.get('month'))
+            start = in_utc(timezone.make_aware(datetime(year, month, 1)), datetime.min)
+            # The last moment of the month, which unlike the next month's start exists for 9999-12
+            end = in_utc(timezone.make_aware(datetime.combine(
+                date(year, month, monthrange(year, month)[1]), time.max
+            )), datetime.max)
+        except (TypeError, ValueError, OverflowError):
+            return Response(
+                {'error': 'year and month parameters are required (e.g. year=2025&month=1)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        images = first_image_blocks()
+        
+        # One row per (entry, tag), in creation order
+        rows = DiaryEntry.objects.filter(
+            author=request.user,
+            created_at__gte=start,
+            created_at__lte=end
+        ).annotate(
+            day=TruncDate('created_at'),
+            image_file=Subquery(images.values('media_file')[:1]),
+            image_url=Subquery(images.values('media_url')[:1]),
+        ).order_by('created_at', 'id').values_list(
+            'id', 'day', 'title', 'tags__id', 'image_file', 'image_url'
+        )
+        
+        days = {}
+        seen_entries = set()
+        for entry_id, day, title, tag_id, image_file, image_url in rows:
+            summary = days.setdefault(day.isoformat(), {
+                'count': 0,
+                'titles': [],
+                'tag_ids': [],
+                'thumbnail': None,
+            })
+            if entry_id not in seen_entries:
+                seen_entries.add(entry_id)
+                summary['count'] += 1
+                summary['titles'].append(title)
+                if summary['thumbnail'] is None:
+                    summary['thumbnail'] = media_file_url(request, image_file) or image_url
+            if tag_id is not None and tag_id not in summary['tag_ids']:
+                summary['tag_ids'].append(tag_id)
+        
+        return Response({
+            'year': year,
+            'month': month,
+            'days': days
+        })
+
+
 class DiaryTagListCreateView(generics.ListCreateAPIView):
     """
     API endpoint for listing and creating diary tags.
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReflectionQuestion, SelfReflection, ReflectionResponse
+from .models import ReflectionQuestion, SelfReflection, ReflectionResponse, ReflectionStreak, ReflectionRollup
 
 
 @admin.register(ReflectionQuestion)
@@ -14,10 +14,10 @@ class ReflectionQuestionAdmin(admin.ModelAdmin):
 class ReflectionResponseInline(admin.TabularInline):
     model = ReflectionResponse
     extra = 0
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['choice_response', 'created_at', 'updated_at']
     
     def get_fields(self, request, obj=None):
-        fields = ['question', 'range_response', 'choice_response', 'text_response']
+        fields = ['question', 'range_response', 'choice_code', 'choice_response', 'text_response']
         if obj:
             fields.extend(['created_at', 'updated_at'])
         return fields
@@ -64,3 +64,21 @@ class ReflectionResponseAdmin(admin.ModelAdmin):
             'daily_reflection__user', 
             'question'
         )
+
+
+@admin.register(ReflectionStreak)
+class ReflectionStreakAdmin(admin.ModelAdmin):
+    list_display = ['user', 'current_streak', 'longest_streak', 'last_reflection_date', 'updated_at']
+    search_fields = ['user__email']
+    readonly_fields = ['current_streak', 'longest_streak', 'last_reflection_date', 'updated_at']
+
+
+@admin.register(ReflectionRollup)
+class ReflectionRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'question', 'granularity', 'period_start', 'count', 'total']
+    list_filter = ['granularity']
+    search_fields = ['user__email', 'question__question_text']
+    ordering = ['-period_start']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'question')
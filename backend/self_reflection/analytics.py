@@ -0,0 +1,471 @@
+"""
+Vectorized statistics for range and number questions.
+
+A user's answers are loaded into a dense days x questions NumPy matrix where
+missing answers are NaN, and every metric is computed for all questions at
+once with NaN-aware array operations. Diary tags join the same matrix as a
+days x tags boolean array.
+"""
+from itertools import combinations_with_replacement
+
+import numpy as np
+from django.db.models.functions import TruncDate
+
+from diary.models import DiaryEntry
+
+from .models import ReflectionResponse
+
+NUMERIC_TYPES = ('range', 'number')
+
+METRICS = ('median', 'percentiles', 'std', 'rolling_average', 'trend')
+
+PERCENTILES = (10, 25, 75, 90)
+
+ROLLING_WINDOW = 7
+
+
+class ResponseMatrix:
+    """Answers of numeric questions as a (days x questions) array with NaN for missing days"""
+
+    def __init__(self, start_date, question_ids, values):
+        self.start_date = start_date
+        self.question_ids = list(question_ids)
+        self.values = values
+
+    @property
+    def mask(self):
+        """True where an answer exists"""
+        return ~np.isnan(self.values)
+
+    @classmethod
+    def empty(cls, start_date, end_date, question_ids):
+        days = (end_date - start_date).days + 1
+        return cls(start_date, question_ids, np.full((max(days, 0), len(question_ids)), np.nan))
+
+    def fill(self, question_ids, dates, values):
+        """Write parallel sequences of answers into the matrix, ignoring out-of-window days"""
+        columns = {question_id: index for index, question_id in enumerate(self.question_ids)}
+        rows = np.fromiter(((date - self.start_date).days for date in dates), dtype=np.int64, count=len(dates))
+        cols = np.fromiter((columns[q] for q in question_ids), dtype=np.int64, count=len(question_ids))
+        data = np.asarray(values, dtype=np.float64)
+        inside = (rows >= 0) & (rows < self.values.shape[0])
+        self.values[rows[inside], cols[inside]] = data[inside]
+        return self
+
+
+def numeric_questions(questions):
+    """The questions a ResponseMatrix can hold"""
+    return [question for question in questions if question.question_type in NUMERIC_TYPES]
+
+
+def load_response_matrix(user, questions, start_date, end_date):
+    """Fetch the numeric answers of `user` in the window with one query"""
+    questions = numeric_questions(questions)
+    matrix = ResponseMatrix.empty(start_date, end_date, [q.id for q in questions])
+    if not questions:
+        return matrix
+
+    rows = list(ReflectionResponse.objects.filter(
+        daily_reflection__user=user,
+        daily_reflection__date__range=(start_date, end_date),
+        question_id__in=matrix.question_ids,
+    ).values_list('question_id', 'daily_reflection__date', 'range_response', 'number_response'))
+
+    types = {question.id: question.question_type for question in questions}
+    answered = [
+        (question_id, date, range_value if types[question_id] == 'range' else number_value)
+        for question_id, date, range_value, number_value in rows
+    ]
+    answered = [row for row in answered if row[2] is not None]
+    if answered:
+        question_ids, dates, values = zip(*answered)
+        matrix.fill(question_ids, dates, values)
+    return matrix
+
+
+def matrix_from_answers(questions, answers, start_date, end_date):
+    """
+    Build a ResponseMatrix from already fetched answers
+    (question_id -> {date: (range, choice, number)}) without touching the database.
+    """
+    questions = numeric_questions(questions)
+    matrix = ResponseMatrix.empty(start_date, end_date, [q.id for q in questions])
+    question_ids, dates, values = [], [], []
+    for question in questions:
+        column = 0 if question.question_type == 'range' else 2
+        for date, answer in answers.get(question.id, {}).items():
+            if answer[column] is not None:
+                question_ids.append(question.id)
+                dates.append(date)
+                values.append(answer[column])
+    if values:
+        matrix.fill(question_ids, dates, values)
+    return matrix
+
+
+def parse_metrics(param):
+    """Parse a comma separated ?metrics= value; 'all' selects every metric"""
+    if not param:
+        return []
+    requested = [name.strip() for name in param.split(',') if name.strip()]
+    if 'all' in requested:
+        return list(METRICS)
+    unknown = [name for name in requested if name not in METRICS]
+    if unknown:
+        raise ValueError(f'Unknown metrics: {", ".join(unknown)}. Choose from: {", ".join(METRICS)}, all')
+    return list(dict.fromkeys(requested))
+
+
+def _to_list(array, digits=2):
+    """Round an array and turn NaN into None for JSON output"""
+    rounded = np.round(array, digits)
+    return [None if np.isnan(value) else float(value) for value in rounded]
+
+
+def rolling_average(values, window=ROLLING_WINDOW):
+    """Trailing mean over `window` days per column, skipping missing days"""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis=0)
+    counts = np.cumsum(present, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def trend_slope(values):
+    """Least-squares slope (change per day) of every column over its answered days"""
+    present = ~np.isnan(values)
+    x = np.arange(values.shape[0], dtype=np.float64)[:, None]
+    n = present.sum(axis=0)
+    y = np.where(present, values, 0.0)
+    xs = np.where(present, x, 0.0)
+    sum_x, sum_y = xs.sum(axis=0), y.sum(axis=0)
+    denominator = n * (xs * xs).sum(axis=0) - sum_x * sum_x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * (xs * y).sum(axis=0) - sum_x * sum_y) / denominator
+    return np.where((n >= 2) & (denominator != 0), slope, np.nan)
+
+
+def compute_metrics(matrix, metrics):
+    """
+    Compute the requested metrics for every question of the matrix at once.
+
+    Returns a dict: question_id -> {metric name: value}
+    """
+    values = matrix.values
+    result = {question_id: {} for question_id in matrix.question_ids}
+    if not metrics or not values.size:
+        return result
+
+    answered = (~np.isnan(values)).any(axis=0)
+    # Columns without any answer would only produce all-NaN warnings
+    safe = np.where(answered[None, :], values, 0.0)
+
+    def per_question(name, column_values):
+        for question_id, value in zip(matrix.question_ids, column_values):
+            result[question_id][name] = value
+
+    if 'median' in metrics:
+        medians = np.where(answered, np.nanmedian(safe, axis=0), np.nan)
+        per_question('median', _to_list(medians))
+
+    if 'percentiles' in metrics:
+        table = np.where(answered, np.nanpercentile(safe, PERCENTILES, axis=0), np.nan)
+        columns = [_to_list(row) for row in table]
+        per_question('percentiles', [
+            {f'p{p}': columns[index][column] for index, p in enumerate(PERCENTILES)}
+            for column in range(len(matrix.question_ids))
+        ])
+
+    if 'std' in metrics:
+        deviations = np.where(answered, np.nanstd(safe, axis=0), np.nan)
+        per_question('std', _to_list(deviations))
+
+    if 'rolling_average' in metrics:
+        averages = rolling_average(values)
+        per_question('rolling_average', [
+            {'window': ROLLING_WINDOW, 'values': _to_list(averages[:, column])}
+            for column in range(len(matrix.question_ids))
+        ])
+
+    if 'trend' in metrics:
+        per_question('trend', [
+            {'slope_per_day': slope} for slope in _to_list(trend_slope(values), digits=4)
+        ])
+
+    return result
+
+
+# Pairs answered together on fewer days than this get no correlation
+MIN_CORRELATION_SAMPLES = 3
+
+
+def pairwise_pearson(x, y):
+    """
+    Pearson correlation between every column of `x` and every column of `y`
+    (both days x questions, NaN for missing), each pair over the days where
+    both are answered. Returns (correlations, sample sizes).
+    """
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    fx, fy = mx.astype(np.float64), my.astype(np.float64)
+
+    n = fx.T @ fy
+    sum_x = x0.T @ fy
+    sum_y = fx.T @ y0
+    sum_xx = (x0 * x0).T @ fy
+    sum_yy = fx.T @ (y0 * y0)
+    sum_xy = x0.T @ y0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_xy - sum_x * sum_y / n
+        variance_x = sum_xx - sum_x * sum_x / n
+        variance_y = sum_yy - sum_y * sum_y / n
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+
+    valid = (n >= MIN_CORRELATION_SAMPLES) & (variance_x > 1e-12) & (variance_y > 1e-12)
+    return np.where(valid, np.clip(correlation, -1.0, 1.0), np.nan), n.astype(np.int64)
+
+
+def column_ranks(values):
+    """Average ranks (ties share their mean rank) of every column, NaN kept in place"""
+    ranks = np.full(values.shape, np.nan)
+    for column in range(values.shape[1]):
+        present = ~np.isnan(values[:, column])
+        if not present.any():
+            continue
+        unique, inverse, counts = np.unique(values[present, column], return_inverse=True, return_counts=True)
+        starts = np.cumsum(counts) - counts
+        ranks[present, column] = (starts + (counts + 1) / 2.0)[inverse]
+    return ranks
+
+
+def pairwise_spearman(values):
+    """
+    Spearman correlation between every two columns of `values` (days x
+    questions, NaN for missing), each pair ranked over the days where both are
+    answered. Columns answered on the same days are ranked together once, so
+    a group of pairs costs one ranking and one product.
+    """
+    present = ~np.isnan(values)
+    groups = {}
+    for column in range(values.shape[1]):
+        groups.setdefault(present[:, column].tobytes(), (present[:, column], []))[1].append(column)
+
+    correlation = np.full((values.shape[1], values.shape[1]), np.nan)
+    for (mask_a, columns_a), (mask_b, columns_b) in combinations_with_replacement(groups.values(), 2):
+        both = mask_a & mask_b
+        ranks_a = column_ranks(values[both][:, columns_a])
+        ranks_b = column_ranks(values[both][:, columns_b])
+        block, _ = pairwise_pearson(ranks_a, ranks_b)
+        correlation[np.ix_(columns_a, columns_b)] = block
+        correlation[np.ix_(columns_b, columns_a)] = block.T
+    return correlation
+
+
+def correlation_matrices(matrix):
+    """
+    Pearson, Spearman and next-day (lagged) Pearson correlation matrices of
+    all questions of the matrix, each pair over the days where both are answered.
+    """
+    values = matrix.values
+
+    def table(array):
+        return [_to_list(row, digits=3) for row in array]
+
+    pearson, samples = pairwise_pearson(values, values)
+    spearman = pairwise_spearman(values)
+    if values.shape[0] > 1:
+        lagged, lagged_samples = pairwise_pearson(values[:-1], values[1:])
+    else:
+        size = len(matrix.question_ids)
+        lagged, lagged_samples = np.full((size, size), np.nan), np.zeros((size, size), dtype=np.int64)
+
+    return {
+        'pearson': table(pearson),
+        'spearman': table(spearman),
+        'lagged_pearson': table(lagged),
+        'sample_sizes': samples.tolist(),
+        'lagged_sample_sizes': lagged_samples.tolist(),
+    }
+
+
+# The last RECENT_DAYS days of a window are compared against the days before them
+RECENT_DAYS = 7
+
+# Recent answers at least this many baseline standard deviations away are anomalies
+ANOMALY_Z_SCORE = 2.0
+
+# Baselines answered on fewer days give no z-scores
+MIN_BASELINE_SAMPLES = 7
+
+
+def _column_stats(values):
+    """Per column (mean, std, count) over the answered days, NaN where unanswered"""
+    present = ~np.isnan(values)
+    counts = present.sum(axis=0)
+    filled = np.where(present, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = filled.sum(axis=0) / counts
+        variances = np.where(present, (values - means) ** 2, 0.0).sum(axis=0) / counts
+    means = np.where(counts > 0, means, np.nan)
+    return means, np.sqrt(np.where(counts > 0, variances, np.nan)), counts
+
+
+def _grouped_means(values, groups, size):
+    """Mean of every column per group label 0..size-1 of the rows, NaN for empty groups"""
+    present = ~np.isnan(values)
+    members = (groups[:, None] == np.arange(size)[None, :]).astype(np.float64)
+    sums = members.T @ np.where(present, values, 0.0)
+    counts = members.T @ present.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def compute_insights(matrix, recent_days=RECENT_DAYS):
+    """
+    Weekday, seasonality and anomaly insights for every question of the matrix.
+
+    Returns a dict: question_id -> {
+        'weekday_means': 7 means, Monday first,
+        'month_effects': 12 differences between a month's mean and the overall mean, January first,
+        'recent': recent_days mean vs the baseline of all earlier days,
+        'anomalies': recent answers whose baseline z-score reaches ANOMALY_Z_SCORE,
+    }
+    """
+    values = matrix.values
+    days = np.arange(values.shape[0]) + np.datetime64(matrix.start_date, 'D')
+    weekdays = (np.arange(values.shape[0]) + matrix.start_date.weekday()) % 7
+    months = days.astype('datetime64[M]').astype(np.int64) % 12
+
+    overall, _, _ = _column_stats(values)
+    weekday_means = _grouped_means(values, weekdays, 7)
+    month_effects = _grouped_means(values, months, 12) - overall
+
+    split = max(values.shape[0] - recent_days, 0)
+    baseline_mean, baseline_std, baseline_count = _column_stats(values[:split])
+    recent_mean, _, recent_count = _column_stats(values[split:])
+
+    usable = (baseline_count >= MIN_BASELINE_SAMPLES) & (baseline_std > 1e-12)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_scores = (values[split:] - baseline_mean) / baseline_std
+    flagged = usable[None, :] & (np.abs(np.nan_to_num(z_scores)) >= ANOMALY_Z_SCORE)
+
+    weekday_table = [_to_list(column) for column in weekday_means.T]
+    month_table = [_to_list(column) for column in month_effects.T]
+    recent = _to_list(recent_mean)
+    baseline = _to_list(baseline_mean)
+    deltas = _to_list(recent_mean - baseline_mean)
+
+    insights = {}
+    for column, question_id in enumerate(matrix.question_ids):
+        rows = np.flatnonzero(flagged[:, column])
+        insights[question_id] = {
+            'weekday_means': weekday_table[column],
+            'month_effects': month_table[column],
+            'recent': {
+                'mean': recent[column],
+                'count': int(recent_count[column]),
+                'baseline_mean': baseline[column],
+                'baseline_count': int(baseline_count[column]),
+                'delta': deltas[column],
+            },
+            'anomalies': [
+                {
+                    'date': str(days[split + row]),
+                    'value': float(values[split + row, column]),
+                    'z_score': round(float(z_scores[row, column]), 2),
+                }
+                for row in rows
+            ],
+        }
+    return insights
+
+
+# A tag needs this many answered days with and without it for an effect
+MIN_TAG_SAMPLES = 3
+
+
+def load_tag_days(user, start_date, end_date):
+    """
+    Fetch on which days of the window each diary tag of `user` was used, with
+    one query. Entries count on the local date they were created.
+    Returns ([(tag_id, name)] sorted by name, days x tags boolean array).
+    """
+    rows = list(
+        DiaryEntry.tags.through.objects.filter(
+            diaryentry__author=user,
+            diaryentry__created_at__date__range=(start_date, end_date),
+        )
+        .annotate(day=TruncDate('diaryentry__created_at'))
+        .values_list('diarytag_id', 'diarytag__name', 'day')
+        .distinct()
+    )
+
+    tags = sorted({(tag_id, name) for tag_id, name, _ in rows}, key=lambda tag: (tag[1], tag[0]))
+    columns = {tag_id: index for index, (tag_id, _) in enumerate(tags)}
+    tagged = np.zeros((max((end_date - start_date).days + 1, 0), len(tags)), dtype=bool)
+    if rows:
+        tagged[
+            np.fromiter(((day - start_date).days for _, _, day in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((columns[tag_id] for tag_id, _, _ in rows), dtype=np.int64, count=len(rows)),
+        ] = True
+    return tags, tagged
+
+
+def _weighted_moments(weights, present, filled):
+    """Per (group, column) answer count, mean and sample variance for 0/1 row weights"""
+    counts = weights.T @ present
+    sums = weights.T @ filled
+    squares = weights.T @ (filled ** 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        variances = np.maximum(squares - counts * means ** 2, 0.0) / (counts - 1)
+    return counts, means, variances
+
+
+def compute_tag_effects(matrix, tag_ids, tagged):
+    """
+    Mean answer of every question on days with and without each tag, their
+    difference and the effect size (Cohen's d with the pooled standard deviation).
+    `tagged` is a days x tags boolean array aligned with the matrix rows.
+
+    Returns a list of effects, largest absolute effect size first; pairs with
+    fewer than MIN_TAG_SAMPLES answered days on either side are left out.
+    """
+    present = (~np.isnan(matrix.values)).astype(np.float64)
+    filled = np.nan_to_num(matrix.values)
+    on = tagged.astype(np.float64)
+
+    on_counts, on_means, on_variances = _weighted_moments(on, present, filled)
+    off_counts, off_means, off_variances = _weighted_moments(1.0 - on, present, filled)
+
+    differences = on_means - off_means
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled = np.sqrt(
+            ((on_counts - 1) * on_variances + (off_counts - 1) * off_variances)
+            / (on_counts + off_counts - 2)
+        )
+        effect_sizes = np.where(pooled > 1e-12, differences / pooled, np.nan)
+
+    usable = (on_counts >= MIN_TAG_SAMPLES) & (off_counts >= MIN_TAG_SAMPLES)
+    rows, columns = np.nonzero(usable)
+    order = np.argsort(-np.abs(np.nan_to_num(effect_sizes[rows, columns])), kind='stable')
+
+    return [
+        {
+            'tag_id': tag_ids[row],
+            'question_id': matrix.question_ids[column],
+            'tagged_mean': round(float(on_means[row, column]), 2),
+            'tagged_count': int(on_counts[row, column]),
+            'untagged_mean': round(float(off_means[row, column]), 2),
+            'untagged_count': int(off_counts[row, column]),
+            'difference': round(float(differences[row, column]), 2),
+            'effect_size': (
+                None if np.isnan(effect_sizes[row, column])
+                else round(float(effect_sizes[row, column]), 2)
+            ),
+        }
+        for row, column in zip(rows[order], columns[order])
+    ]
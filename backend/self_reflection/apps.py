@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SelfReflectionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "self_reflection"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,192 @@
+"""
+Per-user versioned response cache for the reflection statistics endpoints.
+
+Every cached payload is keyed by the user's current data version, which is
+bumped on any reflection, response or question write. Invalidation is exact
+and needs no key scanning: after a bump, all older entries simply stop being
+addressed and expire on their own. Both the versions and the hit/miss
+counters live in Django's cache, so they are shared by every worker process
+using the same cache backend.
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+KEY_PREFIX = 'self_reflection'
+
+# Seconds a computed payload is kept for one data version
+CACHE_TIMEOUT = 60 * 60
+
+# Precomputed payloads have to last until the users come back
+PRECOMPUTED_TIMEOUT = 60 * 60 * 24
+
+# How far a delta token reaches back before the moment it was issued
+DELTA_OVERLAP = timedelta(seconds=5)
+
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:version:{user_id}'
+
+
+def _structure_key(user_id):
+    return f'{KEY_PREFIX}:structure:{user_id}'
+
+
+def _diary_key(user_id):
+    return f'{KEY_PREFIX}:diary:{user_id}'
+
+
+def _counter_key(name, outcome):
+    return f'{KEY_PREFIX}:cache:{name}:{outcome}'
+
+
+def _initial_version():
+    # Time based, so a version key that was evicted never restarts at a value
+    # that older cached payloads were stored under
+    return time.time_ns() // 1000
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_data_version(user_id):
+    """Current data version of a user"""
+    return _get_version(_version_key(user_id))
+
+
+def bump_data_version(user_id):
+    """Invalidate every cached payload of a user"""
+    return _bump_version(_version_key(user_id))
+
+
+def bump_data_version_on_commit(user_id):
+    """Bump the version once the current transaction commits"""
+    if user_id is not None:
+        transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+def get_structure_version(user_id):
+    """
+    Version of the changes an updated_at based delta cannot express:
+    deleted reflections or responses and question edits.
+    """
+    return _get_version(_structure_key(user_id))
+
+
+def bump_structure_version_on_commit(user_id):
+    if user_id is not None:
+        transaction.on_commit(lambda: _bump_version(_structure_key(user_id)))
+
+
+def get_diary_version(user_id):
+    """
+    Version of a user's diary entries and tags, for the payloads that also
+    read the diary. Kept apart so diary writes leave the reflection-only
+    payloads cached.
+    """
+    return _get_version(_diary_key(user_id))
+
+
+def bump_diary_version_on_commit(user_id):
+    if user_id is not None:
+        transaction.on_commit(lambda: _bump_version(_diary_key(user_id)))
+
+
+def make_delta_token(user_id):
+    """Opaque token a client sends back as ?since= to fetch only later changes"""
+    # Step back a little so writes committing while a payload is built are
+    # sent again rather than missed
+    at = timezone.now() - DELTA_OVERLAP
+    return f'{get_structure_version(user_id)}.{int(at.timestamp() * 1_000_000)}'
+
+
+def parse_delta_token(token):
+    """
+    Parse a token of make_delta_token into (structure version, aware datetime).
+    Raises ValueError. Plain timestamps are not accepted: without the structure
+    version, deletes and question edits after them would go unnoticed.
+    """
+    structure, separator, micros = token.partition('.')
+    if not (separator and structure.isdigit() and micros.isdigit()):
+        raise ValueError("Invalid since value. Use the 'version' token of a previous response")
+    try:
+        at = datetime.fromtimestamp(int(micros) / 1_000_000, tz=dt_timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError("Invalid since value. Use the 'version' token of a previous response") from None
+    return int(structure), at
+
+
+def _count(name, outcome):
+    key = _counter_key(name, outcome)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def cache_stats(names):
+    """Hit/miss counters of the given cached endpoints"""
+    stats = {}
+    for name in names:
+        hits = cache.get(_counter_key(name, 'hits'), 0)
+        misses = cache.get(_counter_key(name, 'misses'), 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def reset_cache_stats(names):
+    cache.delete_many([_counter_key(name, outcome) for name in names for outcome in ('hits', 'misses')])
+
+
+def cache_key(name, user_id, params):
+    """Cache key of a payload for the user's current data version"""
+    query = urlencode(sorted((key, '' if value is None else value) for key, value in params.items()))
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return f'{KEY_PREFIX}:{name}:{user_id}:{get_data_version(user_id)}:{digest}'
+
+
+def cached_payload(name, user_id, params, build):
+    """Return the cached payload for (name, user, params, data version), building it on a miss"""
+    key = cache_key(name, user_id, params)
+    payload = cache.get(key)
+    if payload is not None:
+        _count(name, 'hits')
+        return payload
+
+    _count(name, 'misses')
+    payload = build()
+    cache.set(key, payload, timeout=CACHE_TIMEOUT)
+    return payload
+
+
+def refresh_payload(name, user_id, params, build):
+    """Rebuild and store a payload whatever is cached, e.g. ahead of the morning traffic"""
+    key = cache_key(name, user_id, params)
+    payload = build()
+    cache.set(key, payload, timeout=PRECOMPUTED_TIMEOUT)
+    return payload
@@ -0,0 +1,57 @@
+"""
+Per-user question catalog cached across requests.
+
+Every view and validator that needs a user's questions reads them from one
+cached list, so the question table is only queried again after a question
+of that user is saved or deleted (see signals.py), or once the entry expires.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import KEY_PREFIX
+from .models import ReflectionQuestion
+
+
+# Bounds how long a catalog can outlive a write that failed to invalidate it
+CATALOG_TIMEOUT = 60 * 5
+
+
+def _catalog_key(user_id):
+    return f'{KEY_PREFIX}:questions:{user_id}'
+
+
+def get_question_catalog(user):
+    """All questions of `user` in display order"""
+    key = _catalog_key(user.pk)
+    questions = cache.get(key)
+    if questions is None:
+        questions = list(ReflectionQuestion.objects.filter(author=user).order_by('order', 'id'))
+        cache.set(key, questions, timeout=CATALOG_TIMEOUT)
+
+    for question in questions:
+        # Serializers read author.email; the cached rows are all the user's own
+        question.author = user
+    return questions
+
+
+def get_active_questions(user, question_type=None):
+    """Active questions of `user` in display order, optionally of one type"""
+    return [
+        question
+        for question in get_question_catalog(user)
+        if question.is_active and (question_type is None or question.question_type == question_type)
+    ]
+
+
+def get_question(user, question_id, active_only=False):
+    """One question of `user` by id, or None"""
+    for question in get_question_catalog(user):
+        if str(question.id) == str(question_id) and (question.is_active or not active_only):
+            return question
+    return None
+
+
+def invalidate_question_catalog_on_commit(user_id):
+    """Drop the cached catalog of a user once the current transaction commits"""
+    if user_id is not None:
+        transaction.on_commit(lambda: cache.delete(_catalog_key(user_id)))
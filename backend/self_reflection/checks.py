@@ -0,0 +1,24 @@
+"""
+Deployment checks (manage.py check --deploy) for the settings the reflection
+caches rely on.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The data versions and question catalogs are invalidated by deleting or
+    bumping cache keys, which a per-process LocMemCache only does in the
+    worker that handled the write.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.rsplit('.', 1)[-1] != 'LocMemCache':
+        return []
+    return [Error(
+        f'{backend} is not shared between worker processes, so the reflection statistics '
+        'and question catalogs of the other workers would go stale.',
+        hint='Configure CACHE_BACKEND with a shared cache (Redis, Memcached, database or file based).',
+        id='self_reflection.E001',
+    )]
@@ -0,0 +1,586 @@
+"""
+Single-pass aggregation engine for the reflection dashboard.
+
+Every response inside the requested window is fetched with one query and the
+line charts, heatmaps and distributions of every question are built from that
+in-memory result set, so the number of queries per dashboard load stays
+constant no matter how many questions the user has. Windows of at least
+ROLLUP_MIN_DAYS days are served from the pre-aggregated rollup table instead.
+"""
+import base64
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+
+from .analytics import NUMERIC_TYPES, compute_metrics, load_response_matrix, matrix_from_answers
+from .downsampling import downsample_line_chart
+from .models import ReflectionResponse, SelfReflection
+from .rollups import ROLLUP_MIN_DAYS, load_window_rollups, empty_summary
+
+
+def fetch_window_responses(user, start_date, question_ids, dates=None):
+    """
+    Load all responses of `user` on or after `start_date` (optionally only on
+    `dates`) for the given questions with a single query.
+
+    Returns a dict: question_id -> {date: (range, choice, number)}
+    """
+    rows = ReflectionResponse.objects.filter(
+        daily_reflection__user=user,
+        daily_reflection__date__gte=start_date,
+        question_id__in=question_ids,
+    )
+    if dates is not None:
+        rows = rows.filter(daily_reflection__date__in=dates)
+    rows = rows.values_list(
+        'question_id',
+        'daily_reflection__date',
+        'range_response',
+        'choice_code',
+        'number_response',
+    ).order_by('daily_reflection__date')
+
+    responses = defaultdict(dict)
+    for question_id, date, range_value, choice_value, number_value in rows:
+        responses[question_id][date] = (range_value, choice_value, number_value)
+    return responses
+
+
+def _date_range(start_date, end_date):
+    """Yield every calendar day from start_date to end_date inclusive"""
+    current_date = start_date
+    while current_date <= end_date:
+        yield current_date
+        current_date += timedelta(days=1)
+
+
+def _values(answers, column):
+    """Extract the non-null values of one response column as {date: value}"""
+    return {
+        date: row[column]
+        for date, row in answers.items()
+        if row[column] is not None
+    }
+
+
+def summarize(question_type, values):
+    """Aggregate {date: value} into the same summary shape the rollups produce"""
+    all_values = list(values.values())
+    numeric = question_type in ('range', 'number')
+    return {
+        'count': len(all_values),
+        'total': sum(all_values) if numeric else 0,
+        'min': min(all_values) if numeric and all_values else None,
+        'max': max(all_values) if numeric and all_values else None,
+        'counts': Counter(str(value) for value in all_values) if question_type != 'number' else {},
+    }
+
+
+def _statistics(summary, digits=None):
+    """Average/min/max/count block of a line chart"""
+    count = summary['count']
+    if not count:
+        return {'average': None, 'min': None, 'max': None, 'count': 0}
+    if digits is None:
+        low, high = int(summary['min']), int(summary['max'])
+    else:
+        low, high = round(summary['min'], digits), round(summary['max'], digits)
+    return {
+        'average': round(summary['total'] / count, 2),
+        'min': low,
+        'max': high,
+        'count': count
+    }
+
+
+def range_line_chart(question, values, summary, days):
+    """Line chart data for range questions"""
+    color_mapping = question.color_mapping or {}
+    data_points = []
+    for day in days:
+        value = values.get(day)
+        data_points.append({
+            'date': day.isoformat(),
+            'value': value,
+            'color': color_mapping.get(str(value)) if value and color_mapping else None
+        })
+
+    return {
+        'data': data_points,
+        'statistics': _statistics(summary)
+    }
+
+
+def range_heatmap(question, values):
+    """Calendar heatmap data for range questions"""
+    color_mapping = question.color_mapping
+    value_span = question.max_value - question.min_value
+    return [
+        {
+            'date': day.isoformat(),
+            'value': value,
+            'color': color_mapping.get(str(value)) if color_mapping else None,
+            'intensity': (value - question.min_value) / value_span
+        }
+        for day, value in values.items()
+    ]
+
+
+def range_distribution(question, summary):
+    """Distribution of values for range questions"""
+    counts = summary['counts']
+    total = summary['count']
+    distribution = {}
+    for value in range(question.min_value, question.max_value + 1):
+        count = counts.get(str(value), 0)
+        distribution[str(value)] = {
+            'count': count,
+            'percentage': round((count / total) * 100, 1) if total > 0 else 0,
+            'color': question.color_mapping.get(str(value)) if question.color_mapping else None
+        }
+    return distribution
+
+
+def _choice_codes(question):
+    """(label, code) of every current choice of a question"""
+    return [(choice, question.get_choice_code(choice)) for choice in question.choices or []]
+
+
+def choice_line_chart(question, values, summary, days):
+    """Line chart data for choice questions (choice frequency over time)"""
+    choices = question.choices or []
+    codes = _choice_codes(question)
+    choice_data = {choice: [] for choice in choices}
+
+    for day in days:
+        selected_code = values.get(day)
+        iso_date = day.isoformat()
+        for choice, code in codes:
+            choice_data[choice].append({
+                'date': iso_date,
+                'selected': code == selected_code,
+                'value': 1 if code == selected_code else 0
+            })
+
+    datasets = [
+        {
+            'label': choice,
+            'color': question.color_mapping.get(choice) if question.color_mapping else None,
+            'data': choice_data[choice]
+        }
+        for choice in choices
+    ]
+
+    return {
+        'datasets': datasets,
+        'total_responses': summary['count']
+    }
+
+
+def choice_distribution(question, summary):
+    """Distribution of choices for choice questions"""
+    counts = summary['counts']
+    total = summary['count']
+    distribution = {}
+    for choice, code in _choice_codes(question):
+        count = counts.get(str(code), 0)
+        distribution[choice] = {
+            'count': count,
+            'percentage': round((count / total) * 100, 1) if total > 0 else 0,
+            'color': question.color_mapping.get(choice) if question.color_mapping else None
+        }
+    return distribution
+
+
+def number_line_chart(question, values, summary, days):
+    """Line chart data for number questions"""
+    data_points = []
+    for day in days:
+        value = values.get(day)
+        data_points.append({
+            'date': day.isoformat(),
+            'value': round(value, 2) if value is not None else None,
+        })
+
+    return {
+        'data': data_points,
+        'statistics': _statistics(summary, digits=2)
+    }
+
+
+def build_question_data(question, answers, days, summary=None):
+    """
+    Build the dashboard payload of a single question from its answers, with
+    one line chart point per entry of `days`.
+    `summary` overrides the aggregates otherwise computed from the answers.
+    """
+    question_data = {
+        'question_id': question.id,
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'category': question.category,
+        'color_mapping': question.color_mapping,
+    }
+
+    if question.question_type == 'range':
+        values = _values(answers, 0)
+        summary = summary or summarize('range', values)
+        question_data['line_chart'] = range_line_chart(question, values, summary, days)
+        question_data['heatmap'] = range_heatmap(question, values)
+        question_data['distribution'] = range_distribution(question, summary)
+
+    elif question.question_type == 'choice':
+        values = _values(answers, 1)
+        summary = summary or summarize('choice', values)
+        question_data['line_chart'] = choice_line_chart(question, values, summary, days)
+        question_data['distribution'] = choice_distribution(question, summary)
+
+    elif question.question_type == 'number':
+        values = _values(answers, 2)
+        summary = summary or summarize('number', values)
+        question_data['line_chart'] = number_line_chart(question, values, summary, days)
+
+    return question_data
+
+
+def use_rollups(start_date, end_date):
+    """Whether a window is long enough to be served from the rollup table"""
+    return (end_date - start_date).days >= ROLLUP_MIN_DAYS
+
+
+def load_answers(user, questions, start_date, end_date, metrics=None):
+    """
+    Fetch the answers of `questions` in the window with one query.
+
+    Returns (answers, summaries, question_metrics), where summaries is empty
+    unless the window is served from rollups and question_metrics holds the
+    requested analytics of every range and number question.
+    """
+    question_ids = [q.id for q in questions]
+    if use_rollups(start_date, end_date):
+        answers, summaries = load_window_rollups(user, question_ids, start_date, end_date)
+    else:
+        answers, summaries = fetch_window_responses(user, start_date, question_ids), {}
+
+    question_metrics = {}
+    if metrics:
+        matrix = matrix_from_answers(questions, answers, start_date, end_date)
+        question_metrics = compute_metrics(matrix, metrics)
+    return answers, summaries, question_metrics
+
+
+def build_dashboard_questions(user, questions, start_date, end_date, metrics=None,
+                              max_points=None, downsample='lttb'):
+    """
+    Build the per-question dashboard payloads for all `questions` from one
+    fetch of the user's responses (or rollups, for long windows).
+    `metrics` adds the requested analytics to every range and number question.
+    `max_points` bounds their line charts, reduced with the `downsample` method.
+    """
+    questions = list(questions)
+    answers, summaries, question_metrics = load_answers(user, questions, start_date, end_date, metrics)
+    days = list(_date_range(start_date, end_date))
+
+    dashboard_questions = []
+    for question in questions:
+        question_data = build_question_data(
+            question,
+            answers.get(question.id, {}),
+            days,
+            summary=summaries.get(question.id),
+        )
+        if max_points and question.question_type in NUMERIC_TYPES:
+            question_data['line_chart'] = downsample_line_chart(
+                question_data['line_chart'],
+                max_points,
+                downsample,
+                color_mapping=(question.color_mapping or {}) if question.question_type == 'range' else None,
+            )
+        if question.id in question_metrics:
+            question_data['metrics'] = question_metrics[question.id]
+        dashboard_questions.append(question_data)
+    return dashboard_questions
+
+
+def window_summaries(user, questions, start_date, end_date):
+    """
+    Aggregates (count, total, min, max, per-value counts) of every question
+    since start_date from one grouped query, without loading the answers.
+    """
+    question_ids = [q.id for q in questions]
+    if use_rollups(start_date, end_date):
+        _, summaries = load_window_rollups(user, question_ids, start_date, end_date)
+        return summaries
+
+    rows = ReflectionResponse.objects.filter(
+        daily_reflection__user=user,
+        daily_reflection__date__gte=start_date,
+        question_id__in=question_ids,
+    ).values('question_id', 'range_response', 'choice_code').annotate(
+        count=Count('id'),
+        number_count=Count('number_response'),
+        number_total=Sum('number_response'),
+        number_min=Min('number_response'),
+        number_max=Max('number_response'),
+    )
+
+    types = {question.id: question.question_type for question in questions}
+    summaries = {}
+    for row in rows:
+        question_type = types[row['question_id']]
+        summary = summaries.setdefault(row['question_id'], empty_summary())
+        if question_type == 'range' and row['range_response'] is not None:
+            value = row['range_response']
+            summary['count'] += row['count']
+            summary['total'] += value * row['count']
+            summary['min'] = value if summary['min'] is None else min(summary['min'], value)
+            summary['max'] = value if summary['max'] is None else max(summary['max'], value)
+            summary['counts'][str(value)] = summary['counts'].get(str(value), 0) + row['count']
+        elif question_type == 'choice' and row['choice_code'] is not None:
+            code = str(row['choice_code'])
+            summary['count'] += row['count']
+            summary['counts'][code] = summary['counts'].get(code, 0) + row['count']
+        elif question_type == 'number' and row['number_count']:
+            summary['count'] += row['number_count']
+            summary['total'] += row['number_total']
+            low, high = row['number_min'], row['number_max']
+            summary['min'] = low if summary['min'] is None else min(summary['min'], low)
+            summary['max'] = high if summary['max'] is None else max(summary['max'], high)
+    return summaries
+
+
+def changed_dates(user, start_date, since):
+    """Dates in the window whose reflection or any response was written after `since`"""
+    return sorted(set(
+        SelfReflection.objects.filter(user=user, date__gte=start_date).filter(
+            Q(updated_at__gt=since) | Q(responses__updated_at__gt=since)
+        ).values_list('date', flat=True)
+    ))
+
+
+def build_dashboard_delta(user, questions, start_date, end_date, since):
+    """
+    Build the dashboard changes since `since`: for every question, line chart
+    points and heatmap entries of the changed days only, plus the refreshed
+    statistics and distributions. Returns (changed dates, questions).
+    """
+    dates = changed_dates(user, start_date, since)
+    if not dates:
+        return [], []
+
+    questions = list(questions)
+    answers = fetch_window_responses(user, start_date, [q.id for q in questions], dates=dates)
+    summaries = window_summaries(user, questions, start_date, end_date)
+    days = [day for day in dates if day <= end_date]
+
+    delta_questions = [
+        build_question_data(
+            question,
+            answers.get(question.id, {}),
+            days,
+            summary=summaries.get(question.id),
+        )
+        for question in questions
+    ]
+    return dates, delta_questions
+
+
+class ColorTable:
+    """Shared list of colors referenced by index from columnar payloads"""
+
+    def __init__(self):
+        self.colors = []
+        self._indexes = {}
+
+    def index(self, color):
+        if color is None:
+            return None
+        if color not in self._indexes:
+            self._indexes[color] = len(self.colors)
+            self.colors.append(color)
+        return self._indexes[color]
+
+
+def _dense(values, start_date, length, transform=None):
+    """One entry per day from start_date, None for days without an answer"""
+    column = [None] * length
+    for day, value in values.items():
+        offset = (day - start_date).days
+        if 0 <= offset < length:
+            column[offset] = transform(value) if transform else value
+    return column
+
+
+def build_columnar_question(question, answers, start_date, end_date, colors, summary=None):
+    """
+    Compact payload of one question: a dense per-day values array starting at
+    start_date, choice indices instead of labels and color table indices
+    instead of color strings.
+    """
+    length = (end_date - start_date).days + 1
+    color_mapping = question.color_mapping or {}
+    question_data = {
+        'question_id': question.id,
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'category': question.category,
+    }
+
+    if question.question_type == 'range':
+        values = _values(answers, 0)
+        summary = summary or summarize('range', values)
+        scale = list(range(question.min_value, question.max_value + 1))
+        question_data.update({
+            'scale': [question.min_value, question.max_value],
+            'scale_colors': [colors.index(color_mapping.get(str(value))) for value in scale],
+            'values': _dense(values, start_date, length),
+            'statistics': _statistics(summary),
+            'distribution': [summary['counts'].get(str(value), 0) for value in scale],
+        })
+
+    elif question.question_type == 'choice':
+        values = _values(answers, 1)
+        summary = summary or summarize('choice', values)
+        choices = question.choices or []
+        codes = [code for _, code in _choice_codes(question)]
+        choice_indexes = {code: index for index, code in enumerate(codes)}
+        question_data.update({
+            'choices': choices,
+            'choice_colors': [colors.index(color_mapping.get(choice)) for choice in choices],
+            'values': _dense(values, start_date, length, choice_indexes.get),
+            'total_responses': summary['count'],
+            'distribution': [summary['counts'].get(str(code), 0) for code in codes],
+        })
+
+    elif question.question_type == 'number':
+        values = _values(answers, 2)
+        summary = summary or summarize('number', values)
+        question_data.update({
+            'values': _dense(values, start_date, length, lambda value: round(value, 2)),
+            'statistics': _statistics(summary, digits=2),
+        })
+
+    return question_data
+
+
+def build_columnar_dashboard(user, questions, start_date, end_date, metrics=None):
+    """
+    Columnar variant of build_dashboard_questions: every question carries one
+    values array for the whole window and all colors come from one table.
+    """
+    questions = list(questions)
+    answers, summaries, question_metrics = load_answers(user, questions, start_date, end_date, metrics)
+
+    colors = ColorTable()
+    columnar_questions = []
+    for question in questions:
+        question_data = build_columnar_question(
+            question,
+            answers.get(question.id, {}),
+            start_date,
+            end_date,
+            colors,
+            summary=summaries.get(question.id),
+        )
+        if question.id in question_metrics:
+            question_data['metrics'] = question_metrics[question.id]
+        columnar_questions.append(question_data)
+
+    return {
+        'start_date': start_date.isoformat(),
+        'length': (end_date - start_date).days + 1,
+        'colors': colors.colors,
+        'questions': columnar_questions,
+    }
+
+
+def range_question_averages(user, questions, start_date, end_date, metrics=None):
+    """
+    Average and count of the range answers of each question since start_date,
+    from one grouped query (or the rollups, for long windows).
+    `metrics` adds the requested analytics, computed from one extra fetch.
+    """
+    questions = list(questions)
+    question_ids = [q.id for q in questions]
+    if use_rollups(start_date, end_date):
+        _, summaries = load_window_rollups(user, question_ids, start_date, end_date)
+        aggregates = {
+            question_id: (summary['total'] / summary['count'], summary['count'])
+            for question_id, summary in summaries.items()
+            if summary['count']
+        }
+    else:
+        rows = ReflectionResponse.objects.filter(
+            daily_reflection__user=user,
+            daily_reflection__date__gte=start_date,
+            question_id__in=question_ids,
+            range_response__isnull=False
+        ).values('question_id').annotate(avg=Avg('range_response'), count=Count('id'))
+        aggregates = {row['question_id']: (row['avg'], row['count']) for row in rows}
+
+    question_metrics = {}
+    if metrics:
+        matrix = load_response_matrix(user, questions, start_date, end_date)
+        question_metrics = compute_metrics(matrix, metrics)
+
+    question_stats = []
+    for question in questions:
+        if question.id not in aggregates:
+            continue
+        average, count = aggregates[question.id]
+        question_data = {
+            'question_id': question.id,
+            'question_text': question.question_text,
+            'average': round(average, 2),
+            'count': count
+        }
+        if question.id in question_metrics:
+            question_data['metrics'] = question_metrics[question.id]
+        question_stats.append(question_data)
+    return question_stats
+
+
+# Question types whose answers fit the one byte per day of a packed heatmap
+PACKED_HEATMAP_TYPES = ('range', 'choice')
+
+
+def packed_year_heatmap(user, question, year):
+    """
+    Calendar heatmap of one question for a whole year, packed as one byte per
+    day (base64): 0 for no answer, the value itself for range questions and
+    the 1-based position in `choices` for choice questions.
+    """
+    start_date, end_date = date(year, 1, 1), date(year, 12, 31)
+    days = bytearray((end_date - start_date).days + 1)
+
+    rows = ReflectionResponse.objects.filter(
+        daily_reflection__user=user,
+        daily_reflection__date__range=(start_date, end_date),
+        question=question,
+    ).values_list('daily_reflection__date', 'range_response', 'choice_code')
+
+    positions = {code: index for index, (_, code) in enumerate(_choice_codes(question), start=1)}
+    for day, range_value, choice_value in rows:
+        if question.question_type == 'range':
+            value = range_value
+        else:
+            value = positions.get(choice_value)
+        if value:
+            days[(day - start_date).days] = value
+
+    heatmap = {
+        'question_id': question.id,
+        'question_type': question.question_type,
+        'year': year,
+        'start_date': start_date.isoformat(),
+        'length': len(days),
+        'encoding': 'base64',
+        'values': base64.b64encode(bytes(days)).decode('ascii'),
+        'color_mapping': question.color_mapping,
+    }
+    if question.question_type == 'range':
+        heatmap.update({'min_value': question.min_value, 'max_value': question.max_value})
+    else:
+        heatmap['choices'] = question.choices
+    return heatmap
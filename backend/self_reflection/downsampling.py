@@ -0,0 +1,116 @@
+"""
+Server-side downsampling of long range and number line charts.
+
+A series longer than the requested number of points is reduced either with
+Largest-Triangle-Three-Buckets, which keeps the original points that best
+preserve the visual shape, or by averaging calendar weeks/months into one
+point carrying the mean, min, max and answer count of the period. Both work
+on NumPy arrays of day ordinals and values.
+"""
+from datetime import date
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ('lttb', 'week', 'month')
+
+# LTTB always keeps the first and last point, so fewer makes no sense
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the `threshold` points of (x, y) Largest-Triangle-Three-Buckets keeps"""
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+        else:
+            next_start, next_end = n - 1, n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        # Twice the area of the triangle (previous point, candidate, next bucket average)
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+def calendar_buckets(ordinals, values, granularity):
+    """
+    Group date-sorted (day ordinal, value) pairs by calendar week or month.
+    Returns (period start ordinals, mean, min, max, count) arrays.
+    """
+    if granularity == 'week':
+        # date.fromordinal(1) is a Monday
+        keys = ordinals - (ordinals - 1) % 7
+    else:
+        keys = np.fromiter(
+            (date.fromordinal(int(ordinal)).replace(day=1).toordinal() for ordinal in ordinals),
+            dtype=np.int64,
+            count=len(ordinals),
+        )
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    counts = np.diff(np.append(starts, len(values)))
+    means = np.add.reduceat(values, starts) / counts
+    return keys[starts], means, np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts), counts
+
+
+def downsample_line_chart(line_chart, max_points, method='lttb', color_mapping=None):
+    """
+    Reduce the 'data' points of a range or number line chart to at most
+    `max_points` answered points. Charts that already fit are left untouched.
+    `color_mapping` colors the averaged points of range questions.
+    """
+    points = line_chart['data']
+    if len(points) <= max_points:
+        return line_chart
+
+    answered = [point for point in points if point['value'] is not None]
+    ordinals = np.fromiter(
+        (date.fromisoformat(point['date']).toordinal() for point in answered),
+        dtype=np.int64,
+        count=len(answered),
+    )
+    values = np.fromiter((point['value'] for point in answered), dtype=np.float64, count=len(answered))
+
+    if method == 'lttb' or not answered:
+        data = [answered[index] for index in lttb_indices(ordinals, values, max_points)]
+    else:
+        starts, means, lows, highs, counts = calendar_buckets(ordinals, values, method)
+        data = []
+        for start, mean, low, high, count in zip(starts, means, lows, highs, counts):
+            point = {
+                'date': date.fromordinal(int(start)).isoformat(),
+                'value': round(float(mean), 2),
+                'min': round(float(low), 2),
+                'max': round(float(high), 2),
+                'count': int(count),
+            }
+            if color_mapping is not None:
+                point['color'] = color_mapping.get(str(int(round(mean))))
+            data.append(point)
+        # Periods can still outnumber max_points over very long windows
+        if len(data) > max_points:
+            kept = lttb_indices(starts.astype(np.float64), means, max_points)
+            data = [data[index] for index in kept]
+
+    return {
+        **line_chart,
+        'data': data,
+        'downsampled': {'method': method, 'points': len(data), 'original_points': len(points)},
+    }
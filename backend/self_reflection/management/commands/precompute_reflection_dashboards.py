@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from self_reflection.precompute import (
+    ACTIVE_DAYS,
+    CHUNK_SIZE,
+    DASHBOARD_DAYS,
+    precompute_dashboards,
+)
+
+# Cache backends whose entries only live in the process writing them
+PROCESS_LOCAL_CACHES = ('LocMemCache', 'DummyCache')
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the dashboard, stats and insights payloads and streaks of all active "
+        "users into the statistics cache. Run it nightly, shortly after midnight UTC."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs)')
+        parser.add_argument('--user-id', type=int, action='append', dest='user_ids',
+                            help='Only precompute this user (repeatable)')
+        parser.add_argument('--days', type=int, action='append',
+                            help=f'dashboard_stats window to precompute (repeatable, default: {DASHBOARD_DAYS[0]})')
+        parser.add_argument('--active-days', type=int, default=ACTIVE_DAYS,
+                            help='Users with a reflection in this many days count as active')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Users loaded per query by each worker')
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend.rsplit('.', 1)[-1] in PROCESS_LOCAL_CACHES:
+            raise CommandError(
+                f'{backend} is not shared with the web processes, so the precomputed payloads '
+                'would be lost. Configure CACHE_BACKEND with a shared cache (Redis, Memcached, '
+                'database or file based).'
+            )
+
+        started = time.perf_counter()
+        users, payloads, failures = 0, 0, []
+        for user_id, seconds, count, error in precompute_dashboards(
+            user_ids=options['user_ids'],
+            workers=options['workers'],
+            dashboard_days=tuple(options['days'] or DASHBOARD_DAYS),
+            chunk_size=options['chunk_size'],
+            active_days=options['active_days'],
+        ):
+            users += 1
+            payloads += count
+            if error:
+                failures.append(user_id)
+                self.stderr.write(f'user {user_id}: failed after {seconds * 1000:.1f} ms ({error})')
+            else:
+                self.stdout.write(f'user {user_id}: {count} payload(s) in {seconds * 1000:.1f} ms')
+
+        elapsed = time.perf_counter() - started
+        throughput = users / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Precomputed {payloads} payload(s) for {users} user(s) in {elapsed:.2f} s '
+            f'({throughput:.1f} users/s).'
+        ))
+        if failures:
+            self.stdout.write(self.style.ERROR(f'{len(failures)} user(s) failed: {failures}'))
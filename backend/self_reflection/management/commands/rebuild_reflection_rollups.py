@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from self_reflection.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and monthly reflection rollups from the stored responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='Only rebuild the rollups of this user')
+
+    def handle(self, *args, **options):
+        rollup_count = rebuild_rollups(options.get('user_id'))
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {rollup_count} reflection rollup(s).')
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from self_reflection.streaks import rebuild_streaks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the persisted reflection streak of every user from their reflection dates'
+
+    def handle(self, *args, **options):
+        streak_count, reset_count = rebuild_streaks()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt streaks for {streak_count} user(s), reset {reset_count} user(s) without reflections.'
+            )
+        )
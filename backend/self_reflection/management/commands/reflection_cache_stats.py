@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from self_reflection.cache import cache_stats, reset_cache_stats
+
+CACHED_ENDPOINTS = ['dashboard_stats', 'stats', 'correlations', 'heatmap', 'insights', 'tag_correlations']
+
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the reflection statistics cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name, stats in cache_stats(CACHED_ENDPOINTS).items():
+            hit_rate = f"{stats['hit_rate']:.1%}" if stats['hit_rate'] is not None else 'n/a'
+            self.stdout.write(f"{name}: {stats['hits']} hit(s), {stats['misses']} miss(es), hit rate {hit_rate}")
+        
+        if options['reset']:
+            reset_cache_stats(CACHED_ENDPOINTS)
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,132 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import timedelta
+
+
+def backfill_rollups(apps, schema_editor):
+    """Aggregate the existing responses into day/week/month rollups"""
+    ReflectionResponse = apps.get_model("self_reflection", "ReflectionResponse")
+    ReflectionRollup = apps.get_model("self_reflection", "ReflectionRollup")
+
+    rows = ReflectionResponse.objects.values_list(
+        "daily_reflection__user_id",
+        "question_id",
+        "question__question_type",
+        "daily_reflection__date",
+        "range_response",
+        "choice_response",
+        "number_response",
+    ).iterator(chunk_size=5000)
+
+    buckets = {}
+    for user_id, question_id, question_type, date, range_value, choice, number in rows:
+        if question_type == "range" and range_value is not None:
+            value, key = float(range_value), str(range_value)
+        elif question_type == "number" and number is not None:
+            value, key = float(number), None
+        elif question_type == "choice" and choice is not None:
+            value, key = None, choice
+        else:
+            continue
+
+        starts = {
+            "day": date,
+            "week": date - timedelta(days=date.weekday()),
+            "month": date.replace(day=1),
+        }
+        for granularity, start in starts.items():
+            rollup = buckets.get((user_id, question_id, granularity, start))
+            if rollup is None:
+                rollup = buckets[(user_id, question_id, granularity, start)] = (
+                    ReflectionRollup(
+                        user_id=user_id,
+                        question_id=question_id,
+                        granularity=granularity,
+                        period_start=start,
+                        choice_counts={},
+                    )
+                )
+            rollup.count += 1
+            if value is not None:
+                rollup.total += value
+                rollup.sum_of_squares += value * value
+                if rollup.min_value is None or value < rollup.min_value:
+                    rollup.min_value = value
+                if rollup.max_value is None or value > rollup.max_value:
+                    rollup.max_value = value
+            if key is not None:
+                rollup.choice_counts[key] = rollup.choice_counts.get(key, 0) + 1
+
+    ReflectionRollup.objects.bulk_create(buckets.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("self_reflection", "0005_reflectionstreak"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReflectionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week"), ("month", "Month")],
+                        max_length=5,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total", models.FloatField(default=0)),
+                ("min_value", models.FloatField(blank=True, null=True)),
+                ("max_value", models.FloatField(blank=True, null=True)),
+                ("sum_of_squares", models.FloatField(default=0)),
+                ("choice_counts", models.JSONField(blank=True, default=dict)),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="self_reflection.reflectionquestion",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reflection_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reflection Rollup",
+                "verbose_name_plural": "Reflection Rollups",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "granularity", "period_start"],
+                        name="self_reflec_user_id_689fd0_idx",
+                    )
+                ],
+                "unique_together": {
+                    ("user", "question", "granularity", "period_start")
+                },
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
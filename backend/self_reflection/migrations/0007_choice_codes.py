@@ -0,0 +1,94 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:28
+
+from django.db import migrations, models
+
+
+def encode_choices(apps, schema_editor):
+    """Give every choice label a code and store responses and rollup counts by code"""
+    ReflectionQuestion = apps.get_model("self_reflection", "ReflectionQuestion")
+    ReflectionResponse = apps.get_model("self_reflection", "ReflectionResponse")
+    ReflectionRollup = apps.get_model("self_reflection", "ReflectionRollup")
+
+    for question in ReflectionQuestion.objects.filter(question_type="choice"):
+        labels = list(dict.fromkeys(question.choices or []))
+        # Labels that are no longer choices keep their history under codes of their own
+        answered = (
+            ReflectionResponse.objects.filter(question=question)
+            .exclude(choice_response__isnull=True)
+            .exclude(choice_response="")
+            .values_list("choice_response", flat=True)
+            .distinct()
+        )
+        labels.extend(sorted(set(answered) - set(labels)))
+        codes = {label: code for code, label in enumerate(labels, start=1)}
+
+        question.choice_codes = {str(code): label for label, code in codes.items()}
+        question.save(update_fields=["choice_codes"])
+
+        for label, code in codes.items():
+            ReflectionResponse.objects.filter(
+                question=question, choice_response=label
+            ).update(choice_code=code)
+
+        rollups = list(ReflectionRollup.objects.filter(question=question))
+        for rollup in rollups:
+            rollup.choice_counts = {
+                str(codes[label]): count
+                for label, count in rollup.choice_counts.items()
+                if label in codes
+            }
+        ReflectionRollup.objects.bulk_update(rollups, ["choice_counts"], batch_size=1000)
+
+
+def decode_choices(apps, schema_editor):
+    """Store choice labels on responses and rollup counts again"""
+    ReflectionQuestion = apps.get_model("self_reflection", "ReflectionQuestion")
+    ReflectionResponse = apps.get_model("self_reflection", "ReflectionResponse")
+    ReflectionRollup = apps.get_model("self_reflection", "ReflectionRollup")
+
+    for question in ReflectionQuestion.objects.filter(question_type="choice"):
+        labels = question.choice_codes or {}
+        for code, label in labels.items():
+            ReflectionResponse.objects.filter(
+                question=question, choice_code=int(code)
+            ).update(choice_response=label)
+
+        rollups = list(ReflectionRollup.objects.filter(question=question))
+        for rollup in rollups:
+            rollup.choice_counts = {
+                labels[code]: count
+                for code, count in rollup.choice_counts.items()
+                if code in labels
+            }
+        ReflectionRollup.objects.bulk_update(rollups, ["choice_counts"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("self_reflection", "0006_reflectionrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reflectionquestion",
+            name="choice_codes",
+            field=models.JSONField(
+                blank=True, default=dict, help_text="Integer codes of the choices"
+            ),
+        ),
+        migrations.AddField(
+            model_name="reflectionresponse",
+            name="choice_code",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="Response for multiple choice questions, as a code of question.choice_codes",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(encode_choices, decode_choices),
+        migrations.RemoveField(
+            model_name="reflectionresponse",
+            name="choice_response",
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+def delete_weekly_rollups(apps, schema_editor):
+    """Weekly rollups were never read; rebuild_reflection_rollups no longer writes them"""
+    ReflectionRollup = apps.get_model("self_reflection", "ReflectionRollup")
+    ReflectionRollup.objects.filter(granularity="week").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("self_reflection", "0007_choice_codes"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_weekly_rollups, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="reflectionrollup",
+            name="granularity",
+            field=models.CharField(
+                choices=[("day", "Day"), ("month", "Month")], max_length=5
+            ),
+        ),
+    ]
@@ -58,6 +58,10 @@ class ReflectionQuestion(models.Model):
     # For range questions: {"1": "#FCF6D9", "5": "#DDBA7D", "10": "#A72703", ...}
     color_mapping = models.JSONField(blank=True, null=True, help_text="Color mapping for options/values")
     
+    # Stable integer code of every label a choice question ever had, e.g. {"1": "Happy", "2": "Sad"}.
+    # Responses store the code, so renaming a choice keeps its history
+    choice_codes = models.JSONField(default=dict, blank=True, help_text="Integer codes of the choices")
+    
     # Metadata
     is_active = models.BooleanField(default=True, help_text="Whether this question is currently being used")
     order = models.PositiveIntegerField(default=0, help_text="Display order")
@@ -129,6 +133,44 @@ class ReflectionQuestion(models.Model):
         
         return {}
     
+    def generate_choice_codes(self, previous_choices=None):
+        """
+        Extend choice_codes with a code for every new label in choices.
+        A label that replaces another at the same position in previous_choices
+        is a rename and takes over that label's code.
+        """
+        codes = dict(self.choice_codes or {})
+        if self.question_type != 'choice' or not self.choices:
+            return codes
+        
+        by_label = {label: int(code) for code, label in codes.items()}
+        next_code = max(map(int, codes), default=0) + 1
+        previous_choices = previous_choices or []
+        
+        for position, label in enumerate(self.choices):
+            if label in by_label:
+                continue
+            old_label = previous_choices[position] if position < len(previous_choices) else None
+            if old_label in by_label and old_label not in self.choices:
+                code = by_label.pop(old_label)
+            else:
+                code = next_code
+                next_code += 1
+            codes[str(code)] = label
+            by_label[label] = code
+        return codes
+    
+    def choice_label(self, code):
+        """Label of a stored choice code"""
+        return (self.choice_codes or {}).get(str(code))
+    
+    def get_choice_code(self, label):
+        """Code of a choice label, or None if the label never was a choice"""
+        for code, choice in (self.choice_codes or {}).items():
+            if choice == label:
+                return int(code)
+        return None
+    
     def save(self, *args, **kwargs):
         """Override save to auto-generate color mapping if not provided or if choices changed"""
         # Always regenerate color mapping for choice and range questions
@@ -137,6 +179,17 @@ class ReflectionQuestion(models.Model):
             self.color_mapping = self.generate_color_mapping()
         elif not self.color_mapping:
             self.color_mapping = self.generate_color_mapping()
+        
+        if self.question_type == 'choice':
+            previous_choices = None
+            if self.pk:
+                previous_choices = ReflectionQuestion.objects.filter(
+                    pk=self.pk
+                ).values_list('choices', flat=True).first()
+            self.choice_codes = self.generate_choice_codes(previous_choices)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'choices' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'choice_codes'}
         super().save(*args, **kwargs)
 
 
@@ -194,11 +247,10 @@ class ReflectionResponse(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(10)],
         help_text="Response for range-type questions"
     )
-    choice_response = models.CharField(
-        max_length=200, 
-        blank=True, 
+    choice_code = models.PositiveSmallIntegerField(
+        blank=True,
         null=True,
-        help_text="Response for multiple choice questions"
+        help_text="Response for multiple choice questions, as a code of question.choice_codes"
     )
     text_response = models.TextField(
         blank=True, 
@@ -225,6 +277,39 @@ class ReflectionResponse(models.Model):
     def __str__(self):
         return f"{self.daily_reflection.user.email} - {self.question.question_text[:50]} - {self.daily_reflection.date}"
     
+    # Columns of the answer a response contributes to the rollups
+    ANSWER_FIELDS = ('range_response', 'choice_code', 'number_response')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored answer, so saving the instance can update the rollups by the difference
+        if all(name in field_names for name in cls.ANSWER_FIELDS):
+            instance.loaded_answer = instance.answer
+        return instance
+    
+    @property
+    def answer(self):
+        """The (range, choice, number) tuple the rollups are built from"""
+        return self.range_response, self.choice_code, self.number_response
+    
+    @property
+    def choice_response(self):
+        """Label of the chosen option"""
+        if self.choice_code is None:
+            return None
+        return self.question.choice_label(self.choice_code)
+    
+    @choice_response.setter
+    def choice_response(self, label):
+        if not label:
+            self.choice_code = None
+            return
+        code = self.question.get_choice_code(label)
+        if code is None:
+            raise ValueError(f'"{label}" is not a choice of this question')
+        self.choice_code = code
+    
     def clean(self):
         """Validate that the response matches the question type"""
         from django.core.exceptions import ValidationError
@@ -245,3 +330,76 @@ class ReflectionResponse(models.Model):
         if self.question.question_type == 'choice' and self.choice_response:
             if self.choice_response not in self.question.choices:
                 raise ValidationError(f'Invalid choice. Must be one of: {", ".join(self.question.choices)}')
+
+
+class ReflectionStreak(models.Model):
+    """
+    Persisted reflection streak state for a user.
+    Maintained incrementally whenever a SelfReflection is created or deleted,
+    so reading the current streak is a single indexed lookup.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='reflection_streak'
+    )
+    
+    # Length of the run of consecutive days ending at last_reflection_date
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    last_reflection_date = models.DateField(blank=True, null=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Reflection Streak'
+        verbose_name_plural = 'Reflection Streaks'
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.current_streak} day(s)"
+
+
+class ReflectionRollup(models.Model):
+    """
+    Pre-aggregated responses of one question over a day or a month.
+    Maintained incrementally on reflection writes so long-range dashboards
+    can be built from a handful of rows instead of every response.
+    """
+    GRANULARITIES = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='reflection_rollups'
+    )
+    question = models.ForeignKey(
+        ReflectionQuestion,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+    granularity = models.CharField(max_length=5, choices=GRANULARITIES)
+    period_start = models.DateField()
+    
+    # Aggregates of range/number values in the period
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    min_value = models.FloatField(blank=True, null=True)
+    max_value = models.FloatField(blank=True, null=True)
+    sum_of_squares = models.FloatField(default=0)
+    
+    # Occurrences of each choice code (or each range value): {"1": 3, "2": 1}
+    choice_counts = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        verbose_name = 'Reflection Rollup'
+        verbose_name_plural = 'Reflection Rollups'
+        unique_together = ['user', 'question', 'granularity', 'period_start']
+        indexes = [
+            models.Index(fields=['user', 'granularity', 'period_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.question.question_text[:50]} - {self.granularity} {self.period_start}"
@@ -0,0 +1,145 @@
+"""
+Ahead-of-time computation of the reflection dashboards.
+
+precompute_dashboards() rebuilds the persisted streaks of every active user,
+then computes their default dashboard_stats, stats and insights payloads
+and stores them in the statistics cache, so the morning's first requests
+are cache hits. Users are sharded across a ProcessPoolExecutor and every
+worker reads its users in chunks; the workers only read from the database.
+
+Payloads are cached per day, so schedule it shortly after midnight UTC,
+e.g. from cron:
+
+    15 0 * * * cd /path/to/backend && python manage.py precompute_reflection_dashboards
+
+The cache backend has to be shared by all processes (Redis, Memcached,
+database or file based); the management command refuses to run with the
+local-memory or dummy cache, whose payloads no web process could serve.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.utils import timezone
+
+from .cache import refresh_payload
+from .models import SelfReflection
+from .streaks import rebuild_streaks
+from .views import (
+    SelfReflectionViewSet,
+    dashboard_cache_params,
+    insights_cache_params,
+    stats_cache_params,
+)
+
+# Users with a reflection in this many days are precomputed
+ACTIVE_DAYS = 30
+
+# Windows precomputed for each endpoint: the defaults the frontend requests
+DASHBOARD_DAYS = (30,)
+STATS_DAYS = 30
+INSIGHTS_DAYS = 365
+
+# Users loaded per query by a worker
+CHUNK_SIZE = 200
+
+# Shards per worker, so a shard of slow users does not hold up the whole run
+SHARDS_PER_WORKER = 4
+
+
+def active_user_ids(active_days=ACTIVE_DAYS):
+    """Ids of the users who wrote a reflection in the last `active_days` days"""
+    since = timezone.now().date() - timedelta(days=active_days)
+    return list(
+        SelfReflection.objects.filter(date__gte=since)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
+
+def precompute_user(user, end_date, dashboard_days=DASHBOARD_DAYS):
+    """Compute and store the cached payloads of one user; returns their number"""
+    viewset = SelfReflectionViewSet()
+
+    payloads = [
+        (
+            'dashboard_stats',
+            dashboard_cache_params(days, end_date),
+            lambda days=days: viewset._build_dashboard_stats(user, days, end_date, None, []),
+        )
+        for days in dashboard_days
+    ]
+    payloads.append((
+        'stats',
+        stats_cache_params(STATS_DAYS, end_date),
+        lambda: viewset._build_stats(user, STATS_DAYS, end_date, []),
+    ))
+    payloads.append((
+        'insights',
+        insights_cache_params(INSIGHTS_DAYS, end_date),
+        lambda: viewset._build_insights(user, INSIGHTS_DAYS, end_date),
+    ))
+
+    for name, params, build in payloads:
+        refresh_payload(name, user.pk, params, build)
+    return len(payloads)
+
+
+def precompute_shard(user_ids, end_date, dashboard_days=DASHBOARD_DAYS, chunk_size=CHUNK_SIZE):
+    """
+    Precompute a shard of users, reading them chunk_size at a time.
+    Returns (user_id, seconds, payload count, error or None) per user.
+    """
+    results = []
+    User = get_user_model()
+    for offset in range(0, len(user_ids), chunk_size):
+        users = User.objects.filter(pk__in=user_ids[offset:offset + chunk_size]).order_by('pk')
+        for user in users:
+            started = time.perf_counter()
+            try:
+                count, error = precompute_user(user, end_date, dashboard_days), None
+            except Exception as exc:
+                count, error = 0, f'{type(exc).__name__}: {exc}'
+            results.append((user.pk, time.perf_counter() - started, count, error))
+    return results
+
+
+def precompute_dashboards(user_ids=None, workers=None, dashboard_days=DASHBOARD_DAYS,
+                          chunk_size=CHUNK_SIZE, active_days=ACTIVE_DAYS):
+    """
+    Precompute the dashboards of `user_ids` (default: all active users) and
+    yield (user_id, seconds, payload count, error or None) as users finish.
+    workers=1 runs in the current process.
+    """
+    end_date = timezone.now().date()
+    if user_ids is None:
+        user_ids = active_user_ids(active_days)
+    user_ids = list(user_ids)
+
+    # Streaks are written once up front so the workers never contend for database writes
+    for offset in range(0, len(user_ids), chunk_size):
+        rebuild_streaks(user_ids[offset:offset + chunk_size])
+
+    workers = min(workers or os.cpu_count() or 1, max(len(user_ids), 1))
+
+    if workers == 1:
+        yield from precompute_shard(user_ids, end_date, dashboard_days, chunk_size)
+        return
+
+    shard_count = min(workers * SHARDS_PER_WORKER, len(user_ids))
+    shards = [user_ids[index::shard_count] for index in range(shard_count)]
+
+    # Forked workers must open their own database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        futures = [
+            executor.submit(precompute_shard, shard, end_date, dashboard_days, chunk_size)
+            for shard in shards
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
@@ -0,0 +1,300 @@
+"""
+Incrementally maintained daily and monthly rollups of reflection responses.
+
+Every range, choice and number response contributes to one ReflectionRollup
+row per granularity. Writes apply the difference between the old and the new
+answer to those rows, so long windows can be aggregated from a few monthly
+rows instead of rescanning every response. The daily rows hold the per-day
+answers the dashboard charts plot.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q, Min, Max
+
+from .models import ReflectionResponse, ReflectionRollup
+
+GRANULARITIES = ('day', 'month')
+
+# Windows of at least this many days are aggregated from rollups
+ROLLUP_MIN_DAYS = 90
+
+VALUE_FIELDS = {
+    'range': 'range_response',
+    'number': 'number_response',
+}
+
+
+def period_start(date, granularity):
+    """First day of the period of `granularity` containing `date`"""
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def period_end(start, granularity):
+    """Last day of the period of `granularity` starting at `start`"""
+    if granularity == 'month':
+        return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+    return start
+
+
+def contribution(question_type, answer):
+    """
+    What a response contributes to its rollups as (numeric value, count key),
+    or None when it does not count. `answer` is a (range, choice, number) tuple.
+    """
+    if answer is None:
+        return None
+    range_value, choice_value, number_value = answer
+    if question_type == 'range' and range_value is not None:
+        return float(range_value), str(range_value)
+    if question_type == 'number' and number_value is not None:
+        return float(number_value), None
+    if question_type == 'choice' and choice_value is not None:
+        return None, str(choice_value)
+    return None
+
+
+def _apply(rollup, item, sign):
+    """Add (sign=1) or remove (sign=-1) one contribution; return True if min/max went stale"""
+    value, key = item
+    rollup.count += sign
+    stale = False
+
+    if value is not None:
+        rollup.total += sign * value
+        rollup.sum_of_squares += sign * value * value
+        if sign > 0:
+            if rollup.min_value is None or value < rollup.min_value:
+                rollup.min_value = value
+            if rollup.max_value is None or value > rollup.max_value:
+                rollup.max_value = value
+        elif value in (rollup.min_value, rollup.max_value):
+            stale = True
+
+    if key is not None:
+        counts = rollup.choice_counts
+        counts[key] = counts.get(key, 0) + sign
+        if counts[key] <= 0:
+            del counts[key]
+
+    return stale
+
+
+def _refresh_bounds(rollup, user_id, question_type):
+    """Recompute min/max of a rollup after its extreme value was removed"""
+    field = VALUE_FIELDS[question_type]
+    bounds = ReflectionResponse.objects.filter(
+        daily_reflection__user_id=user_id,
+        daily_reflection__date__range=(
+            rollup.period_start, period_end(rollup.period_start, rollup.granularity)
+        ),
+        question_id=rollup.question_id,
+        **{f'{field}__isnull': False}
+    ).aggregate(low=Min(field), high=Max(field))
+    rollup.min_value = bounds['low']
+    rollup.max_value = bounds['high']
+
+
+def apply_response_changes(user_id, changes):
+    """
+    Apply response writes to the rollups of a user.
+
+    `changes` is an iterable of (question_id, question_type, date, old, new)
+    where old/new are (range, choice, number) tuples or None for a response
+    that did not exist before or no longer exists.
+    """
+    deltas = defaultdict(list)
+    question_types = {}
+    for question_id, question_type, date, old, new in changes:
+        old_item = contribution(question_type, old)
+        new_item = contribution(question_type, new)
+        if old_item == new_item:
+            continue
+        question_types[question_id] = question_type
+        for granularity in GRANULARITIES:
+            key = (question_id, granularity, period_start(date, granularity))
+            if old_item is not None:
+                deltas[key].append((old_item, -1))
+            if new_item is not None:
+                deltas[key].append((new_item, 1))
+
+    if not deltas:
+        return
+
+    periods = defaultdict(set)
+    for question_id, granularity, start in deltas:
+        periods[granularity].add(start)
+    period_filter = Q()
+    for granularity, starts in periods.items():
+        period_filter |= Q(granularity=granularity, period_start__in=starts)
+
+    with transaction.atomic():
+        existing = {
+            (rollup.question_id, rollup.granularity, rollup.period_start): rollup
+            for rollup in ReflectionRollup.objects.select_for_update().filter(
+                period_filter,
+                user_id=user_id,
+                question_id__in=question_types,
+            )
+        }
+
+        to_create, to_update, to_delete = [], [], []
+        for key, items in deltas.items():
+            question_id, granularity, start = key
+            rollup = existing.get(key)
+            is_new = rollup is None
+            if is_new:
+                rollup = ReflectionRollup(
+                    user_id=user_id,
+                    question_id=question_id,
+                    granularity=granularity,
+                    period_start=start,
+                    choice_counts={},
+                )
+
+            stale = False
+            for item, sign in items:
+                stale = _apply(rollup, item, sign) or stale
+
+            if rollup.count <= 0:
+                if not is_new:
+                    to_delete.append(rollup.pk)
+                continue
+            if stale:
+                _refresh_bounds(rollup, user_id, question_types[question_id])
+            (to_create if is_new else to_update).append(rollup)
+
+        if to_create:
+            ReflectionRollup.objects.bulk_create(to_create)
+        if to_update:
+            ReflectionRollup.objects.bulk_update(
+                to_update,
+                ['count', 'total', 'min_value', 'max_value', 'sum_of_squares', 'choice_counts']
+            )
+        if to_delete:
+            ReflectionRollup.objects.filter(pk__in=to_delete).delete()
+
+
+def rebuild_rollups(user_id=None):
+    """Recompute all rollups (of one user or everyone) from a single response scan"""
+    responses = ReflectionResponse.objects.all()
+    rollups = ReflectionRollup.objects.all()
+    if user_id is not None:
+        responses = responses.filter(daily_reflection__user_id=user_id)
+        rollups = rollups.filter(user_id=user_id)
+
+    rows = responses.values_list(
+        'daily_reflection__user_id',
+        'question_id',
+        'question__question_type',
+        'daily_reflection__date',
+        'range_response',
+        'choice_code',
+        'number_response',
+    ).iterator(chunk_size=5000)
+
+    buckets = {}
+    for row_user_id, question_id, question_type, date, *answer in rows:
+        item = contribution(question_type, tuple(answer))
+        if item is None:
+            continue
+        for granularity in GRANULARITIES:
+            key = (row_user_id, question_id, granularity, period_start(date, granularity))
+            rollup = buckets.get(key)
+            if rollup is None:
+                rollup = buckets[key] = ReflectionRollup(
+                    user_id=row_user_id,
+                    question_id=question_id,
+                    granularity=granularity,
+                    period_start=key[3],
+                    choice_counts={},
+                )
+            _apply(rollup, item, 1)
+
+    with transaction.atomic():
+        rollups.delete()
+        ReflectionRollup.objects.bulk_create(buckets.values(), batch_size=1000)
+    return len(buckets)
+
+
+def full_months(start_date, end_date):
+    """(first, last) month starts fully covered by [start_date, end_date], or None"""
+    first = period_start(start_date, 'month')
+    if first < start_date:
+        first = period_end(first, 'month') + timedelta(days=1)
+    last = period_start(end_date, 'month')
+    if period_end(last, 'month') > end_date:
+        last = period_start(last - timedelta(days=1), 'month')
+    if first > last:
+        return None
+    return first, last
+
+
+def load_window_rollups(user, question_ids, start_date, end_date):
+    """
+    Load the rollups needed to describe a window with a single query.
+
+    Returns (answers, summaries):
+    - answers: question_id -> {date: (range, choice, number)} rebuilt from the
+      daily rows, for the per-day series
+    - summaries: question_id -> aggregate over all responses on or after
+      start_date, composed from monthly rows for fully covered months and
+      daily rows for the remaining days
+    """
+    months = full_months(start_date, end_date)
+    rollup_filter = Q(granularity='day', period_start__gte=start_date)
+    if months:
+        rollup_filter |= Q(granularity='month', period_start__range=months)
+
+    rows = ReflectionRollup.objects.filter(
+        rollup_filter,
+        user=user,
+        question_id__in=question_ids,
+    ).values_list(
+        'question_id', 'question__question_type', 'granularity', 'period_start',
+        'count', 'total', 'min_value', 'max_value', 'sum_of_squares', 'choice_counts',
+    )
+
+    answers = defaultdict(dict)
+    summaries = defaultdict(empty_summary)
+    months_end = period_end(months[1], 'month') if months else None
+    for (question_id, question_type, granularity, start, count, total,
+         low, high, sum_of_squares, choice_counts) in rows:
+        if granularity == 'day':
+            answers[question_id][start] = _answer_from_daily(question_type, total, choice_counts)
+            if months and months[0] <= start <= months_end:
+                continue
+        merge_summary(summaries[question_id], count, total, low, high, sum_of_squares, choice_counts)
+
+    return answers, summaries
+
+
+def _answer_from_daily(question_type, total, choice_counts):
+    """Turn a daily rollup (a single response) back into a (range, choice, number) tuple"""
+    if question_type == 'range':
+        return int(total), None, None
+    if question_type == 'number':
+        return None, None, total
+    code = next(iter(choice_counts), None)
+    return None, int(code) if code is not None else None, None
+
+
+def empty_summary():
+    return {'count': 0, 'total': 0, 'min': None, 'max': None, 'sum_of_squares': 0, 'counts': {}}
+
+
+def merge_summary(summary, count, total, low, high, sum_of_squares, choice_counts):
+    """Fold one rollup row into a running summary"""
+    summary['count'] += count
+    summary['total'] += total
+    summary['sum_of_squares'] += sum_of_squares
+    if low is not None and (summary['min'] is None or low < summary['min']):
+        summary['min'] = low
+    if high is not None and (summary['max'] is None or high > summary['max']):
+        summary['max'] = high
+    for key, value in choice_counts.items():
+        summary['counts'][key] = summary['counts'].get(key, 0) + value
@@ -1,8 +1,16 @@
+from collections import defaultdict
+
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+
+from backend.fieldsets import SparseFieldsetSerializerMixin, project
+
 from .models import ReflectionQuestion, SelfReflection, ReflectionResponse
+from .catalog import get_active_questions, get_question_catalog
+from .writes import bulk_save_reflections
 
 
-class ReflectionQuestionSerializer(serializers.ModelSerializer):
+class ReflectionQuestionSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Serializer for ReflectionQuestion model"""
     author_id = serializers.PrimaryKeyRelatedField(source='author', read_only=True)
     author_email = serializers.EmailField(source='author.email', read_only=True)
@@ -55,7 +63,10 @@ class ReflectionResponseSerializer(serializers.ModelSerializer):
     """Serializer for individual reflection responses"""
     question_text = serializers.CharField(source='question.question_text', read_only=True)
     question_type = serializers.CharField(source='question.question_type', read_only=True)
-    question_id = serializers.IntegerField(source='question.id', read_only=True)
+    question_id = serializers.IntegerField(read_only=True)
+    
+    # The choice_response property reads the label from question.choice_codes
+    sparse_field_dependencies = {'choice_response': ('choice_code', 'question')}
     
     class Meta:
         model = ReflectionResponse
@@ -90,9 +101,8 @@ class ReflectionResponseCreateSerializer(serializers.Serializer):
         if request is None or user is None or not user.is_authenticated:
             raise serializers.ValidationError({'detail': 'Authentication required to answer questions.'})
         
-        try:
-            question = ReflectionQuestion.objects.get(id=question_id, is_active=True, author=user)
-        except ReflectionQuestion.DoesNotExist:
+        question = self._active_questions(user).get(question_id)
+        if question is None:
             raise serializers.ValidationError({'question_id': 'Invalid or inactive question.'})
         
         # Validate based on question type
@@ -124,9 +134,20 @@ class ReflectionResponseCreateSerializer(serializers.Serializer):
         
         data['question'] = question
         return data
+    
+    def _active_questions(self, user):
+        """
+        Active questions of the user by id, from the cached question catalog
+        and shared by all nested serializers through the context.
+        """
+        questions = self.context.get('active_questions')
+        if questions is None:
+            questions = {question.id: question for question in get_active_questions(user)}
+            self.context['active_questions'] = questions
+        return questions
 
 
-class SelfReflectionSerializer(serializers.ModelSerializer):
+class SelfReflectionSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Serializer for SelfReflection with nested responses"""
     responses = ReflectionResponseSerializer(many=True, read_only=True)
     user_email = serializers.EmailField(source='user.email', read_only=True)
@@ -160,56 +181,121 @@ class SelfReflectionCreateUpdateSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         """Create a new daily reflection with responses"""
-        responses_data = validated_data.pop('responses')
         user = self.context['request'].user
-        date = validated_data.get('date')
-        notes = validated_data.get('notes', '')
-        
-        # Get or create the self reflection
-        daily_reflection, created = SelfReflection.objects.get_or_create(
-            user=user,
-            date=date,
-            defaults={'notes': notes}
-        )
-        
-        if not created:
-            daily_reflection.notes = notes
-            daily_reflection.save()
-        
-        # Create or update responses
-        for response_data in responses_data:
-            question = response_data.pop('question')
-            
-            # Remove None values to avoid overwriting existing data unnecessarily
-            clean_data = {k: v for k, v in response_data.items() if v is not None and k != 'question_id'}
-            
-            ReflectionResponse.objects.update_or_create(
-                daily_reflection=daily_reflection,
-                question=question,
-                defaults=clean_data
-            )
-        
-        return daily_reflection
+        return self._with_responses(user, bulk_save_reflections(user, [validated_data])[0])
     
     def update(self, instance, validated_data):
         """Update an existing daily reflection"""
-        responses_data = validated_data.pop('responses')
-        
-        # Update notes
-        instance.notes = validated_data.get('notes', instance.notes)
-        instance.save()
-        
-        # Update or create responses
-        for response_data in responses_data:
-            question = response_data.pop('question')
-            
-            # Remove None values
-            clean_data = {k: v for k, v in response_data.items() if v is not None and k != 'question_id'}
-            
-            ReflectionResponse.objects.update_or_create(
-                daily_reflection=instance,
-                question=question,
-                defaults=clean_data
-            )
-        
-        return instance
+        user = self.context['request'].user
+        return self._with_responses(user, bulk_save_reflections(user, [{
+            'date': instance.date,
+            'notes': validated_data.get('notes', instance.notes),
+            'responses': validated_data.get('responses', []),
+        }])[0])
+    
+    def _with_responses(self, user, reflection):
+        """
+        The saved reflection with its responses loaded in one query, their
+        questions (for the choice labels) taken from the cached catalog.
+        """
+        questions = {question.id: question for question in get_question_catalog(user)}
+        prefetch_related_objects([reflection], 'responses')
+        for response in reflection.responses.all():
+            response.question = questions[response.question_id]
+        return reflection
+
+
+# Fast read path: the same JSON as SelfReflectionSerializer built from values
+# rows, without model instances or per-field source lookups
+
+REFLECTION_COLUMNS = ('id', 'user__email', 'date', 'notes', 'created_at', 'updated_at')
+
+RESPONSE_COLUMNS = (
+    'id',
+    'daily_reflection_id',
+    'question_id',
+    'question__question_text',
+    'question__question_type',
+    'range_response',
+    'choice_code',
+    'text_response',
+    'number_response',
+    'created_at',
+    'updated_at',
+)
+
+# Formats dates and datetimes exactly like the serializer fields do
+_date_field = serializers.DateField()
+_datetime_field = serializers.DateTimeField()
+
+
+def reflection_rows(reflections):
+    """The rows serialize_reflection_rows needs, in the order of the queryset"""
+    return reflections.values_list(*REFLECTION_COLUMNS)
+
+
+def serialize_reflection_rows(rows, shape=None):
+    """
+    Serialize reflection_rows() output with its responses, fetched by one
+    joined values query, into the exact SelfReflectionSerializer output.
+    `shape` is a fieldset_shape() of SelfReflectionSerializer to reduce it to.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    datetime_repr = _datetime_field.to_representation
+
+    response_rows = ReflectionResponse.objects.none()
+    if shape is None or 'responses' in shape:
+        response_rows = ReflectionResponse.objects.filter(
+            daily_reflection_id__in=[row[0] for row in rows]
+        ).order_by('id').values_list(*RESPONSE_COLUMNS)
+
+    choice_labels = {}
+    responses = defaultdict(list)
+    for (response_id, reflection_id, question_id, question_text, question_type, range_value,
+         choice_code, text_value, number_value, created_at, updated_at) in response_rows:
+        responses[reflection_id].append({
+            'id': response_id,
+            'question_id': question_id,
+            'question_text': question_text,
+            'question_type': question_type,
+            'range_response': range_value,
+            'choice_response': (question_id, choice_code) if choice_code is not None else None,
+            'text_response': text_value,
+            'number_response': number_value,
+            'created_at': datetime_repr(created_at),
+            'updated_at': datetime_repr(updated_at),
+        })
+        if choice_code is not None:
+            choice_labels[question_id] = None
+
+    if choice_labels and (shape is None or 'choice_response' in (shape['responses'] or {'choice_response': None})):
+        # Labels of the few questions with choice answers, instead of a JSON column per row
+        choice_labels = dict(
+            ReflectionQuestion.objects.filter(id__in=choice_labels).values_list('id', 'choice_codes')
+        )
+        for reflection_responses in responses.values():
+            for response in reflection_responses:
+                if response['choice_response'] is not None:
+                    question_id, code = response['choice_response']
+                    response['choice_response'] = (choice_labels[question_id] or {}).get(str(code))
+
+    data = [
+        {
+            'id': reflection_id,
+            'user_email': email,
+            'date': _date_field.to_representation(date),
+            'notes': notes,
+            'responses': responses.get(reflection_id, []),
+            'created_at': datetime_repr(created_at),
+            'updated_at': datetime_repr(updated_at),
+        }
+        for reflection_id, email, date, notes, created_at, updated_at in rows
+    ]
+    return data if shape is None else project(data, shape)
+
+
+def serialize_reflections(reflections, shape=None):
+    """SelfReflectionSerializer(reflections, many=True).data from two values queries"""
+    return serialize_reflection_rows(reflection_rows(reflections), shape)
@@ -0,0 +1,185 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from diary.models import DiaryEntry, DiaryTag
+
+from .cache import (
+    bump_data_version_on_commit,
+    bump_diary_version_on_commit,
+    bump_structure_version_on_commit,
+)
+from .catalog import invalidate_question_catalog_on_commit
+from .models import ReflectionQuestion, SelfReflection, ReflectionResponse
+from .rollups import apply_response_changes
+from .streaks import record_reflection_date, forget_reflection_dates
+
+
+def _deleted_with(origin, model):
+    """Whether a delete was started on `model`, through an instance or a queryset"""
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(post_save, sender=SelfReflection)
+def update_streak_on_save(sender, instance, created, raw=False, **kwargs):
+    """Extend the persisted streak when a new reflection is created"""
+    if created and not raw:
+        record_reflection_date(instance.user_id, instance.date)
+
+
+@receiver(pre_delete, sender=SelfReflection)
+def update_streak_on_delete(sender, instance, origin=None, **kwargs):
+    """Update the persisted streaks once per delete, after it commits"""
+    # Deleted users take their streak with them
+    if _deleted_with(origin, get_user_model()):
+        return
+    # All reflections of one delete call share its origin
+    batch = origin if origin is not None else instance
+    user_dates = getattr(batch, 'deleted_reflection_dates', None)
+    if user_dates is None:
+        user_dates = batch.deleted_reflection_dates = []
+        transaction.on_commit(lambda: forget_reflection_dates(user_dates))
+    user_dates.append((instance.user_id, instance.date))
+
+
+@receiver(pre_save, sender=ReflectionResponse)
+def load_stored_answer(sender, instance, raw=False, **kwargs):
+    """Read the stored answer of responses that were not loaded with it, for update_rollups_on_save"""
+    if raw or instance._state.adding or hasattr(instance, 'loaded_answer'):
+        return
+    instance.loaded_answer = ReflectionResponse.objects.filter(
+        pk=instance.pk
+    ).values_list(*ReflectionResponse.ANSWER_FIELDS).first()
+
+
+@receiver(post_save, sender=ReflectionResponse)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Apply a response saved through the ORM (admin, scripts) to the rollups.
+    The API writes with bulk_save_reflections, which sends no signals and
+    updates the rollups itself.
+    """
+    if raw:
+        return
+    old = None if created else instance.loaded_answer
+    reflection = instance.daily_reflection
+    apply_response_changes(reflection.user_id, [(
+        instance.question_id,
+        instance.question.question_type,
+        reflection.date,
+        old,
+        instance.answer,
+    )])
+    instance.loaded_answer = instance.answer
+
+
+@receiver(pre_delete, sender=SelfReflection)
+def collect_responses_on_reflection_delete(sender, instance, origin=None, **kwargs):
+    """Load the answers of a reflection about to be deleted, for update_rollups_on_reflection_delete"""
+    # Deleted users and questions take their rollups with them
+    if not _deleted_with(origin, SelfReflection):
+        return
+    rows = instance.responses.values_list(
+        'question_id', 'question__question_type', *ReflectionResponse.ANSWER_FIELDS
+    )
+    instance.deleted_answers = [
+        (question_id, question_type, instance.date, tuple(answer), None)
+        for question_id, question_type, *answer in rows
+    ]
+
+
+@receiver(post_delete, sender=SelfReflection)
+def update_rollups_on_reflection_delete(sender, instance, **kwargs):
+    """Remove all responses of a deleted reflection from the rollups at once"""
+    # Applied once the responses are gone, so refreshed min/max values leave them out
+    changes = getattr(instance, 'deleted_answers', None)
+    if changes:
+        apply_response_changes(instance.user_id, changes)
+
+
+@receiver(post_delete, sender=ReflectionResponse)
+def update_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    """Remove a response deleted on its own from the rollups"""
+    if not _deleted_with(origin, ReflectionResponse):
+        return
+    reflection = instance.daily_reflection
+    apply_response_changes(reflection.user_id, [(
+        instance.question_id,
+        instance.question.question_type,
+        reflection.date,
+        instance.answer,
+        None,
+    )])
+
+
+@receiver([post_save, post_delete], sender=SelfReflection)
+def invalidate_cache_on_reflection_write(sender, instance, **kwargs):
+    bump_data_version_on_commit(instance.user_id)
+
+
+def _response_user_id(instance, origin=None):
+    """
+    The user of a saved or deleted response, or None when it was deleted along
+    with its question, reflection or user, whose own receivers bump the versions.
+    """
+    if origin is None or isinstance(origin, ReflectionResponse):
+        return instance.daily_reflection.user_id
+    if any(_deleted_with(origin, model) for model in (ReflectionQuestion, SelfReflection, get_user_model())):
+        return None
+    # A queryset of responses: look each reflection's user up once per delete
+    user_ids = getattr(origin, 'reflection_user_ids', None)
+    if user_ids is None:
+        user_ids = origin.reflection_user_ids = {}
+    if instance.daily_reflection_id not in user_ids:
+        user_ids[instance.daily_reflection_id] = instance.daily_reflection.user_id
+    return user_ids[instance.daily_reflection_id]
+
+
+@receiver([post_save, post_delete], sender=ReflectionResponse)
+def invalidate_cache_on_response_write(sender, instance, origin=None, **kwargs):
+    user_id = _response_user_id(instance, origin)
+    if user_id is not None:
+        bump_data_version_on_commit(user_id)
+
+
+@receiver([post_save, post_delete], sender=ReflectionQuestion)
+def invalidate_cache_on_question_write(sender, instance, **kwargs):
+    bump_data_version_on_commit(instance.author_id)
+
+
+@receiver(post_delete, sender=SelfReflection)
+@receiver(post_delete, sender=ReflectionResponse)
+def invalidate_deltas_on_delete(sender, instance, origin=None, **kwargs):
+    """Deletes leave no updated_at trail, so clients must refetch in full"""
+    user_id = instance.user_id if sender is SelfReflection else _response_user_id(instance, origin)
+    if user_id is not None:
+        bump_structure_version_on_commit(user_id)
+
+
+@receiver([post_save, post_delete], sender=ReflectionQuestion)
+def invalidate_deltas_on_question_write(sender, instance, **kwargs):
+    bump_structure_version_on_commit(instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=ReflectionQuestion)
+def invalidate_catalog_on_question_write(sender, instance, **kwargs):
+    invalidate_question_catalog_on_commit(instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=DiaryEntry)
+def invalidate_tag_correlations_on_entry_write(sender, instance, **kwargs):
+    bump_diary_version_on_commit(instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=DiaryTag)
+def invalidate_tag_correlations_on_tag_write(sender, instance, **kwargs):
+    bump_diary_version_on_commit(instance.author_id)
+
+
+@receiver(m2m_changed, sender=DiaryEntry.tags.through)
+def invalidate_tag_correlations_on_tagging(sender, instance, action, **kwargs):
+    """Tags added to or removed from entries, from either side of the relation"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_diary_version_on_commit(instance.author_id)
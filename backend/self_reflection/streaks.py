@@ -0,0 +1,180 @@
+"""
+Incremental reflection streak tracking.
+
+The streak of a user is stored in ReflectionStreak as the run of consecutive
+days ending at the last reflected date. Creating a reflection that extends
+the run is a constant-time update; anything that can split or join runs
+(back-filling an older day, deleting a day) rebuilds the state from a single
+ordered scan of the user's reflection dates. Deletes are rebuilt once per
+delete after it commits, and not at all for days before the current run
+when that run is also the longest.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SelfReflection, ReflectionStreak
+
+
+def compute_streak_state(dates):
+    """
+    Compute (current_streak, longest_streak, last_reflection_date) from an
+    ascending iterable of distinct dates.
+    """
+    current = longest = 0
+    previous = None
+    for date in dates:
+        if previous is not None and date - previous == timedelta(days=1):
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        previous = date
+    return current, longest, previous
+
+
+def rebuild_streak(user_id):
+    """Rebuild the streak state of a user from one ordered date scan"""
+    dates = SelfReflection.objects.filter(
+        user_id=user_id
+    ).order_by('date').values_list('date', flat=True)
+    current, longest, last_date = compute_streak_state(dates)
+    
+    streak, _ = ReflectionStreak.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'current_streak': current,
+            'longest_streak': longest,
+            'last_reflection_date': last_date,
+        }
+    )
+    return streak
+
+
+def rebuild_streaks(user_ids=None):
+    """
+    Rebuild the streak state of many users (everyone by default) from one
+    ordered scan and one upsert. Stored streaks of users without reflections
+    are reset. Returns (users rebuilt, streaks reset).
+    """
+    rows = SelfReflection.objects.all()
+    stale = ReflectionStreak.objects.exclude(
+        user_id__in=SelfReflection.objects.values('user_id')
+    ).filter(last_reflection_date__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+        stale = stale.filter(user_id__in=user_ids)
+    rows = rows.order_by('user_id', 'date').values_list('user_id', 'date').iterator(chunk_size=5000)
+    
+    streaks = []
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        current, longest, last_date = compute_streak_state(date for _, date in user_rows)
+        streaks.append(ReflectionStreak(
+            user_id=user_id,
+            current_streak=current,
+            longest_streak=longest,
+            last_reflection_date=last_date,
+        ))
+    
+    with transaction.atomic():
+        ReflectionStreak.objects.bulk_create(
+            streaks,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['current_streak', 'longest_streak', 'last_reflection_date', 'updated_at'],
+        )
+        reset_count = stale.update(current_streak=0, longest_streak=0, last_reflection_date=None)
+    return len(streaks), reset_count
+
+
+def record_reflection_dates(user_id, dates):
+    """Update the streak state after reflections for `dates` were created"""
+    dates = sorted(dates)
+    with transaction.atomic():
+        streak = ReflectionStreak.objects.select_for_update().filter(user_id=user_id).first()
+        if streak is None:
+            return rebuild_streak(user_id)
+        
+        last_date = streak.last_reflection_date
+        if last_date is not None and dates[0] < last_date:
+            # An older day was filled in, which may join two runs
+            return rebuild_streak(user_id)
+        
+        current, longest = streak.current_streak, streak.longest_streak
+        for date in dates:
+            if date == last_date:
+                continue
+            if last_date is not None and date - last_date == timedelta(days=1):
+                current += 1
+            else:
+                current = 1
+            longest = max(longest, current)
+            last_date = date
+        
+        if last_date == streak.last_reflection_date:
+            return streak
+        streak.current_streak = current
+        streak.longest_streak = longest
+        streak.last_reflection_date = last_date
+        streak.save(update_fields=['current_streak', 'longest_streak', 'last_reflection_date', 'updated_at'])
+        return streak
+
+
+def record_reflection_date(user_id, date):
+    """Update the streak state after a reflection for `date` was created"""
+    return record_reflection_dates(user_id, [date])
+
+
+def _survives_delete(streak, date):
+    """
+    Whether deleting the reflection of `date` leaves `streak` as it is: the
+    date lies before the current run, which is also the longest one.
+    """
+    if streak.last_reflection_date is None or streak.longest_streak != streak.current_streak:
+        return False
+    return date <= streak.last_reflection_date - timedelta(days=streak.current_streak)
+
+
+def forget_reflection_dates(user_dates):
+    """
+    Update the streak state after the reflections of (user_id, date) pairs
+    were deleted, with one rebuild for all the users whose streak may change.
+    """
+    user_ids = {user_id for user_id, _ in user_dates}
+    # The rows may already be gone when the users themselves were deleted
+    stored = {streak.user_id: streak for streak in ReflectionStreak.objects.filter(user_id__in=user_ids)}
+    stale = {
+        user_id for user_id, date in user_dates
+        if user_id in stored and not _survives_delete(stored[user_id], date)
+    }
+    if stale:
+        rebuild_streaks(stale)
+
+
+def get_streak(user):
+    """Return the user's streak state, building it on first access"""
+    streak = ReflectionStreak.objects.filter(user=user).first()
+    if streak is None:
+        streak = rebuild_streak(user.pk)
+    return streak
+
+
+def get_current_streak(user, today=None, streak=None):
+    """Number of consecutive days with reflections ending today"""
+    today = today or timezone.now().date()
+    streak = streak or get_streak(user)
+    
+    if streak.last_reflection_date == today:
+        return streak.current_streak
+    if streak.last_reflection_date is None or streak.last_reflection_date < today:
+        return 0
+    
+    # Reflections dated in the future: count the run ending today directly
+    dates = SelfReflection.objects.filter(
+        user=user, date__lte=today
+    ).order_by('date').values_list('date', flat=True)
+    current, _, last_date = compute_streak_state(dates)
+    return current if last_date == today else 0
@@ -1,3 +1,905 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.fieldsets import fieldset_shape, parse_fieldset
+
+from . import checks, rollups, streaks
+from .analytics import (
+    METRICS, ResponseMatrix, compute_insights, compute_metrics, correlation_matrices, rolling_average,
+)
+from .cache import get_data_version
+from .catalog import get_question_catalog
+from .downsampling import calendar_buckets, downsample_line_chart, lttb_indices
+from .models import ReflectionQuestion, SelfReflection, ReflectionResponse, ReflectionStreak, ReflectionRollup
+from .serializers import SelfReflectionSerializer, serialize_reflections
+from .views import MAX_DASHBOARD_DAYS
+
+
+class ReflectionTestCase(TestCase):
+    """A user with an authenticated API client, starting from an empty cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='reflector@example.com', password='secret', first_name='Ink', last_name='Reflector'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.now().date()
+        # The versioned keys are only bumped on commit, which a TestCase never reaches
+        cache.clear()
+
+
+class ReflectionStreakTests(ReflectionTestCase):
+    """The persisted streak follows reflection creates and deletes"""
+
+    def reflect(self, days_ago):
+        return SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+
+    def assertStreak(self, current, longest, last_days_ago):
+        streak = ReflectionStreak.objects.get(user=self.user)
+        self.assertEqual(
+            (streak.current_streak, streak.longest_streak, streak.last_reflection_date),
+            (current, longest, self.today - timedelta(days=last_days_ago)),
+        )
+
+    def test_consecutive_days_extend_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self.reflect(days_ago)
+        self.assertStreak(3, 3, 0)
+
+        response = self.client.get('/api/self-reflection/reflections/streak/')
+        self.assertEqual(response.data['current_streak'], 3)
+        self.assertEqual(response.data['longest_streak'], 3)
+
+    def test_extending_the_streak_does_not_rescan_dates(self):
+        self.reflect(1)
+
+        # The insert, then a savepoint pair around locking and updating the streak row
+        with self.assertNumQueries(5):
+            self.reflect(0)
+        self.assertStreak(2, 2, 0)
+
+    def test_gap_resets_current_streak(self):
+        for days_ago in (5, 4, 3, 0):
+            self.reflect(days_ago)
+        self.assertStreak(1, 3, 0)
+
+        response = self.client.get('/api/self-reflection/reflections/streak/')
+        self.assertEqual(response.data['current_streak'], 1)
+
+    def test_back_fill_joins_runs(self):
+        for days_ago in (3, 1, 0):
+            self.reflect(days_ago)
+        self.assertStreak(2, 2, 0)
+
+        self.reflect(2)
+        self.assertStreak(4, 4, 0)
+
+    def test_delete_splits_runs(self):
+        for days_ago in (3, 2, 1, 0):
+            self.reflect(days_ago)
+        middle = SelfReflection.objects.get(user=self.user, date=self.today - timedelta(days=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/self-reflection/reflections/{middle.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertStreak(1, 2, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SelfReflection.objects.filter(user=self.user, date=self.today).delete()
+        self.assertStreak(2, 2, 2)
+
+        response = self.client.get('/api/self-reflection/reflections/streak/')
+        self.assertEqual(response.data['current_streak'], 0)
+
+    def test_queryset_delete_rebuilds_once(self):
+        for days_ago in (5, 4, 3, 2, 1, 0):
+            self.reflect(days_ago)
+
+        with mock.patch.object(streaks, 'rebuild_streaks', wraps=streaks.rebuild_streaks) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                SelfReflection.objects.filter(user=self.user, date__gte=self.today - timedelta(days=2)).delete()
+        rebuild.assert_called_once_with({self.user.id})
+        self.assertStreak(3, 3, 3)
+
+    def test_deleting_before_the_longest_current_run_skips_the_rebuild(self):
+        for days_ago in (5, 2, 1, 0):
+            self.reflect(days_ago)
+        old = SelfReflection.objects.get(user=self.user, date=self.today - timedelta(days=5))
+
+        with mock.patch.object(streaks, 'rebuild_streaks') as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                old.delete()
+        rebuild.assert_not_called()
+        self.assertStreak(3, 3, 0)
+
+
+class DashboardQueryCountTests(ReflectionTestCase):
+    """dashboard_stats runs a fixed number of queries, however many questions and days it covers"""
+
+    # Question catalog, reflection count, streak and the window's responses (or rollups)
+    DASHBOARD_QUERIES = 4
+
+    ANSWERS = {
+        'range': {'range_response': 6},
+        'choice': {'choice_response': 'Happy'},
+        'number': {'number_response': 7.5},
+        'text': {'text_response': 'Fine'},
+    }
+
+    def create_questions(self, count):
+        types = list(self.ANSWERS)
+        questions = [
+            ReflectionQuestion.objects.create(
+                author=self.user, question_text=f'Question {index}', question_type=types[index % 4],
+                choices=['Happy', 'Sad'] if types[index % 4] == 'choice' else None, order=index,
+            )
+            for index in range(count)
+        ]
+        cache.clear()
+        response = self.client.post('/api/self-reflection/reflections/bulk_create/', [
+            {
+                'date': (self.today - timedelta(days=days_ago)).isoformat(),
+                'responses': [
+                    {'question_id': question.id, **self.ANSWERS[question.question_type]} for question in questions
+                ],
+            }
+            for days_ago in range(120)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def assertDashboardQueries(self, days):
+        for response_format in ('rows', 'columnar'):
+            cache.clear()
+            with self.assertNumQueries(self.DASHBOARD_QUERIES):
+                response = self.client.get(
+                    f'/api/self-reflection/reflections/dashboard_stats/?days={days}&format={response_format}'
+                )
+            self.assertEqual(response.status_code, 200)
+
+    def test_query_count_does_not_depend_on_questions(self):
+        self.create_questions(3)
+        self.assertDashboardQueries(30)
+
+        self.create_questions(12)
+        self.assertDashboardQueries(30)
+        response = self.client.get('/api/self-reflection/reflections/dashboard_stats/?days=30')
+        self.assertEqual(len(response.data['questions']), 15)
+
+    def test_query_count_of_rollup_windows(self):
+        self.create_questions(15)
+        self.assertDashboardQueries(90)
+        self.assertDashboardQueries(365)
+
+
+class ReflectionRollupTests(ReflectionTestCase):
+    """Rollups follow every response write and match aggregating the responses directly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.range_question = ReflectionQuestion.objects.create(
+            author=cls.user, question_text='How was your day?', question_type='range', order=0
+        )
+        cls.choice_question = ReflectionQuestion.objects.create(
+            author=cls.user, question_text='Mood', question_type='choice', choices=['Happy', 'Sad', 'Calm'], order=1
+        )
+        cls.number_question = ReflectionQuestion.objects.create(
+            author=cls.user, question_text='Hours slept', question_type='number', order=2
+        )
+
+    def rollup(self, granularity, date):
+        start = date if granularity == 'day' else date.replace(day=1)
+        return ReflectionRollup.objects.filter(
+            user=self.user, question=self.range_question, granularity=granularity, period_start=start
+        ).first()
+
+    def test_orm_writes_update_rollups(self):
+        date = self.today - timedelta(days=3)
+        reflection = SelfReflection.objects.create(user=self.user, date=date)
+        response = ReflectionResponse.objects.create(
+            daily_reflection=reflection, question=self.range_question, range_response=4
+        )
+        for granularity in ('day', 'month'):
+            rollup = self.rollup(granularity, date)
+            self.assertEqual((rollup.count, rollup.total, rollup.min_value), (1, 4, 4))
+            self.assertEqual(rollup.choice_counts, {'4': 1})
+
+        response = ReflectionResponse.objects.get(pk=response.pk)
+        response.range_response = 8
+        response.save()
+        for granularity in ('day', 'month'):
+            rollup = self.rollup(granularity, date)
+            self.assertEqual((rollup.count, rollup.total, rollup.min_value, rollup.max_value), (1, 8, 8, 8))
+            self.assertEqual(rollup.choice_counts, {'8': 1})
+
+        response.delete()
+        self.assertIsNone(self.rollup('day', date))
+        self.assertIsNone(self.rollup('month', date))
+
+    def rollup_rows(self):
+        return sorted(
+            (question_id, granularity, start, count, round(total, 6), low, high, counts)
+            for question_id, granularity, start, count, total, low, high, counts
+            in ReflectionRollup.objects.filter(user=self.user).values_list(
+                'question_id', 'granularity', 'period_start', 'count', 'total',
+                'min_value', 'max_value', 'choice_counts',
+            )
+        )
+
+    def test_reflection_delete_updates_rollups_in_one_batch(self):
+        for days_ago, value in enumerate((3, 7, 5, 1)):
+            reflection = SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=self.range_question, range_response=value
+            )
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=self.choice_question, choice_response='Sad'
+            )
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=self.number_question, number_response=value * 1.5
+            )
+        reflection = SelfReflection.objects.get(user=self.user, date=self.today - timedelta(days=1))
+
+        with mock.patch(
+            'self_reflection.signals.apply_response_changes', wraps=rollups.apply_response_changes
+        ) as apply_changes:
+            response = self.client.delete(f'/api/self-reflection/reflections/{reflection.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(apply_changes.call_count, 1)
+        self.assertEqual(len(apply_changes.call_args.args[1]), 3)
+
+        SelfReflection.objects.filter(user=self.user, date__lt=self.today - timedelta(days=1)).delete()
+        remaining = self.rollup_rows()
+        rollups.rebuild_rollups(self.user.pk)
+        self.assertEqual(remaining, self.rollup_rows())
+        self.assertEqual(self.rollup('month', self.today).max_value, 3)
+
+    def test_rollup_path_matches_raw_path(self):
+        moods = ['Happy', 'Sad', 'Calm']
+        for days_ago in range(150):
+            if days_ago % 7 == 3:
+                continue
+            reflection = SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=self.range_question, range_response=days_ago % 10 + 1
+            )
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=self.choice_question, choice_response=moods[days_ago % 3]
+            )
+            if days_ago % 2:
+                ReflectionResponse.objects.create(
+                    daily_reflection=reflection, question=self.number_question, number_response=days_ago / 4
+                )
+
+        # Edits and deletes through the ORM as well
+        for response in ReflectionResponse.objects.filter(question=self.range_question)[:20]:
+            response.range_response = 10
+            response.save()
+        for response in ReflectionResponse.objects.filter(question=self.number_question)[:5]:
+            response.delete()
+        # And through the API, which writes in bulk without signals
+        response = self.client.post('/api/self-reflection/reflections/bulk_create/', [
+            {'date': (self.today - timedelta(days=days_ago)).isoformat(), 'responses': [
+                {'question_id': self.range_question.id, 'range_response': 2},
+                {'question_id': self.choice_question.id, 'choice_response': 'Calm'},
+            ]}
+            for days_ago in (3, 10, 100)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+
+        urls = [
+            '/api/self-reflection/reflections/dashboard_stats/?days=120',
+            '/api/self-reflection/reflections/dashboard_stats/?days=120&format=columnar',
+            '/api/self-reflection/reflections/stats/?days=120',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                from_rollups = self.client.get(url).data
+                cache.clear()
+                with mock.patch('self_reflection.dashboard.ROLLUP_MIN_DAYS', 10 ** 6):
+                    from_responses = self.client.get(url).data
+                from_rollups.pop('version', None)
+                from_responses.pop('version', None)
+                self.assertEqual(from_rollups, from_responses)
+
+        stats = self.client.get('/api/self-reflection/reflections/stats/?days=120').data
+        self.assertEqual(len(stats['question_averages']), 1)
+
+
+class BulkReflectionWriteTests(ReflectionTestCase):
+    """bulk_create upserts reflections and responses and keeps the streak and cache current"""
+
+    URL = '/api/self-reflection/reflections/bulk_create/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.question = ReflectionQuestion.objects.create(
+            author=cls.user, question_text='How was your day?', question_type='range'
+        )
+
+    def item(self, days_ago, value, notes=''):
+        return {
+            'date': (self.today - timedelta(days=days_ago)).isoformat(),
+            'notes': notes,
+            'responses': [{'question_id': self.question.id, 'range_response': value}],
+        }
+
+    def test_bulk_upsert_creates_and_updates(self):
+        reflection = SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=2), notes='old')
+        ReflectionResponse.objects.create(daily_reflection=reflection, question=self.question, range_response=3)
+        version = get_data_version(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.URL, [self.item(2, 9, 'new'), self.item(1, 5), self.item(0, 7)], format='json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['responses'][0]['range_response'] for item in response.data], [9, 5, 7])
+        reflection.refresh_from_db()
+        self.assertEqual(reflection.notes, 'new')
+        self.assertEqual(
+            list(ReflectionResponse.objects.order_by('daily_reflection__date').values_list('range_response', flat=True)),
+            [9, 5, 7],
+        )
+        streak = ReflectionStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current_streak, streak.longest_streak), (3, 3))
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+
+    def test_day_inserted_by_a_concurrent_save_is_updated(self):
+        bulk_create = SelfReflection.objects.bulk_create
+
+        def insert_first(reflections, **kwargs):
+            # Another request saves the same new day between the lookup and the insert
+            reflection = SelfReflection.objects.create(user=self.user, date=self.today, notes='other')
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=self.question, range_response=3)
+            return bulk_create(reflections, **kwargs)
+
+        with mock.patch.object(SelfReflection.objects, 'bulk_create', side_effect=insert_first):
+            response = self.client.post(self.URL, [self.item(0, 8, 'mine')], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        reflection = SelfReflection.objects.get(user=self.user, date=self.today)
+        self.assertEqual(reflection.notes, 'mine')
+        self.assertEqual(list(reflection.responses.values_list('range_response', flat=True)), [8])
+        rollup = ReflectionRollup.objects.get(
+            user=self.user, question=self.question, granularity='day', period_start=self.today
+        )
+        self.assertEqual((rollup.count, rollup.total), (1, 8))
+        streak = ReflectionStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current_streak, streak.longest_streak), (1, 1))
+
+    def test_streak_is_rebuilt_only_on_back_fill(self):
+        self.client.post(self.URL, [self.item(5, 4), self.item(4, 4)], format='json')
+
+        with mock.patch('self_reflection.streaks.rebuild_streak', wraps=streaks.rebuild_streak) as rebuild:
+            # New days after the last one extend the streak in place
+            self.client.post(self.URL, [self.item(1, 6), self.item(0, 6), self.item(2, 6)], format='json')
+            self.assertFalse(rebuild.called)
+            streak = ReflectionStreak.objects.get(user=self.user)
+            self.assertEqual((streak.current_streak, streak.longest_streak), (3, 3))
+
+            # Filling in the gap joins the runs
+            self.client.post(self.URL, [self.item(3, 6)], format='json')
+            self.assertTrue(rebuild.called)
+            streak = ReflectionStreak.objects.get(user=self.user)
+            self.assertEqual((streak.current_streak, streak.longest_streak), (6, 6))
+
+
+class ReflectionWriteQueryCountTests(ReflectionTestCase):
+    """Creating and updating one reflection costs the same number of queries, however many choices it answers"""
+
+    URL = '/api/self-reflection/reflections/'
+
+    # Reflection and response upserts, rollups, streak and the saved responses, plus the test's savepoints
+    CREATE_QUERIES = 16
+    UPDATE_QUERIES = 13
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.questions = [
+            ReflectionQuestion.objects.create(
+                author=cls.user, question_text=f'Mood {index}', question_type='choice',
+                choices=['Happy', 'Sad', 'Calm'], order=index,
+            )
+            for index in range(5)
+        ]
+        SelfReflection.objects.create(user=cls.user, date=timezone.now().date() - timedelta(days=1))
+
+    def setUp(self):
+        super().setUp()
+        get_question_catalog(self.user)
+
+    def payload(self, questions, mood):
+        return {
+            'date': self.today.isoformat(),
+            'responses': [{'question_id': question.id, 'choice_response': mood} for question in questions],
+        }
+
+    def assertWriteQueries(self, questions):
+        with self.assertNumQueries(self.CREATE_QUERIES):
+            response = self.client.post(self.URL, self.payload(questions, 'Sad'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([answer['choice_response'] for answer in response.data['responses']], ['Sad'] * len(questions))
+
+        reflection = SelfReflection.objects.get(user=self.user, date=self.today)
+        with self.assertNumQueries(self.UPDATE_QUERIES):
+            response = self.client.put(f'{self.URL}{reflection.id}/', self.payload(questions, 'Calm'), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([answer['choice_response'] for answer in response.data['responses']], ['Calm'] * len(questions))
+        with self.captureOnCommitCallbacks(execute=True):
+            reflection.delete()
+
+    def test_query_count_does_not_depend_on_answers(self):
+        self.assertWriteQueries(self.questions[:1])
+        self.assertWriteQueries(self.questions)
+
+
+class DashboardDeltaTests(ReflectionTestCase):
+    """?since= returns only the changed days unless a delta cannot express the changes"""
+
+    URL = '/api/self-reflection/reflections/dashboard_stats/?days=7'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.question = ReflectionQuestion.objects.create(
+            author=cls.user, question_text='How was your day?', question_type='range'
+        )
+
+    def setUp(self):
+        super().setUp()
+        for days_ago in (2, 1):
+            reflection = SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=self.question, range_response=5)
+
+    def version(self):
+        # Without the overlap, the setUp writes are not part of the delta
+        with mock.patch('self_reflection.cache.DELTA_OVERLAP', timedelta(0)):
+            return self.client.get(self.URL).data['version']
+
+    def test_edits_come_as_delta(self):
+        since = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/self-reflection/reflections/bulk_create/', [{
+                'date': (self.today - timedelta(days=1)).isoformat(),
+                'responses': [{'question_id': self.question.id, 'range_response': 9}],
+            }], format='json')
+
+        response = self.client.get(f'{self.URL}&since={since}')
+        self.assertTrue(response.data['delta'])
+        self.assertEqual(response.data['changed_dates'], [(self.today - timedelta(days=1)).isoformat()])
+        points = response.data['questions'][0]['line_chart']['data']
+        self.assertEqual([point['value'] for point in points], [9])
+
+    def test_delete_after_since_returns_full_payload(self):
+        since = self.version()
+        reflection = SelfReflection.objects.get(user=self.user, date=self.today - timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/self-reflection/reflections/{reflection.id}/')
+
+        response = self.client.get(f'{self.URL}&since={since}')
+        self.assertFalse(response.data['delta'])
+        self.assertEqual(response.data['overview']['total_reflections'], 1)
+        self.assertNotEqual(response.data['version'].split('.')[0], since.split('.')[0])
+
+    def test_plain_timestamps_are_rejected(self):
+        since = (timezone.now() - timedelta(minutes=1)).isoformat()
+        response = self.client.get(self.URL, {'since': since})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('version', response.data['detail'])
+
+
+class CascadeDeleteTests(ReflectionTestCase):
+    """Deleting a question or a user costs the same number of queries, however many days were answered"""
+
+    def answer_days(self, days, email):
+        user = get_user_model().objects.create_user(email=email, password='secret')
+        question = ReflectionQuestion.objects.create(author=user, question_text='Mood', question_type='range')
+        for days_ago in range(days):
+            reflection = SelfReflection.objects.create(user=user, date=self.today - timedelta(days=days_ago))
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=question, range_response=5)
+        return user, question
+
+    def delete_queries(self, days, delete):
+        user, question = self.answer_days(days, f'cascade{days}@example.com')
+        version = get_data_version(user.pk)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            delete(user, question)
+        return len(queries), version != get_data_version(user.pk)
+
+    def test_question_delete(self):
+        few = self.delete_queries(3, lambda user, question: question.delete())
+        many = self.delete_queries(30, lambda user, question: question.delete())
+        self.assertEqual(few, many)
+        self.assertTrue(many[1])
+
+    def test_user_delete(self):
+        few = self.delete_queries(3, lambda user, question: user.delete())
+        many = self.delete_queries(30, lambda user, question: user.delete())
+        self.assertEqual(few[0], many[0])
+
+
+class ChoiceCodeTests(ReflectionTestCase):
+    """Responses store choice codes, so editing a question's choices keeps their history"""
+
+    def setUp(self):
+        super().setUp()
+        self.question = ReflectionQuestion.objects.create(
+            author=self.user, question_text='Mood', question_type='choice', choices=['Happy', 'Sad', 'Calm']
+        )
+        for days_ago, mood in ((2, 'Sad'), (1, 'Sad'), (0, 'Happy')):
+            reflection = SelfReflection.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=self.question, choice_response=mood)
+
+    def edit_choices(self, choices):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/self-reflection/questions/{self.question.id}/', {'choices': choices}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def answer(self, days_ago):
+        date = (self.today - timedelta(days=days_ago)).isoformat()
+        response = self.client.get(f'/api/self-reflection/reflections/by_date/?date={date}')
+        return response.data['responses'][0]['choice_response']
+
+    def test_rename_keeps_history(self):
+        self.edit_choices(['Happy', 'Blue', 'Calm'])
+
+        self.assertEqual(self.answer(2), 'Blue')
+        self.assertEqual(ReflectionResponse.objects.filter(choice_code=2).count(), 2)
+        dashboard = self.client.get('/api/self-reflection/reflections/dashboard_stats/?days=7').data
+        distribution = dashboard['questions'][0]['distribution']
+        self.assertEqual(distribution['Blue']['count'], 2)
+        self.assertNotIn('Sad', distribution)
+
+    def test_removed_choice_keeps_its_label(self):
+        self.edit_choices(['Happy', 'Calm', 'Joy'])
+
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.choice_codes, {'1': 'Happy', '2': 'Sad', '3': 'Calm', '4': 'Joy'})
+        self.assertEqual(self.answer(1), 'Sad')
+        self.assertEqual(self.answer(0), 'Happy')
+
+
+class MaintenanceCommandTests(ReflectionTestCase):
+    """The nightly maintenance commands"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = get_user_model().objects.create_user(
+            email='other@example.com', password='secret', first_name='Other', last_name='Reflector'
+        )
+
+    def test_rebuild_streaks_resets_users_without_reflections(self):
+        today = self.today
+        for days_ago in (1, 0):
+            SelfReflection.objects.create(user=self.user, date=today - timedelta(days=days_ago))
+        ReflectionStreak.objects.filter(user=self.user).update(current_streak=7, longest_streak=9)
+        # Left behind by a write that sent no signals
+        ReflectionStreak.objects.create(user=self.other, current_streak=3, longest_streak=3, last_reflection_date=today)
+
+        call_command('rebuild_reflection_streaks', stdout=StringIO())
+
+        streak = ReflectionStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current_streak, streak.longest_streak, streak.last_reflection_date), (2, 2, today))
+        streak = ReflectionStreak.objects.get(user=self.other)
+        self.assertEqual((streak.current_streak, streak.longest_streak, streak.last_reflection_date), (0, 0, None))
+
+    def test_deploy_check_refuses_a_process_local_cache(self):
+        for backend, errors in (('locmem.LocMemCache', ['self_reflection.E001']), ('filebased.FileBasedCache', [])):
+            caches = {'default': {'BACKEND': f'django.core.cache.backends.{backend}', 'LOCATION': '/tmp/inkodyssey'}}
+            with self.subTest(backend=backend), override_settings(CACHES=caches):
+                self.assertEqual([error.id for error in checks.check_shared_cache(None)], errors)
+
+    def test_precompute_requires_a_shared_cache(self):
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            caches = {'default': {'BACKEND': f'django.core.cache.backends.{backend}'}}
+            with self.subTest(backend=backend), override_settings(CACHES=caches):
+                with self.assertRaises(CommandError):
+                    call_command('precompute_reflection_dashboards', stdout=StringIO())
+
+
+class ReflectionRowSerializationTests(ReflectionTestCase):
+    """serialize_reflections() outputs exactly what SelfReflectionSerializer does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        questions = [
+            ReflectionQuestion.objects.create(author=cls.user, question_text='Day', question_type='range'),
+            ReflectionQuestion.objects.create(
+                author=cls.user, question_text='Mood', question_type='choice', choices=['Happy', 'Sad']
+            ),
+            ReflectionQuestion.objects.create(author=cls.user, question_text='Thoughts', question_type='text'),
+            ReflectionQuestion.objects.create(author=cls.user, question_text='Sleep', question_type='number'),
+        ]
+        today = timezone.now().date()
+        for days_ago in range(4):
+            reflection = SelfReflection.objects.create(
+                user=cls.user, date=today - timedelta(days=days_ago), notes=f'Notes {days_ago}'
+            )
+            if days_ago == 3:
+                # A reflection without responses
+                continue
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=questions[0], range_response=7)
+            ReflectionResponse.objects.create(
+                daily_reflection=reflection, question=questions[1], choice_response=['Happy', 'Sad'][days_ago % 2]
+            )
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=questions[2], text_response='Hi')
+            # A response without any answer
+            ReflectionResponse.objects.create(daily_reflection=reflection, question=questions[3])
+        # Labels come from the codes, so a renamed choice shows its new name
+        questions[1].choices = ['Happy', 'Blue']
+        questions[1].save()
+
+    def serializer_data(self, fields=None, omit=None):
+        reflections = SelfReflection.objects.filter(user=self.user).select_related('user').prefetch_related(
+            Prefetch('responses', queryset=ReflectionResponse.objects.select_related('question').order_by('id'))
+        )
+        return SelfReflectionSerializer(reflections, many=True, fields=fields, omit=omit).data
+
+    def test_rows_match_serializer(self):
+        with self.assertNumQueries(3):
+            data = serialize_reflections(SelfReflection.objects.filter(user=self.user))
+        self.assertEqual(data, self.serializer_data())
+
+        labels = {response['choice_response'] for reflection in data for response in reflection['responses']}
+        self.assertEqual(labels, {'Happy', 'Blue', None})
+        self.assertEqual(data[-1]['responses'], [])
+        self.assertIsNone(data[0]['responses'][3]['number_response'])
+
+    def test_rows_match_serializer_with_sparse_fieldsets(self):
+        fieldsets = [
+            ('id,date,responses.choice_response', None),
+            ('responses.question_id,responses.range_response', None),
+            (None, 'user_email,notes,responses.question_text,responses.created_at'),
+            (None, 'responses'),
+            ('id,responses', 'responses.choice_response'),
+        ]
+        for fields, omit in fieldsets:
+            with self.subTest(fields=fields, omit=omit):
+                fields, omit = parse_fieldset(fields), parse_fieldset(omit)
+                shape = fieldset_shape(SelfReflectionSerializer(fields=fields, omit=omit))
+                data = serialize_reflections(SelfReflection.objects.filter(user=self.user), shape)
+                self.assertEqual(data, self.serializer_data(fields, omit))
+
+
+class AnalyticsWindowTests(ReflectionTestCase):
+    """?days= is validated and clamped the same way by every analytics endpoint"""
+
+    ENDPOINTS = ('stats', 'dashboard_stats', 'insights', 'correlations', 'tag_correlations')
+
+    def test_invalid_days_are_rejected(self):
+        for endpoint in self.ENDPOINTS:
+            for days in ('0', '-5', 'week', '1.5'):
+                with self.subTest(endpoint=endpoint, days=days):
+                    response = self.client.get(f'/api/self-reflection/reflections/{endpoint}/?days={days}')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('days', response.data['detail'])
+
+    def test_long_windows_are_clamped(self):
+        response = self.client.get('/api/self-reflection/reflections/correlations/?days=100000000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['days_analyzed'], MAX_DASHBOARD_DAYS)
+
+        for endpoint in self.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                response = self.client.get(f'/api/self-reflection/reflections/{endpoint}/?days=100000000')
+                self.assertEqual(response.status_code, 200)
+
+
+class CorrelationTests(SimpleTestCase):
+    """Every pair of questions is correlated over the days where both are answered"""
+
+    def correlations(self, *columns):
+        values = np.array(columns, dtype=np.float64).T
+        return correlation_matrices(ResponseMatrix(date(2024, 1, 1), range(len(columns)), values))
+
+    def test_complete_days_match_numpy(self):
+        x = [3, 7, 1, 9, 4, 6]
+        y = [2, 8, 3, 7, 1, 9]
+        result = self.correlations(x, y)
+
+        self.assertAlmostEqual(result['pearson'][0][1], np.corrcoef(x, y)[0, 1], places=3)
+        ranks_x, ranks_y = np.argsort(np.argsort(x)), np.argsort(np.argsort(y))
+        self.assertAlmostEqual(result['spearman'][0][1], np.corrcoef(ranks_x, ranks_y)[0, 1], places=3)
+        self.assertEqual(result['sample_sizes'], [[6, 6], [6, 6]])
+
+    def test_ties_share_their_mean_rank(self):
+        result = self.correlations([1, 2, 2, 3], [1, 3, 2, 4])
+        self.assertAlmostEqual(result['spearman'][0][1], np.corrcoef([1, 2.5, 2.5, 4], [1, 3, 2, 4])[0, 1], places=3)
+
+    def test_missing_days_are_left_out_of_each_pair(self):
+        nan = np.nan
+        a = [1, 2, 3, 4, 5, nan]
+        b = [2, 1, 4, 3, nan, 6]
+        c = [nan, 3, 1, 2, 5, 4]
+        result = self.correlations(a, b, c)
+
+        # 1 - 6 * sum(d^2) / (n * (n^2 - 1)) over the four days each pair shares
+        self.assertEqual(result['spearman'][0][1], 0.6)
+        self.assertEqual(result['spearman'][0][2], 0.4)
+        self.assertEqual(result['spearman'][1][2], 0.2)
+        self.assertEqual(result['spearman'][2][1], 0.2)
+        self.assertEqual(result['sample_sizes'][0], [5, 4, 4])
+
+        both = ~np.isnan(a) & ~np.isnan(c)
+        self.assertAlmostEqual(
+            result['pearson'][0][2], np.corrcoef(np.array(a)[both], np.array(c)[both])[0, 1], places=3
+        )
+
+
+class MetricTests(SimpleTestCase):
+    """compute_metrics on a known series, a single answer and an unanswered question"""
+
+    def setUp(self):
+        nan = np.nan
+        self.matrix = ResponseMatrix(date(2024, 1, 1), ['series', 'single', 'empty'], np.array([
+            [2, nan, nan],
+            [nan, nan, nan],
+            [4, 5, nan],
+            [6, nan, nan],
+            [nan, nan, nan],
+            [8, nan, nan],
+        ]))
+
+    def test_series(self):
+        metrics = compute_metrics(self.matrix, METRICS)['series']
+        self.assertEqual(metrics['median'], 5.0)
+        self.assertEqual(metrics['percentiles'], {'p10': 2.6, 'p25': 3.5, 'p75': 6.5, 'p90': 7.4})
+        # Population standard deviation of 2, 4, 6, 8
+        self.assertEqual(metrics['std'], 2.24)
+        # The window is longer than the series, so every day averages all answers so far
+        self.assertEqual(metrics['rolling_average'], {'window': 7, 'values': [2.0, 2.0, 3.0, 4.0, 4.0, 5.0]})
+        # Least squares over the answered days 0, 2, 3, 5: 16 / 13
+        self.assertEqual(metrics['trend'], {'slope_per_day': 1.2308})
+
+    def test_single_answer(self):
+        metrics = compute_metrics(self.matrix, METRICS)['single']
+        self.assertEqual((metrics['median'], metrics['std']), (5.0, 0.0))
+        self.assertEqual(set(metrics['percentiles'].values()), {5.0})
+        self.assertEqual(metrics['rolling_average']['values'], [None, None, 5.0, 5.0, 5.0, 5.0])
+        self.assertEqual(metrics['trend'], {'slope_per_day': None})
+
+    def test_unanswered_question(self):
+        metrics = compute_metrics(self.matrix, METRICS)['empty']
+        self.assertEqual((metrics['median'], metrics['std']), (None, None))
+        self.assertEqual(set(metrics['percentiles'].values()), {None})
+        self.assertEqual(metrics['rolling_average']['values'], [None] * 6)
+        self.assertEqual(metrics['trend'], {'slope_per_day': None})
+
+    def test_rolling_window_skips_missing_days(self):
+        averages = rolling_average(self.matrix.values, window=2)
+        self.assertEqual(averages[:, 0].tolist(), [2.0, 2.0, 4.0, 5.0, 6.0, 8.0])
+
+    def test_empty_window_and_no_metrics(self):
+        matrix = ResponseMatrix.empty(date(2024, 1, 2), date(2024, 1, 1), ['series'])
+        self.assertEqual(compute_metrics(matrix, METRICS), {'series': {}})
+        self.assertEqual(compute_metrics(self.matrix, []), {'series': {}, 'single': {}, 'empty': {}})
+
+
+class DownsamplingTests(SimpleTestCase):
+    """LTTB keeps the shape-defining points; week and month buckets average calendar periods"""
+
+    def chart(self, values, start=date(2024, 1, 1)):
+        return {'data': [
+            {'date': (start + timedelta(days=day)).isoformat(), 'value': value} for day, value in enumerate(values)
+        ]}
+
+    def test_lttb_keeps_the_peak(self):
+        x = np.arange(10, dtype=np.float64)
+        y = np.array([0, 0, 0, 10, 0, 0, 0, 0, 0, 0], dtype=np.float64)
+        self.assertEqual(lttb_indices(x, y, 4).tolist(), [0, 3, 5, 9])
+        # Short series and thresholds below MIN_POINTS keep every point
+        self.assertEqual(lttb_indices(x, y, 10).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(x, y, 2).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(x[:0], y[:0], 3).tolist(), [])
+
+    def test_calendar_buckets(self):
+        # 2024-01-01 is a Monday and 2024-02-01 a Thursday
+        days = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 8), date(2024, 2, 1), date(2024, 2, 4)]
+        ordinals = np.array([day.toordinal() for day in days])
+        values = np.array([2.0, 4.0, 6.0, 1.0, 3.0])
+
+        starts, means, lows, highs, counts = calendar_buckets(ordinals, values, 'week')
+        self.assertEqual([date.fromordinal(int(start)) for start in starts],
+                         [date(2024, 1, 1), date(2024, 1, 8), date(2024, 1, 29)])
+        self.assertEqual(means.tolist(), [3.0, 6.0, 2.0])
+        self.assertEqual(lows.tolist(), [2.0, 6.0, 1.0])
+        self.assertEqual(highs.tolist(), [4.0, 6.0, 3.0])
+        self.assertEqual(counts.tolist(), [2, 1, 2])
+
+        starts, means, lows, highs, counts = calendar_buckets(ordinals, values, 'month')
+        self.assertEqual([date.fromordinal(int(start)) for start in starts], [date(2024, 1, 1), date(2024, 2, 1)])
+        self.assertEqual((means.tolist(), counts.tolist()), ([4.0, 2.0], [3, 2]))
+
+    def test_month_points_carry_their_period(self):
+        values = [None if day % 10 == 9 else day % 5 + 1 for day in range(60)]
+        chart = downsample_line_chart(self.chart(values), 10, method='month', color_mapping={'3': 'green'})
+
+        january = [value for value in values[:31] if value is not None]
+        self.assertEqual(chart['data'][0], {
+            'date': '2024-01-01', 'value': round(sum(january) / len(january), 2),
+            'min': 1.0, 'max': 5.0, 'count': len(january), 'color': 'green',
+        })
+        self.assertEqual([point['date'] for point in chart['data']], ['2024-01-01', '2024-02-01'])
+        self.assertEqual(chart['downsampled'], {'method': 'month', 'points': 2, 'original_points': 60})
+
+    def test_lttb_chart_keeps_original_points(self):
+        values = [day % 7 for day in range(30)]
+        chart = downsample_line_chart(self.chart(values), 5)
+        self.assertEqual(len(chart['data']), 5)
+        self.assertEqual((chart['data'][0]['date'], chart['data'][-1]['date']), ('2024-01-01', '2024-01-30'))
+        original = {point['date']: point for point in self.chart(values)['data']}
+        self.assertTrue(all(original[point['date']] == point for point in chart['data']))
+
+    def test_short_and_empty_charts_are_left_alone(self):
+        chart = self.chart([1, 2, 3])
+        self.assertIs(downsample_line_chart(chart, 5), chart)
+        self.assertEqual(downsample_line_chart(self.chart([None] * 8), 5, method='week')['data'], [])
+
+
+class InsightTests(SimpleTestCase):
+    """compute_insights over three weeks starting on Monday 2024-01-01, the last one recent"""
+
+    def setUp(self):
+        nan = np.nan
+        # 2 on the baseline Mondays and 4 on every other day, but 10 on the last Sunday
+        steady = [2 if day in (0, 7) else 4 for day in range(21)]
+        steady[20] = 10
+        # Answered on three baseline days only, too few for z-scores
+        sparse = [1, nan, 1, nan, 9, *[nan] * 16]
+        matrix = ResponseMatrix(date(2024, 1, 1), ['steady', 'sparse', 'empty'], np.array([
+            steady, sparse, [nan] * 21,
+        ], dtype=np.float64).T)
+        self.insights = compute_insights(matrix)
+
+    def test_weekday_and_month_means(self):
+        steady = self.insights['steady']
+        # Mondays 2, 2, 4 and Sundays 4, 4, 10
+        self.assertEqual(steady['weekday_means'], [2.67, 4.0, 4.0, 4.0, 4.0, 4.0, 6.0])
+        self.assertEqual(steady['month_effects'], [0.0] + [None] * 11)
+
+    def test_recent_week_against_the_baseline(self):
+        self.assertEqual(self.insights['steady']['recent'], {
+            'mean': 4.86, 'count': 7, 'baseline_mean': 3.71, 'baseline_count': 14, 'delta': 1.14,
+        })
+        # (10 - 52 / 14) over the baseline's population standard deviation
+        self.assertEqual(self.insights['steady']['anomalies'], [
+            {'date': '2024-01-21', 'value': 10.0, 'z_score': 8.98},
+        ])
+
+    def test_short_baselines_and_unanswered_questions(self):
+        sparse = self.insights['sparse']
+        self.assertEqual(sparse['recent'], {
+            'mean': None, 'count': 0, 'baseline_mean': 3.67, 'baseline_count': 3, 'delta': None,
+        })
+        self.assertEqual(sparse['anomalies'], [])
+
+        empty = self.insights['empty']
+        self.assertEqual(empty['weekday_means'], [None] * 7)
+        self.assertEqual(empty['month_effects'], [None] * 12)
+        self.assertEqual(empty['recent']['baseline_count'], 0)
+        self.assertEqual(empty['anomalies'], [])
@@ -2,20 +2,133 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
-from django.db.models import Count, Avg, Q, Min, Max
-from collections import defaultdict
-from .models import ReflectionQuestion, SelfReflection, ReflectionResponse
+from datetime import datetime, timedelta, timezone as dt_timezone, MINYEAR, MAXYEAR
+from backend.fieldsets import SparseFieldsetViewMixin
+
+from .models import ReflectionQuestion, SelfReflection
+from .analytics import (
+    parse_metrics,
+    load_response_matrix,
+    correlation_matrices,
+    numeric_questions,
+    compute_insights,
+    load_tag_days,
+    compute_tag_effects,
+    MIN_CORRELATION_SAMPLES,
+    MIN_TAG_SAMPLES,
+    RECENT_DAYS,
+    ANOMALY_Z_SCORE,
+)
+from .catalog import get_question_catalog, get_active_questions, get_question
+from .cache import (
+    cached_payload,
+    get_diary_version,
+    get_structure_version,
+    make_delta_token,
+    parse_delta_token,
+)
+from .dashboard import (
+    build_dashboard_questions,
+    build_columnar_dashboard,
+    build_dashboard_delta,
+    packed_year_heatmap,
+    range_question_averages,
+    PACKED_HEATMAP_TYPES,
+)
+from .downsampling import DOWNSAMPLE_METHODS, MIN_POINTS
+from .streaks import get_streak, get_current_streak
+from .writes import bulk_save_reflections
 from .serializers import (
     ReflectionQuestionSerializer,
     SelfReflectionSerializer,
     SelfReflectionCreateUpdateSerializer,
-    ReflectionResponseSerializer
+    reflection_rows,
+    serialize_reflection_rows,
+    REFLECTION_COLUMNS,
+    serialize_reflections,
 )
 
 
-class ReflectionQuestionViewSet(viewsets.ModelViewSet):
+PAYLOAD_FORMATS = ('rows', 'columnar')
+
+# Longest window the stats, dashboard and analytics endpoints analyze
+MAX_DASHBOARD_DAYS = 3660
+
+# Largest page of the paginated date_range mode
+DATE_RANGE_MAX_LIMIT = 500
+
+# Reflections fetched (with their responses) per query while streaming
+STREAM_CHUNK_SIZE = 200
+
+
+def dashboard_cache_params(days, end_date, question_id=None, metrics=(), response_format='rows',
+                           max_points=None, downsample='lttb'):
+    """Parameters a dashboard_stats payload is cached under"""
+    return {
+        'days': days,
+        'question_id': question_id,
+        'metrics': ','.join(metrics),
+        'format': response_format,
+        'max_points': max_points,
+        'downsample': downsample,
+        'end_date': end_date,
+    }
+
+
+def stats_cache_params(days, end_date, metrics=()):
+    """Parameters a stats payload is cached under"""
+    return {'days': days, 'metrics': ','.join(metrics), 'end_date': end_date}
+
+
+def insights_cache_params(days, end_date):
+    """Parameters an insights payload is cached under"""
+    return {'days': days, 'end_date': end_date}
+
+
+def parse_days(param, default):
+    """Parse a ?days= value into a window of 1 to MAX_DASHBOARD_DAYS days"""
+    if param is None:
+        return default
+    try:
+        days = int(param)
+    except ValueError:
+        raise ValueError('days must be an integer') from None
+    if days < 1:
+        raise ValueError('days must be at least 1')
+    return min(days, MAX_DASHBOARD_DAYS)
+
+
+def _ndjson_reflections(reflections, shape=None):
+    """Serialize reflections one JSON line at a time, loading them in chunks"""
+    encoder = JSONEncoder()
+    chunk = []
+    for row in reflection_rows(reflections).iterator(chunk_size=STREAM_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield ''.join(encoder.encode(data) + '\n' for data in serialize_reflection_rows(chunk, shape))
+            chunk = []
+    if chunk:
+        yield ''.join(encoder.encode(data) + '\n' for data in serialize_reflection_rows(chunk, shape))
+
+
+class PayloadFormatNegotiation(DefaultContentNegotiation):
+    """
+    Content negotiation that leaves ?format=rows|columnar to the view as a
+    payload layout instead of treating it as a renderer name.
+    """
+    
+    def filter_renderers(self, renderers, format):
+        if format in PAYLOAD_FORMATS:
+            return renderers
+        return super().filter_renderers(renderers, format)
+
+
+class ReflectionQuestionViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing reflection questions.
     
@@ -25,6 +138,8 @@ class ReflectionQuestionViewSet(viewsets.ModelViewSet):
     Update: PUT/PATCH /api/self-reflection/questions/{id}/
     Delete: DELETE /api/self-reflection/questions/{id}/
     Active Questions: GET /api/self-reflection/questions/active/
+    
+    GET requests take ?fields= and ?omit= (see backend.fieldsets).
     """
     queryset = ReflectionQuestion.objects.all()
     serializer_class = ReflectionQuestionSerializer
@@ -33,7 +148,7 @@ class ReflectionQuestionViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Optionally filter by active status"""
         user = self.request.user
-        queryset = ReflectionQuestion.objects.filter(author=user)
+        queryset = ReflectionQuestion.objects.filter(author=user).select_related('author')
         
         # Filter by active status if provided
         is_active = self.request.query_params.get('is_active', None)
@@ -51,23 +166,35 @@ class ReflectionQuestionViewSet(viewsets.ModelViewSet):
         """Associate new questions with the requesting user"""
         serializer.save(author=self.request.user)
     
+    def _catalog_questions(self):
+        """The user's cached question catalog with the filters of get_queryset"""
+        questions = get_question_catalog(self.request.user)
+        
+        is_active = self.request.query_params.get('is_active', None)
+        if is_active is not None:
+            questions = [q for q in questions if q.is_active == (is_active.lower() == 'true')]
+        
+        category = self.request.query_params.get('category', None)
+        if category:
+            questions = [q for q in questions if q.category.casefold() == category.casefold()]
+        
+        return questions
+    
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get all active questions ordered by display order"""
-        questions = self.get_queryset().filter(is_active=True).order_by('order', 'id')
+        questions = [q for q in self._catalog_questions() if q.is_active]
         serializer = self.get_serializer(questions, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Get list of all question categories"""
-        categories = self.get_queryset().filter(
-            is_active=True
-        ).values_list('category', flat=True).distinct()
+        categories = dict.fromkeys(q.category for q in self._catalog_questions() if q.is_active)
         return Response({'categories': [c for c in categories if c]})
 
 
-class SelfReflectionViewSet(viewsets.ModelViewSet):
+class SelfReflectionViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing self reflections.
     
@@ -78,16 +205,27 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
     Delete: DELETE /api/self-reflection/reflections/{id}/
     Today: GET /api/self-reflection/reflections/today/
     By Date: GET /api/self-reflection/reflections/by_date/?date=YYYY-MM-DD
+    Date Range: GET /api/self-reflection/reflections/date_range/?start_date=&end_date=
     Stats: GET /api/self-reflection/reflections/stats/
+    Heatmap: GET /api/self-reflection/reflections/heatmap/?question_id=&year=
+    Insights: GET /api/self-reflection/reflections/insights/?days=N
+    Correlations: GET /api/self-reflection/reflections/correlations/?days=N
+    Tag Correlations: GET /api/self-reflection/reflections/tag_correlations/?days=N
+    
+    Reflection reads (list, retrieve, today, by_date, date_range) take
+    ?fields= and ?omit= (see backend.fieldsets).
     """
     serializer_class = SelfReflectionSerializer
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = PayloadFormatNegotiation
     
     def get_queryset(self):
         """Get reflections for the current user"""
-        return SelfReflection.objects.filter(
-            user=self.request.user
-        ).prefetch_related('responses', 'responses__question')
+        queryset = SelfReflection.objects.filter(user=self.request.user)
+        if self.action in ['update', 'partial_update', 'destroy']:
+            # Writes only need the row; updates return their responses loaded afresh
+            return queryset
+        return queryset.prefetch_related('responses', 'responses__question')
     
     def get_serializer_class(self):
         """Use different serializers for different actions"""
@@ -99,16 +237,23 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
         """Save the reflection for the current user"""
         serializer.save()
     
+    def list(self, request, *args, **kwargs):
+        """List reflections, serialized straight from values rows"""
+        shape = self.get_fieldset_shape()
+        rows = reflection_rows(SelfReflection.objects.filter(user=request.user))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_reflection_rows(page, shape))
+        return Response(serialize_reflection_rows(rows, shape))
+    
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get or create today's reflection"""
         today = timezone.now().date()
         
         try:
-            reflection = SelfReflection.objects.prefetch_related(
-                'responses', 'responses__question'
-            ).get(user=request.user, date=today)
-            serializer = SelfReflectionSerializer(reflection)
+            reflection = self.filter_queryset(self.get_queryset()).get(date=today)
+            serializer = self.get_serializer(reflection)
             return Response(serializer.data)
         except SelfReflection.DoesNotExist:
             return Response(
@@ -139,13 +284,13 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            reflection = SelfReflection.objects.prefetch_related(
-                'responses', 'responses__question'
-            ).get(user=request.user, date=date)
-            serializer = SelfReflectionSerializer(reflection)
-            return Response(serializer.data)
-        except SelfReflection.DoesNotExist:
+        reflection = serialize_reflections(
+            SelfReflection.objects.filter(user=request.user, date=date),
+            self.get_fieldset_shape()
+        )
+        if reflection:
+            return Response(reflection[0])
+        else:
             return Response(
                 {
                     'detail': f'No reflection found for {date}',
@@ -157,7 +302,17 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def date_range(self, request):
-        """Get reflections for a date range"""
+        """
+        Get reflections for a date range, newest first
+        
+        Query params:
+        - start_date, end_date: YYYY-MM-DD (required)
+        - limit: Page size (optional, at most DATE_RANGE_MAX_LIMIT). The response
+          becomes {'next': url or null, 'results': [...]}
+        - cursor: Date of the last reflection of the previous page, as set in 'next'
+        - stream: 'ndjson' streams every reflection of the range, one JSON
+          object per line
+        """
         start_date = request.query_params.get('start_date', None)
         end_date = request.query_params.get('end_date', None)
         
@@ -176,76 +331,110 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        reflections = self.get_queryset().filter(date__range=[start, end])
-        serializer = SelfReflectionSerializer(reflections, many=True)
-        return Response(serializer.data)
+        reflections = SelfReflection.objects.filter(
+            user=request.user,
+            date__range=[start, end]
+        ).order_by('-date')
+        shape = self.get_fieldset_shape()
+        
+        if request.query_params.get('stream') == 'ndjson':
+            return StreamingHttpResponse(
+                _ndjson_reflections(reflections, shape),
+                content_type='application/x-ndjson'
+            )
+        
+        limit = request.query_params.get('limit', None)
+        if limit is None:
+            return Response(serialize_reflections(reflections, shape))
+        
+        try:
+            limit = int(limit)
+            cursor = request.query_params.get('cursor', None)
+            if cursor:
+                reflections = reflections.filter(date__lt=datetime.strptime(cursor, '%Y-%m-%d').date())
+        except ValueError:
+            return Response(
+                {'detail': 'limit must be an integer and cursor a date (format: YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            return Response(
+                {'detail': 'limit must be at least 1'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = min(limit, DATE_RANGE_MAX_LIMIT)
+        
+        # Keyset pagination: fetch one extra row to know whether a next page exists
+        rows = list(reflection_rows(reflections)[:limit + 1])
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor', rows[-1][REFLECTION_COLUMNS.index('date')].isoformat()
+            )
+        page = serialize_reflection_rows(rows, shape)
+        
+        return Response({
+            'next': next_url,
+            'results': page
+        })
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get statistics about user's reflections"""
         # Get date range (default to last 30 days)
-        days = int(request.query_params.get('days', 30))
-        start_date = timezone.now().date() - timedelta(days=days)
+        try:
+            days = parse_days(request.query_params.get('days'), 30)
+            metrics = parse_metrics(request.query_params.get('metrics'))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        end_date = timezone.now().date()
+        
+        stats_data = cached_payload(
+            'stats',
+            request.user.pk,
+            stats_cache_params(days, end_date, metrics),
+            lambda: self._build_stats(request.user, days, end_date, metrics)
+        )
+        return Response(stats_data)
+    
+    def _build_stats(self, user, days, end_date, metrics):
+        """Compute the payload of the stats endpoint"""
+        start_date = end_date - timedelta(days=days)
         
-        reflections = self.get_queryset().filter(date__gte=start_date)
+        reflections = SelfReflection.objects.filter(user=user, date__gte=start_date)
         
         total_reflections = reflections.count()
         
         # Get response statistics for range questions
-        range_questions = ReflectionQuestion.objects.filter(
-            question_type='range',
-            is_active=True,
-            author=request.user
+        range_questions = get_active_questions(user, question_type='range')
+        question_stats = range_question_averages(
+            user, range_questions, start_date, end_date, metrics=metrics
         )
-        question_stats = []
-        
-        for question in range_questions:
-            responses = ReflectionResponse.objects.filter(
-                daily_reflection__in=reflections,
-                question=question,
-                range_response__isnull=False
-            )
-            
-            avg_value = responses.aggregate(avg=Avg('range_response'))['avg']
-            
-            if avg_value is not None:
-                question_stats.append({
-                    'question_id': question.id,
-                    'question_text': question.question_text,
-                    'average': round(avg_value, 2),
-                    'count': responses.count()
-                })
         
         # Calculate streak
-        current_streak = self._calculate_streak(request.user)
+        current_streak = self._calculate_streak(user)
         
-        return Response({
+        return {
             'total_reflections': total_reflections,
             'days_analyzed': days,
             'current_streak': current_streak,
             'question_averages': question_stats
-        })
+        }
     
     @action(detail=False, methods=['get'])
     def streak(self, request):
         """Get the user's current reflection streak"""
-        streak = self._calculate_streak(request.user)
-        return Response({'current_streak': streak})
+        streak = get_streak(request.user)
+        return Response({
+            'current_streak': get_current_streak(request.user, streak=streak),
+            'longest_streak': streak.longest_streak,
+            'last_reflection_date': streak.last_reflection_date,
+        })
     
     def _calculate_streak(self, user):
         """Calculate the current streak of consecutive days with reflections"""
-        today = timezone.now().date()
-        streak = 0
-        current_date = today
-        
-        while True:
-            if SelfReflection.objects.filter(user=user, date=current_date).exists():
-                streak += 1
-                current_date -= timedelta(days=1)
-            else:
-                break
-        
-        return streak
+        return get_current_streak(user)
     
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
@@ -263,15 +452,12 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
         )
         
         if serializer.is_valid():
-            reflections = []
-            for item_data in serializer.validated_data:
-                item_serializer = SelfReflectionCreateUpdateSerializer(
-                    data=item_data,
-                    context={'request': request}
-                )
-                if item_serializer.is_valid():
-                    reflection = item_serializer.save()
-                    reflections.append(reflection)
+            # One transaction and a fixed number of statements for the whole list
+            saved = bulk_save_reflections(request.user, serializer.validated_data)
+            loaded = self.get_queryset().select_related('user').in_bulk(
+                [reflection.pk for reflection in saved]
+            )
+            reflections = [loaded[reflection.pk] for reflection in saved]
             
             output_serializer = SelfReflectionSerializer(reflections, many=True)
             return Response(output_serializer.data, status=status.HTTP_201_CREATED)
@@ -285,271 +471,344 @@ class SelfReflectionViewSet(viewsets.ModelViewSet):
         Includes line charts data, heatmap data, and distribution data.
         
         Query params:
-        - days: Number of days to analyze (default: 30)
+        - days: Number of days to analyze (default: 30, at most MAX_DASHBOARD_DAYS)
         - question_id: Specific question to analyze (optional)
+        - max_points: Largest number of line chart points of range and number
+          questions; longer charts keep only answered days, downsampled
+          (rows format, optional)
+        - downsample: 'lttb' (default) keeps the most shape preserving days,
+          'week' or 'month' average each period into one point with its
+          min, max and count (optional)
+        - metrics: Comma separated extra analytics for range/number questions
+          (median, percentiles, std, rolling_average, trend or all) (optional)
+        - format: 'rows' (default) or 'columnar' for a compact payload with one
+          dense values array per question starting at start_date, choice
+          indices instead of labels and a shared color table (optional)
+        - since: The 'version' token of a previous response. Only the days
+          changed since then are returned, with 'delta': true; when a delta
+          cannot express the changes (deletes, question edits, a new day) the
+          full payload comes with 'delta': false
         """
-        days = int(request.query_params.get('days', 30))
+        try:
+            days = parse_days(request.query_params.get('days'), 30)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         question_id = request.query_params.get('question_id', None)
-        start_date = timezone.now().date() - timedelta(days=days)
-        
-        reflections = self.get_queryset().filter(date__gte=start_date)
-        
-        # Get all active questions or specific question
-        if question_id:
-            questions = ReflectionQuestion.objects.filter(id=question_id, is_active=True, author=request.user)
-        else:
-            questions = ReflectionQuestion.objects.filter(is_active=True, author=request.user)
-        
-        dashboard_data = {
-            'overview': {
-                'total_reflections': reflections.count(),
-                'days_analyzed': days,
-                'current_streak': self._calculate_streak(request.user),
-                'start_date': start_date.isoformat(),
-                'end_date': timezone.now().date().isoformat()
-            },
-            'questions': []
-        }
+        downsample = request.query_params.get('downsample', 'lttb')
+        max_points = request.query_params.get('max_points', None)
+        if max_points is not None and not (max_points.isdigit() and int(max_points) >= MIN_POINTS):
+            return Response(
+                {'detail': f'max_points must be an integer of at least {MIN_POINTS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_points = int(max_points) if max_points is not None else None
+        if downsample not in DOWNSAMPLE_METHODS:
+            return Response(
+                {'detail': f'Invalid downsample method. Choose from: {", ".join(DOWNSAMPLE_METHODS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Other ?format= values keep selecting a renderer (e.g. json)
+        response_format = request.query_params.get('format')
+        if response_format not in PAYLOAD_FORMATS:
+            response_format = 'rows'
+        try:
+            metrics = parse_metrics(request.query_params.get('metrics'))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        end_date = timezone.now().date()
         
-        for question in questions:
-            question_data = {
-                'question_id': question.id,
-                'question_text': question.question_text,
-                'question_type': question.question_type,
-                'category': question.category,
-                'color_mapping': question.color_mapping,
-            }
-            
-            if question.question_type == 'range':
-                # Get time series data for line chart
-                question_data['line_chart'] = self._get_range_line_chart_data(
-                    question, reflections, start_date, days
-                )
-                
-                # Get heatmap data (calendar heatmap)
-                question_data['heatmap'] = self._get_range_heatmap_data(
-                    question, reflections, start_date, days
-                )
-                
-                # Get distribution data
-                question_data['distribution'] = self._get_range_distribution(
-                    question, reflections
-                )
-                
-            elif question.question_type == 'choice':
-                # Get choice distribution over time for line chart
-                question_data['line_chart'] = self._get_choice_line_chart_data(
-                    question, reflections, start_date, days
-                )
-                
-                # Get overall choice distribution
-                question_data['distribution'] = self._get_choice_distribution(
-                    question, reflections
-                )
-            
-            elif question.question_type == 'number':
-                # Get time series data for line chart (similar to range)
-                question_data['line_chart'] = self._get_number_line_chart_data(
-                    question, reflections, start_date, days
-                )
+        since = request.query_params.get('since')
+        if since:
+            try:
+                structure_version, since_at = parse_delta_token(since)
+            except ValueError as exc:
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             
-            dashboard_data['questions'].append(question_data)
-        
+            # Deletes, question edits, a moved window, metrics or downsampled
+            # charts need a full payload
+            if (
+                response_format == 'rows'
+                and not metrics
+                and not max_points
+                and structure_version == get_structure_version(request.user.pk)
+                and since_at.astimezone(dt_timezone.utc).date() == end_date
+            ):
+                return Response(self._build_dashboard_delta(request.user, days, end_date, question_id, since))
+        
+        dashboard_data = cached_payload(
+            'dashboard_stats',
+            request.user.pk,
+            dashboard_cache_params(
+                days, end_date, question_id, metrics, response_format, max_points, downsample
+            ),
+            lambda: self._build_dashboard_stats(
+                request.user, days, end_date, question_id, metrics, response_format,
+                max_points, downsample
+            )
+        )
+        # A cached payload is current until the next write, so the token
+        # is issued now rather than stored with it
+        dashboard_data = {**dashboard_data, 'version': make_delta_token(request.user.pk)}
+        if since:
+            dashboard_data['delta'] = False
         return Response(dashboard_data)
     
-    def _get_range_line_chart_data(self, question, reflections, start_date, days):
-        """Generate line chart data for range questions"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            range_response__isnull=False
-        ).select_related('daily_reflection')
-        
-        # Create date-indexed data
-        data_points = []
-        current_date = start_date
-        end_date = timezone.now().date()
+    def _dashboard_questions(self, user, question_id):
+        """All active questions or a specific question of the user"""
+        if question_id:
+            question = get_question(user, question_id, active_only=True)
+            return [question] if question else []
+        return get_active_questions(user)
+    
+    def _dashboard_overview(self, user, days, start_date, end_date):
+        reflections = SelfReflection.objects.filter(user=user, date__gte=start_date)
+        return {
+            'total_reflections': reflections.count(),
+            'days_analyzed': days,
+            'current_streak': self._calculate_streak(user),
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        }
+    
+    def _build_dashboard_stats(self, user, days, end_date, question_id, metrics, response_format='rows',
+                               max_points=None, downsample='lttb'):
+        """Compute the payload of the dashboard_stats endpoint"""
+        start_date = end_date - timedelta(days=days)
+        questions = self._dashboard_questions(user, question_id)
+        overview = self._dashboard_overview(user, days, start_date, end_date)
+        
+        # All questions are built from a single fetch of the window's responses
+        if response_format == 'columnar':
+            return {
+                'format': 'columnar',
+                'overview': overview,
+                **build_columnar_dashboard(user, questions, start_date, end_date, metrics=metrics)
+            }
         
-        # Group responses by date
-        response_by_date = {}
-        for response in responses:
-            response_by_date[response.daily_reflection.date] = response.range_response
-        
-        while current_date <= end_date:
-            value = response_by_date.get(current_date)
-            data_points.append({
-                'date': current_date.isoformat(),
-                'value': value,
-                'color': question.color_mapping.get(str(value)) if value and question.color_mapping else None
-            })
-            current_date += timedelta(days=1)
-        
-        # Calculate statistics
-        values = [r.range_response for r in responses]
-        stats = {
-            'average': round(sum(values) / len(values), 2) if values else None,
-            'min': min(values) if values else None,
-            'max': max(values) if values else None,
-            'count': len(values)
+        return {
+            'overview': overview,
+            'questions': build_dashboard_questions(
+                user, questions, start_date, end_date, metrics=metrics,
+                max_points=max_points, downsample=downsample
+            )
         }
+    
+    def _build_dashboard_delta(self, user, days, end_date, question_id, since):
+        """
+        Compute the dashboard changes since a previous fetch: line chart points
+        and heatmap entries of the changed days only, with refreshed
+        statistics, distributions and overview.
+        """
+        start_date = end_date - timedelta(days=days)
+        version = make_delta_token(user.pk)
+        structure_version, since_at = parse_delta_token(since)
         
+        dates, questions = build_dashboard_delta(
+            user, self._dashboard_questions(user, question_id), start_date, end_date, since_at
+        )
         return {
-            'data': data_points,
-            'statistics': stats
+            'delta': True,
+            'since': since,
+            'version': version,
+            'changed_dates': [date.isoformat() for date in dates],
+            'overview': self._dashboard_overview(user, days, start_date, end_date),
+            'questions': questions,
         }
     
-    def _get_range_heatmap_data(self, question, reflections, start_date, days):
-        """Generate calendar heatmap data for range questions"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            range_response__isnull=False
-        ).select_related('daily_reflection')
-        
-        heatmap_data = []
-        for response in responses:
-            value = response.range_response
-            heatmap_data.append({
-                'date': response.daily_reflection.date.isoformat(),
-                'value': value,
-                'color': question.color_mapping.get(str(value)) if question.color_mapping else None,
-                'intensity': (value - question.min_value) / (question.max_value - question.min_value)
-            })
-        
-        return heatmap_data
-    
-    def _get_range_distribution(self, question, reflections):
-        """Get distribution of values for range questions"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            range_response__isnull=False
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        """
+        Get a year long calendar heatmap of one range or choice question.
+        
+        'values' holds one byte per day of the year starting at January 1st,
+        base64 encoded: 0 means no answer, otherwise the range value or the
+        1-based position of the choice in 'choices'. Colors come once in
+        'color_mapping'.
+        
+        Query params:
+        - question_id: ID of the question (required)
+        - year: Calendar year (default: current year)
+        """
+        question_id = request.query_params.get('question_id', None)
+        try:
+            question_id = int(question_id)
+            year = int(request.query_params.get('year', timezone.now().year))
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': 'question_id is required and question_id and year must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not MINYEAR <= year <= MAXYEAR:
+            return Response({'detail': 'Invalid year'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        question = get_question(request.user, question_id)
+        if question is None:
+            return Response({'detail': 'Question not found'}, status=status.HTTP_404_NOT_FOUND)
+        if question.question_type not in PACKED_HEATMAP_TYPES:
+            return Response(
+                {'detail': f'Heatmaps are only available for {" and ".join(PACKED_HEATMAP_TYPES)} questions'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        heatmap_data = cached_payload(
+            'heatmap',
+            request.user.pk,
+            {'question_id': question_id, 'year': year},
+            lambda: packed_year_heatmap(request.user, question, year)
         )
+        return Response(heatmap_data)
+    
+    @action(detail=False, methods=['get'])
+    def insights(self, request):
+        """
+        Get weekday, seasonality and anomaly insights for range and number questions.
         
-        # Count occurrences of each value
-        distribution = {}
-        for value in range(question.min_value, question.max_value + 1):
-            count = responses.filter(range_response=value).count()
-            distribution[str(value)] = {
-                'count': count,
-                'percentage': 0,
-                'color': question.color_mapping.get(str(value)) if question.color_mapping else None
-            }
+        Per question: mean answer per weekday (Monday first), month-of-year
+        effect as the difference to the overall mean (January first), the
+        mean of the last RECENT_DAYS days against all earlier days, and the
+        recent answers whose z-score against those earlier days reaches
+        ANOMALY_Z_SCORE.
         
-        # Calculate percentages
-        total = responses.count()
-        if total > 0:
-            for value_str in distribution:
-                distribution[value_str]['percentage'] = round(
-                    (distribution[value_str]['count'] / total) * 100, 1
-                )
-        
-        return distribution
-    
-    def _get_choice_line_chart_data(self, question, reflections, start_date, days):
-        """Generate line chart data for choice questions (choice frequency over time)"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            choice_response__isnull=False
-        ).select_related('daily_reflection')
-        
-        # Group by choice and date
-        choice_data = defaultdict(list)
-        current_date = start_date
+        Query params:
+        - days: Number of days to analyze (default: 365, at most MAX_DASHBOARD_DAYS)
+        """
+        try:
+            days = parse_days(request.query_params.get('days'), 365)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         end_date = timezone.now().date()
         
-        # Initialize all choices
-        for choice in question.choices:
-            choice_data[choice] = []
-        
-        # Collect responses
-        response_by_date = {}
-        for response in responses:
-            response_by_date[response.daily_reflection.date] = response.choice_response
-        
-        # Create time series for each choice
-        while current_date <= end_date:
-            selected_choice = response_by_date.get(current_date)
-            for choice in question.choices:
-                choice_data[choice].append({
-                    'date': current_date.isoformat(),
-                    'selected': choice == selected_choice,
-                    'value': 1 if choice == selected_choice else 0
-                })
-            current_date += timedelta(days=1)
-        
-        # Format for output
-        datasets = []
-        for choice in question.choices:
-            datasets.append({
-                'label': choice,
-                'color': question.color_mapping.get(choice) if question.color_mapping else None,
-                'data': choice_data[choice]
-            })
+        insight_data = cached_payload(
+            'insights',
+            request.user.pk,
+            insights_cache_params(days, end_date),
+            lambda: self._build_insights(request.user, days, end_date)
+        )
+        return Response(insight_data)
+    
+    def _build_insights(self, user, days, end_date):
+        """Compute all insights from one aligned response matrix"""
+        start_date = end_date - timedelta(days=days)
+        questions = numeric_questions(get_active_questions(user))
+        matrix = load_response_matrix(user, questions, start_date, end_date)
+        question_insights = compute_insights(matrix)
         
         return {
-            'datasets': datasets,
-            'total_responses': responses.count()
+            'days_analyzed': days,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'recent_days': RECENT_DAYS,
+            'anomaly_z_score': ANOMALY_Z_SCORE,
+            'questions': [
+                {
+                    'question_id': question.id,
+                    'question_text': question.question_text,
+                    'question_type': question.question_type,
+                    **question_insights[question.id]
+                }
+                for question in questions
+            ]
         }
     
-    def _get_choice_distribution(self, question, reflections):
-        """Get distribution of choices for choice questions"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            choice_response__isnull=False
+    @action(detail=False, methods=['get'])
+    def correlations(self, request):
+        """
+        Get correlations between the user's range and number questions.
+        
+        Returns Pearson and Spearman correlation matrices plus next-day
+        (lagged) correlations, where row i / column j relates question i on
+        one day to question j on the following day.
+        
+        Query params:
+        - days: Number of days to analyze (default: 90, at most MAX_DASHBOARD_DAYS)
+        """
+        try:
+            days = parse_days(request.query_params.get('days'), 90)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        end_date = timezone.now().date()
+        
+        correlation_data = cached_payload(
+            'correlations',
+            request.user.pk,
+            {'days': days, 'end_date': end_date},
+            lambda: self._build_correlations(request.user, days, end_date)
         )
+        return Response(correlation_data)
+    
+    def _build_correlations(self, user, days, end_date):
+        """Compute the correlation matrices from one aligned response matrix"""
+        start_date = end_date - timedelta(days=days)
+        questions = numeric_questions(get_active_questions(user))
+        matrix = load_response_matrix(user, questions, start_date, end_date)
         
-        distribution = {}
-        total = responses.count()
+        return {
+            'days_analyzed': days,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'min_samples': MIN_CORRELATION_SAMPLES,
+            'questions': [
+                {
+                    'question_id': question.id,
+                    'question_text': question.question_text,
+                    'question_type': question.question_type,
+                }
+                for question in questions
+            ],
+            **correlation_matrices(matrix)
+        }
+    
+    @action(detail=False, methods=['get'])
+    def tag_correlations(self, request):
+        """
+        Get how diary tags relate to the user's range and number answers.
         
-        for choice in question.choices:
-            count = responses.filter(choice_response=choice).count()
-            distribution[choice] = {
-                'count': count,
-                'percentage': round((count / total) * 100, 1) if total > 0 else 0,
-                'color': question.color_mapping.get(choice) if question.color_mapping else None
-            }
+        For every tag and question: the mean answer on days with an entry
+        carrying the tag against all other days, their difference and the
+        effect size (Cohen's d). Entries count on their local creation date.
+        Pairs with fewer than MIN_TAG_SAMPLES answered days on either side
+        are left out; the rest come largest absolute effect size first.
         
-        return distribution
-
-    def _get_number_line_chart_data(self, question, reflections, start_date, days):
-        """Generate line chart data for number questions"""
-        responses = ReflectionResponse.objects.filter(
-            daily_reflection__in=reflections,
-            question=question,
-            number_response__isnull=False
-        ).select_related('daily_reflection')
-        
-        # Create date-indexed data
-        data_points = []
-        current_date = start_date
+        Query params:
+        - days: Number of days to analyze (default: 90, at most MAX_DASHBOARD_DAYS)
+        """
+        try:
+            days = parse_days(request.query_params.get('days'), 90)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         end_date = timezone.now().date()
         
-        # Group responses by date
-        response_by_date = {}
-        for response in responses:
-            response_by_date[response.daily_reflection.date] = response.number_response
-        
-        while current_date <= end_date:
-            value = response_by_date.get(current_date)
-            data_points.append({
-                'date': current_date.isoformat(),
-                'value': round(value, 2) if value is not None else None,
-            })
-            current_date += timedelta(days=1)
-        
-        # Calculate statistics
-        values = [r.number_response for r in responses]
-        stats = {
-            'average': round(sum(values) / len(values), 2) if values else None,
-            'min': round(min(values), 2) if values else None,
-            'max': round(max(values), 2) if values else None,
-            'count': len(values)
-        }
+        tag_data = cached_payload(
+            'tag_correlations',
+            request.user.pk,
+            {'days': days, 'end_date': end_date, 'diary': get_diary_version(request.user.pk)},
+            lambda: self._build_tag_correlations(request.user, days, end_date)
+        )
+        return Response(tag_data)
+    
+    def _build_tag_correlations(self, user, days, end_date):
+        """Compute the tag effects from the response matrix and the tagged days"""
+        start_date = end_date - timedelta(days=days)
+        questions = numeric_questions(get_active_questions(user))
+        matrix = load_response_matrix(user, questions, start_date, end_date)
+        tags, tagged = load_tag_days(user, start_date, end_date)
         
         return {
-            'data': data_points,
-            'statistics': stats
+            'days_analyzed': days,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'min_samples': MIN_TAG_SAMPLES,
+            'questions': [
+                {
+                    'question_id': question.id,
+                    'question_text': question.question_text,
+                    'question_type': question.question_type,
+                }
+                for question in questions
+            ],
+            'tags': [
+                {'tag_id': tag_id, 'name': name, 'days': int(days_tagged)}
+                for (tag_id, name), days_tagged in zip(tags, tagged.sum(axis=0))
+            ],
+            'effects': compute_tag_effects(matrix, [tag_id for tag_id, _ in tags], tagged),
         }
@@ -0,0 +1,138 @@
+"""
+Bulk write path for daily reflections and their responses.
+
+Any number of reflections is saved in one transaction with a fixed number of
+statements: missing SelfReflection rows are inserted with one bulk_create that
+skips days a concurrent save inserted first, all referenced rows are then
+locked and loaded in one query, and all responses are upserted with one
+INSERT ... ON CONFLICT DO UPDATE. Because bulk operations bypass model
+signals, the streak, rollups and cache version are updated explicitly.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_data_version_on_commit
+from .models import SelfReflection, ReflectionResponse
+from .rollups import apply_response_changes
+from .streaks import record_reflection_dates
+
+RESPONSE_FIELDS = ('range_response', 'choice_code', 'text_response', 'number_response')
+
+
+def _stored_values(question, response_data):
+    """Validated response data as column values, with the choice label turned into its code"""
+    values = dict(response_data)
+    label = values.pop('choice_response', None)
+    values['choice_code'] = question.get_choice_code(label) if label else None
+    # None values never overwrite an earlier answer
+    return {
+        field: values[field]
+        for field in RESPONSE_FIELDS
+        if values.get(field) is not None
+    }
+
+
+def _merge_items(reflections_data):
+    """Merge items sharing a date in order, like saving them one after another would"""
+    merged = {}
+    for item in reflections_data:
+        entry = merged.setdefault(item['date'], {'notes': '', 'responses': {}})
+        entry['notes'] = item.get('notes', '')
+        for response_data in item.get('responses', []):
+            question = response_data['question']
+            values = _stored_values(question, response_data)
+            previous = entry['responses'].get(question.id)
+            if previous is not None:
+                values = {**previous[1], **values}
+            entry['responses'][question.id] = (question, values)
+    return merged
+
+
+def bulk_save_reflections(user, reflections_data):
+    """
+    Create or update reflections of `user` with their responses.
+
+    `reflections_data` is a list of validated SelfReflectionCreateUpdateSerializer
+    items: {'date', 'notes' (optional), 'responses': [{..., 'question'}]}.
+    Returns the saved SelfReflection instances in the order of their dates'
+    first appearance.
+    """
+    merged = _merge_items(reflections_data)
+    if not merged:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        known = set(SelfReflection.objects.filter(
+            user=user, date__in=list(merged)
+        ).values_list('date', flat=True))
+        new_dates = [date for date in merged if date not in known]
+        if new_dates:
+            # Locking rows that do not exist yet locks nothing, so the new days
+            # are inserted first; a day a concurrent save inserted meanwhile is
+            # skipped here and updated below like any existing one
+            SelfReflection.objects.bulk_create([
+                SelfReflection(user=user, date=date, notes=merged[date]['notes'], created_at=now)
+                for date in new_dates
+            ], ignore_conflicts=True)
+
+        reflections = {
+            reflection.date: reflection
+            for reflection in SelfReflection.objects.select_for_update().filter(
+                user=user, date__in=list(merged)
+            )
+        }
+
+        outdated = [
+            reflection for reflection in reflections.values()
+            if reflection.date in known or reflection.notes != merged[reflection.date]['notes']
+        ]
+        for reflection in outdated:
+            reflection.notes = merged[reflection.date]['notes']
+            reflection.updated_at = now
+        if outdated:
+            SelfReflection.objects.bulk_update(outdated, ['notes', 'updated_at'])
+
+        # Days inserted by a concurrent save may already have responses
+        previous = {}
+        rows = ReflectionResponse.objects.filter(
+            daily_reflection__in=list(reflections.values())
+        ).values_list('daily_reflection_id', 'question_id', *RESPONSE_FIELDS)
+        for reflection_id, question_id, *answer in rows:
+            previous[(reflection_id, question_id)] = dict(zip(RESPONSE_FIELDS, answer))
+
+        responses, changes = [], []
+        for date, entry in merged.items():
+            reflection = reflections[date]
+            for question_id, (question, values) in entry['responses'].items():
+                old = previous.get((reflection.pk, question_id))
+                answer = {**(old or {}), **values}
+                responses.append(ReflectionResponse(
+                    daily_reflection=reflection,
+                    question=question,
+                    created_at=now,
+                    **{field: answer.get(field) for field in RESPONSE_FIELDS}
+                ))
+                changes.append((
+                    question_id,
+                    question.question_type,
+                    date,
+                    (old['range_response'], old['choice_code'], old['number_response']) if old else None,
+                    (answer.get('range_response'), answer.get('choice_code'), answer.get('number_response')),
+                ))
+
+        if responses:
+            ReflectionResponse.objects.bulk_create(
+                responses,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['daily_reflection', 'question'],
+                update_fields=[*RESPONSE_FIELDS, 'updated_at'],
+            )
+
+        apply_response_changes(user.pk, changes)
+        if new_dates:
+            record_reflection_dates(user.pk, new_dates)
+        bump_data_version_on_commit(user.pk)
+
+    return [reflections[date] for date in merged]
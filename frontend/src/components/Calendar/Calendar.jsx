@@ -11,15 +11,14 @@ const Calendar = () => {
   const { accessToken, logout } = useAuth();
   const navigate = useNavigate();
   const [currentDate, setCurrentDate] = useState(new Date());
-  const [entries, setEntries] = useState([]);
   const [entriesByDate, setEntriesByDate] = useState({});
   const [loading, setLoading] = useState(true);
 
-  // Fetch entries for the current month
+  // Fetch the per-day entry summary of the current month
   const fetchMonthEntries = async (year, month) => {
     try {
       setLoading(true);
-      const response = await fetch(`${API_BASE_URL}/entries/`, {
+      const response = await fetch(`${API_BASE_URL}/calendar/?year=${year}&month=${month + 1}`, {
         headers: {
           'Authorization': `Bearer ${accessToken}`
         }
@@ -27,22 +26,8 @@ const Calendar = () => {
       
       if (response.ok) {
         const data = await response.json();
-        const allEntries = data.results || data;
-        
-        // Group entries by date
-        const grouped = {};
-        allEntries.forEach(entry => {
-          const entryDate = new Date(entry.created_at);
-          const dateKey = entryDate.toISOString().split('T')[0];
-          
-          if (!grouped[dateKey]) {
-            grouped[dateKey] = [];
-          }
-          grouped[dateKey].push(entry);
-        });
-        
-        setEntriesByDate(grouped);
-        setEntries(allEntries);
+        // Days are keyed by their YYYY-MM-DD date
+        setEntriesByDate(data.days);
       } else if (response.status === 401) {
         logout();
       }
@@ -100,22 +85,20 @@ const Calendar = () => {
     navigate(`/diary/${dateString}`);
   };
 
+  // Date key of a day of the current month, as used by the calendar endpoint
+  const getDateKey = (day) => {
+    const month = String(currentDate.getMonth() + 1).padStart(2, '0');
+    return `${currentDate.getFullYear()}-${month}-${String(day).padStart(2, '0')}`;
+  };
+
   // Check if date has entries
   const hasEntries = (day) => {
-    const year = currentDate.getFullYear();
-    const month = currentDate.getMonth();
-    const date = new Date(year, month, day);
-    const dateString = date.toISOString().split('T')[0];
-    return entriesByDate[dateString] && entriesByDate[dateString].length > 0;
+    return getEntryCount(day) > 0;
   };
 
   // Get entry count for a date
   const getEntryCount = (day) => {
-    const year = currentDate.getFullYear();
-    const month = currentDate.getMonth();
-    const date = new Date(year, month, day);
-    const dateString = date.toISOString().split('T')[0];
-    return entriesByDate[dateString]?.length || 0;
+    return entriesByDate[getDateKey(day)]?.count || 0;
   };
 
   // Check if day is today